@@ -0,0 +1,121 @@
+import itertools
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class DbCallSignals(QObject):
+    """Сигналы, через которые рабочий поток возвращает результат в поток интерфейса"""
+    finished = pyqtSignal(str, int, object)     # канал, id запроса, результат
+    failed = pyqtSignal(str, int, str)          # канал, id запроса, текст ошибки
+
+
+class DbCall(QRunnable):
+    """Задача пула потоков: один вызов функции DataBase"""
+
+    def __init__(self, signals, channel, request_id, func, args, kwargs):
+        super().__init__()
+        self.signals = signals
+        self.channel = channel
+        self.request_id = request_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(self.channel, self.request_id, str(e))
+        else:
+            self.signals.finished.emit(self.channel, self.request_id, result)
+
+
+class AsyncDataBase(QObject):
+    """Неблокирующий фасад над DataBase: вызовы выполняются в пуле потоков QThreadPool
+
+    Каждый запрос отправляется в именованный канал ("recipes", "profile", "cart"...)
+    и получает возрастающий id. Результат возвращается в поток интерфейса сигналом
+    result_ready и обработчиком on_result; в канале действует только последний запрос,
+    поэтому ответы на запросы, замененные более новыми или отмененные, отбрасываются.
+    """
+
+    # Сколько запросов к БД выполняется одновременно
+    MAX_THREADS = 2
+
+    result_ready = pyqtSignal(str, int, object)     # канал, id запроса, результат
+    request_failed = pyqtSignal(str, int, str)      # канал, id запроса, текст ошибки
+
+    def __init__(self, db, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads or self.MAX_THREADS)
+
+        self._request_ids = itertools.count(1)
+        self._latest = {}       # канал -> id последнего запроса
+        self._handlers = {}     # id запроса -> (on_result, on_error)
+        self.dropped = 0        # число отброшенных устаревших ответов
+
+        # Сигналы испускаются в рабочих потоках и доставляются сюда очередью событий
+        self._signals = DbCallSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def submit(self, channel, func, *args, on_result=None, on_error=None, **kwargs):
+        """Выполняет func(*args, **kwargs) в пуле потоков и возвращает id запроса
+
+        Предыдущий незавершенный запрос канала становится устаревшим: его ответ
+        будет отброшен. on_result(result) и on_error(message) вызываются в потоке
+        интерфейса только для актуального запроса.
+        """
+        request_id = next(self._request_ids)
+        self._latest[channel] = request_id
+        self._handlers[request_id] = (on_result, on_error)
+        self.pool.start(DbCall(self._signals, channel, request_id, func, args, kwargs))
+        return request_id
+
+    def call(self, channel, method_name, *args, on_result=None, on_error=None, **kwargs):
+        """Асинхронно вызывает метод DataBase по имени (см. submit)"""
+        return self.submit(channel, getattr(self.db, method_name), *args,
+                           on_result=on_result, on_error=on_error, **kwargs)
+
+    def cancel(self, channel):
+        """Отменяет ожидание ответа канала (сам запрос к БД дорабатывает в фоне)"""
+        self._latest.pop(channel, None)
+
+    def is_pending(self, channel):
+        """Ожидает ли канал ответа"""
+        return channel in self._latest
+
+    def wait_for_done(self, msecs=-1):
+        """Дожидается завершения всех запущенных запросов (для выхода из приложения)"""
+        return self.pool.waitForDone(msecs)
+
+    def _take_handlers(self, channel, request_id):
+        """Возвращает обработчики актуального запроса или None для устаревшего"""
+        handlers = self._handlers.pop(request_id, None)
+        if handlers is None or self._latest.get(channel) != request_id:
+            self.dropped += 1
+            return None
+        del self._latest[channel]
+        return handlers
+
+    def _on_finished(self, channel, request_id, result):
+        handlers = self._take_handlers(channel, request_id)
+        if handlers is None:
+            return
+        self.result_ready.emit(channel, request_id, result)
+        if handlers[0] is not None:
+            try:
+                handlers[0](result)
+            except Exception as e:
+                print(f"Ошибка обработки ответа БД ({channel}): {e}")
+
+    def _on_failed(self, channel, request_id, message):
+        handlers = self._take_handlers(channel, request_id)
+        if handlers is None:
+            return
+        print(f"Ошибка запроса к БД ({channel}): {message}")
+        self.request_failed.emit(channel, request_id, message)
+        if handlers[1] is not None:
+            handlers[1](message)
@@ -0,0 +1,132 @@
+"""Замеры производительности слоя базы данных.
+
+Запуск из каталога src:
+    python benchmark.py            # сравнение профилей движка SQLite по задержке записи
+                                   # (профиль "default" - настройки SQLite по умолчанию)
+    python benchmark.py -n 500     # количество операций на профиль
+    python benchmark.py index      # построение и запросы индекса ингредиентов на 100k рецептов
+    python benchmark.py index --recipes 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from database import DataBase, ENGINE_PROFILES, IngredientIndex
+
+
+# Профиль с настройками SQLite по умолчанию, с которым сравниваются остальные
+BASELINE_PROFILE = 'default'
+
+
+def _timed(operation, count):
+    """Выполняет операцию count раз и возвращает список длительностей в миллисекундах"""
+    durations = []
+    for i in range(count):
+        started = time.perf_counter()
+        operation(i)
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def _summary(durations):
+    """Возвращает строку со средним, медианой и 95-м перцентилем"""
+    ordered = sorted(durations)
+    p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) > 1 else ordered[0]
+    return (f"среднее {statistics.mean(ordered):7.3f} мс, "
+            f"медиана {statistics.median(ordered):7.3f} мс, p95 {p95:7.3f} мс")
+
+
+def _speedup(durations, baseline):
+    """Возвращает строку с ускорением средней задержки относительно базового профиля"""
+    if not baseline or durations is baseline:
+        return ""
+    return f", x{statistics.mean(baseline) / statistics.mean(durations):.1f} к {BASELINE_PROFILE}"
+
+
+def benchmark_write_latency(count=200):
+    """Сравнивает задержку коммитов toggle_favorite и add_cart_item для каждого профиля движка"""
+    results = {}
+    for profile in ENGINE_PROFILES:
+        work_dir = tempfile.mkdtemp(prefix=f"taste_puzzle_{profile}_")
+        try:
+            db = DataBase(db_path=os.path.join(work_dir, 'bench.db'), profile=profile)
+            db.register_user('benchmark', 'benchmark')
+            user_id = db.get_users('benchmark', 'benchmark')[0][0]
+
+            favorites = _timed(lambda i: db.toggle_favorite(user_id, i % 50 + 1), count)
+            cart = _timed(lambda i: db.add_cart_item(user_id, f"Ингредиент {i % 30}", 1, 'г'), count)
+
+            results[profile] = (favorites, cart)
+            db.engine.dispose()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Задержка записи, {count} операций на профиль")
+    baseline = results.get(BASELINE_PROFILE)
+    for profile, (favorites, cart) in results.items():
+        print(f"[{profile}]")
+        print(f"  toggle_favorite: {_summary(favorites)}{_speedup(favorites, baseline and baseline[0])}")
+        print(f"  add_cart_item:   {_summary(cart)}{_speedup(cart, baseline and baseline[1])}")
+
+    return results
+
+
+def benchmark_ingredient_index(recipe_count=100000, ingredient_count=2000, per_recipe=8, count=200):
+    """Замеряет построение индекса ингредиентов и запросы к нему на синтетическом каталоге
+
+    Частота ингредиентов убывает по закону Ципфа: несколько ингредиентов есть почти
+    в каждом рецепте (плотные битовые карты), большинство - в немногих (массивы id).
+    """
+    rng = random.Random(1)
+    ingredient_ids = list(range(1, ingredient_count + 1))
+    weights = [1.0 / ingredient_id for ingredient_id in ingredient_ids]
+    pairs = [
+        (recipe_id, ingredient_id)
+        for recipe_id in range(1, recipe_count + 1)
+        for ingredient_id in set(rng.choices(ingredient_ids, weights=weights, k=per_recipe))
+    ]
+    ingredients = [(ingredient_id, f"ингредиент-{ingredient_id}-") for ingredient_id in ingredient_ids]
+
+    index = IngredientIndex()
+    started = time.perf_counter()
+    index.build(pairs, ingredients)
+    build_seconds = time.perf_counter() - started
+
+    print(f"Индекс ингредиентов: {recipe_count} рецептов, {len(pairs)} связей, {ingredient_count} ингредиентов")
+    print(f"  построение: {build_seconds:.2f} с, контейнеры: {index.memory_usage() / 1024 / 1024:.1f} МБ")
+
+    queries = [
+        ("частый", ["-1-"]),
+        ("средний", ["-50-"]),
+        ("редкий", ["-1500-"]),
+        ("все из 3", ["-1-", "-2-", "-3-"]),
+        ("все из 2", ["-2-", "-700-"]),
+    ]
+    results = {}
+    for title, names in queries:
+        durations = _timed(lambda i: index.recipes_with_all(names), count)
+        results[title] = durations
+        print(f"  {title:10}: {_summary(durations)}")
+    durations = _timed(lambda i: index.recipes_with_any(["-5-", "-60-", "-1200-"]), count)
+    results["любой из 3"] = durations
+    print(f"  {'любой из 3':10}: {_summary(durations)}")
+
+    return build_seconds, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности БД «Пазл Вкусов»")
+    parser.add_argument('benchmark', nargs='?', choices=('write', 'index'), default='write',
+                        help="write - задержка записи профилей движка, index - индекс ингредиентов")
+    parser.add_argument('-n', '--count', type=int, default=200, help="количество операций на замер")
+    parser.add_argument('--recipes', type=int, default=100000, help="рецептов в каталоге для замера индекса")
+    args = parser.parse_args()
+
+    if args.benchmark == 'index':
+        benchmark_ingredient_index(args.recipes, count=args.count)
+    else:
+        benchmark_write_latency(args.count)
@@ -0,0 +1,319 @@
+"""Резервное копирование и перенос каталога «Пазл Вкусов» в формате JSON Lines.
+
+Запуск из каталога src:
+    python catalog_backup.py export catalog.jsonl.gz      # выгрузка всего каталога (.gz - со сжатием)
+    python catalog_backup.py import catalog.jsonl.gz      # загрузка выгрузки в текущую БД
+    python catalog_backup.py export backup.jsonl --db ../data/other.db
+
+Каждая строка файла - объект с полем "type":
+    header   - формат и версия схемы исходной БД, всегда первая строка
+    user     - пользователь (id, login, password)
+    recipe   - рецепт с ингредиентами, КБЖУ, автором (user_id) и ссылкой на изображение
+    favorite - рецепт в избранном пользователя (user_id, recipe_id)
+    cooked   - отметка о приготовлении (user_id, recipe_id, cooked_at)
+id в файле - это id исходной БД; при загрузке пользователи сопоставляются по логину,
+рецепты получают новые id, избранное и история приготовления переводятся на них.
+Рецепт без автора (user_id null) загружается без автора; --user-id заменяет только
+автора, которого нет среди пользователей выгрузки, и автора рецептов без автора,
+если в текущей БД столбец Recipes.user_id объявлен NOT NULL. Без --user-id такая
+выгрузка не загружается: импорт останавливается с номером строки.
+Выгрузка и загрузка идут потоком: память не зависит от размера каталога.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import (DataBase, User, Recipe, Ingredient, Nutrition, Dish_types, Cuisines,
+                      CookedRecipe, recipe_ingredients, favorites, format_amount)
+from recipe_importer import RecipeImporter, DEFAULT_BATCH_SIZE, open_text
+
+# ===== ФОРМАТ ФАЙЛА =====
+CATALOG_FORMAT = 'taste-puzzle-catalog'
+CATALOG_FORMAT_VERSION = 1
+
+# Строк, которые курсор выгрузки забирает из SQLite за один раз
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _iso(value):
+    """Дата в формате ISO или None"""
+    return value.isoformat() if value else None
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+# ===== ВЫГРУЗКА =====
+def _stream(connection, statement, chunk_size):
+    """Построчно читает результат запроса серверным курсором (yield_per)"""
+    return connection.execution_options(yield_per=chunk_size).execute(statement)
+
+
+def _recipe_ingredients(connection, chunk_size):
+    """Генератор (recipe_id, [ингредиенты]) по всем рецептам в порядке id"""
+    statement = (
+        select(recipe_ingredients.c.recipe_id, Ingredient.name, recipe_ingredients.c.quantity,
+               recipe_ingredients.c.amount, recipe_ingredients.c.unit)
+        .join(Ingredient, Ingredient.id == recipe_ingredients.c.ingredient_id)
+        .order_by(recipe_ingredients.c.recipe_id)
+    )
+    current_id, items = None, []
+    for row in _stream(connection, statement, chunk_size):
+        if row.recipe_id != current_id:
+            if current_id is not None:
+                yield current_id, items
+            current_id, items = row.recipe_id, []
+        # Числовое количество выгружается без единицы: импорт соберет ту же запись
+        quantity = format_amount(row.amount) if row.amount is not None else row.quantity
+        items.append([row.name, quantity, row.unit or ''])
+    if current_id is not None:
+        yield current_id, items
+
+
+def iter_catalog(db, chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор строк выгрузки каталога (словари с полем "type")
+
+    Все запросы идут в одной читающей транзакции, поэтому выгрузка согласована
+    даже при параллельной записи. Рецепты и их ингредиенты читаются двумя курсорами
+    в порядке id рецепта и сливаются на лету, не накапливаясь в памяти.
+    """
+    with db.engine.connect() as connection:
+        # pysqlite не открывает транзакцию перед SELECT: без нее курсоры видели бы разные снимки БД
+        connection.exec_driver_sql('BEGIN')
+        try:
+            yield {
+                'type': 'header',
+                'format': CATALOG_FORMAT,
+                'version': CATALOG_FORMAT_VERSION,
+                'schema_version': db.get_schema_version(),
+                'exported_at': datetime.now().isoformat(timespec='seconds'),
+            }
+
+            users = select(User.id, User.login, User.password).order_by(User.id)
+            for row in _stream(connection, users, chunk_size):
+                yield {'type': 'user', 'id': row.id, 'login': row.login, 'password': row.password}
+
+            recipes = (
+                select(Recipe.id, Recipe.user_id, Recipe.name, Recipe.instruction, Recipe.description,
+                       Dish_types.name.label('dish_type'), Cuisines.name.label('cuisine'),
+                       Recipe.cook_time, Recipe.servings, Recipe.external_url, Recipe.image,
+                       Recipe.created_at, Nutrition.calories, Nutrition.proteins, Nutrition.fats,
+                       Nutrition.carbohydrates)
+                .outerjoin(Dish_types, Dish_types.id == Recipe.dish_type_id)
+                .outerjoin(Cuisines, Cuisines.id == Recipe.cuisine_id)
+                .outerjoin(Nutrition, Nutrition.recipe_id == Recipe.id)
+                .order_by(Recipe.id)
+            )
+            ingredients = _recipe_ingredients(connection, chunk_size)
+            pending = next(ingredients, None)
+            for row in _stream(connection, recipes, chunk_size):
+                # Пропускаем строки ингредиентов без рецепта
+                while pending is not None and pending[0] < row.id:
+                    pending = next(ingredients, None)
+                items = []
+                if pending is not None and pending[0] == row.id:
+                    items = pending[1]
+                    pending = next(ingredients, None)
+                yield {
+                    'type': 'recipe',
+                    'id': row.id,
+                    'user_id': row.user_id,
+                    'name': row.name,
+                    'instruction': row.instruction,
+                    'description': row.description,
+                    'dish_type': row.dish_type,
+                    'cuisine': row.cuisine,
+                    'cook_time': row.cook_time,
+                    'servings': row.servings,
+                    'external_url': row.external_url,
+                    'image': row.image,
+                    'created_at': _iso(row.created_at),
+                    'calories': row.calories,
+                    'proteins': row.proteins,
+                    'fats': row.fats,
+                    'carbohydrates': row.carbohydrates,
+                    'ingredients': items,
+                }
+
+            favorite_rows = select(favorites.c.user_id, favorites.c.recipe_id).order_by(
+                favorites.c.user_id, favorites.c.recipe_id)
+            for row in _stream(connection, favorite_rows, chunk_size):
+                yield {'type': 'favorite', 'user_id': row.user_id, 'recipe_id': row.recipe_id}
+
+            cooked_rows = select(CookedRecipe.user_id, CookedRecipe.recipe_id, CookedRecipe.cooked_at).order_by(
+                CookedRecipe.user_id, CookedRecipe.recipe_id)
+            for row in _stream(connection, cooked_rows, chunk_size):
+                yield {'type': 'cooked', 'user_id': row.user_id, 'recipe_id': row.recipe_id,
+                       'cooked_at': _iso(row.cooked_at)}
+        finally:
+            connection.rollback()
+
+
+def export_catalog(db, path, chunk_size=EXPORT_CHUNK_SIZE):
+    """Выгружает каталог в файл JSON Lines (.gz - со сжатием) и возвращает число строк по типам"""
+    counts = {}
+    with open_text(path, 'w') as target:
+        for line in iter_catalog(db, chunk_size):
+            counts[line['type']] = counts.get(line['type'], 0) + 1
+            target.write(_dump(line))
+    return counts
+
+
+# ===== ЗАГРУЗКА =====
+class CatalogImporter:
+    """Загрузка выгрузки iter_catalog в БД
+
+    Рецепты передаются RecipeImporter и пишутся его пачками; избранное и история
+    приготовления копятся пачками того же размера и вставляются с пропуском дублей.
+    В памяти держатся только соответствия id исходной БД новым id.
+    """
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, user_id=None, verbose=False):
+        self.db = db
+        self.batch_size = batch_size
+        # user_id - автор в этой БД для рецептов, автор которых не найден в выгрузке;
+        # рецепты без автора восстанавливаются без автора, если БД это допускает
+        self.user_id = user_id
+        self.recipes = RecipeImporter(db, batch_size=batch_size, user_id=user_id, verbose=verbose, restore=True)
+        self.user_ids = {}      # id пользователя в выгрузке -> id в этой БД
+        self.links = {'favorite': [], 'cooked': []}
+        self.stats = {'users': 0, 'new_users': 0, 'favorites': 0, 'cooked': 0, 'skipped_links': 0}
+
+    def run(self, lines):
+        """Загружает пары (номер строки, строка выгрузки) и возвращает статистику"""
+        started = time.perf_counter()
+        try:
+            for number, line in lines:
+                kind = line.get('type')
+                if kind == 'header':
+                    self._check_header(line)
+                elif kind == 'user':
+                    self._add_user(line)
+                elif kind == 'recipe':
+                    if line.get('user_id') is not None:
+                        line['user_id'] = self.user_ids.get(line['user_id'], self.user_id)
+                    self.recipes.add(line, number)
+                elif kind in self.links:
+                    self._add_link(kind, line)
+                else:
+                    print(f"Строка {number}: неизвестный тип записи {kind!r}, пропущена")
+        finally:
+            self._flush_links()
+            self.recipes.finish()
+
+        self.stats.update(self.recipes.stats)
+        self.stats['seconds'] = time.perf_counter() - started
+        return self.stats
+
+    @staticmethod
+    def _check_header(line):
+        if line.get('format') != CATALOG_FORMAT:
+            raise ValueError(f"Файл не является выгрузкой каталога: {line.get('format')!r}")
+        if line.get('version', 0) > CATALOG_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия выгрузки: {line.get('version')}")
+
+    def _add_user(self, line):
+        """Сопоставляет пользователя по логину; отсутствующего создает"""
+        self.stats['users'] += 1
+        with self.db.engine.begin() as connection:
+            user_id = connection.execute(
+                select(User.id).where(User.login == line['login']).order_by(User.id).limit(1)
+            ).scalar()
+            if user_id is None:
+                user_id = connection.execute(
+                    User.__table__.insert().returning(User.id),
+                    {'login': line['login'], 'password': str(line.get('password') or '')}
+                ).scalar()
+                self.stats['new_users'] += 1
+        self.user_ids[line.get('id')] = user_id
+
+    def _add_link(self, kind, line):
+        # Ссылки идут после всех рецептов: оставшиеся рецепты нужно записать, чтобы знать их id
+        self.recipes.flush()
+        user_id = self.user_ids.get(line.get('user_id'))
+        recipe_id = self.recipes.recipe_ids.get(line.get('recipe_id'))
+        if user_id is None or recipe_id is None:
+            self.stats['skipped_links'] += 1
+            return
+        row = {'user_id': user_id, 'recipe_id': recipe_id}
+        if kind == 'cooked':
+            try:
+                row['cooked_at'] = datetime.fromisoformat(line['cooked_at'])
+            except (KeyError, TypeError, ValueError):
+                row['cooked_at'] = datetime.now()
+        self.links[kind].append(row)
+        if len(self.links[kind]) >= self.batch_size:
+            self._flush_links()
+
+    def _flush_links(self):
+        """Вставляет накопленные избранное и историю приготовления, пропуская существующие"""
+        tables = {'favorite': (favorites, 'favorites'), 'cooked': (CookedRecipe.__table__, 'cooked')}
+        for kind, rows in self.links.items():
+            if not rows:
+                continue
+            table, counter = tables[kind]
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+                self.stats[counter] += len(rows)
+            except Exception as e:
+                print(f"Ошибка при загрузке записей {kind}: {e}")
+            self.links[kind] = []
+
+
+def read_catalog(path):
+    """Генератор пар (номер строки, строка) файла выгрузки"""
+    with open_text(path) as source:
+        for number, line in enumerate(source, 1):
+            line = line.strip()
+            if line:
+                yield number, json.loads(line)
+
+
+def import_catalog(db, path, batch_size=DEFAULT_BATCH_SIZE, user_id=None, verbose=False):
+    """Загружает выгрузку каталога из файла и возвращает статистику"""
+    importer = CatalogImporter(db, batch_size=batch_size, user_id=user_id, verbose=verbose)
+    return importer.run(read_catalog(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка каталога «Пазл Вкусов» в JSON Lines")
+    parser.add_argument('command', choices=('export', 'import'), help="выгрузить или загрузить каталог")
+    parser.add_argument('path', help="файл выгрузки (.jsonl или .jsonl.gz)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="строк курсора при выгрузке / рецептов в транзакции при загрузке")
+    parser.add_argument('--user-id', type=int,
+                        help="при загрузке: автор (id в этой БД) для рецептов, автора которых нет в выгрузке")
+    parser.add_argument('--db', default='../data/Taste_Pazzle.db', help="путь к файлу БД")
+    parser.add_argument('-v', '--verbose', action='store_true', help="печатать ход загрузки")
+    args = parser.parse_args()
+
+    if args.command == 'import' and not os.path.exists(args.path):
+        parser.error(f"файл не найден: {args.path}")
+
+    database = DataBase(db_path=args.db)
+    started = time.perf_counter()
+    if args.command == 'export':
+        counts = export_catalog(database, args.path, args.batch_size)
+        print(f"Выгружено: пользователей {counts.get('user', 0)}, рецептов {counts.get('recipe', 0)}, "
+              f"избранное {counts.get('favorite', 0)}, приготовлено {counts.get('cooked', 0)} "
+              f"за {time.perf_counter() - started:.2f} с")
+    else:
+        try:
+            stats = import_catalog(database, args.path, args.batch_size, args.user_id, args.verbose)
+        except ValueError as e:
+            parser.exit(1, f"Загрузка остановлена. {e}\n")
+        print(f"Пользователей: {stats['users']} (новых {stats['new_users']}), "
+              f"рецептов: {stats['recipes']}, строк ингредиентов: {stats['ingredient_rows']}")
+        print(f"Избранное: {stats['favorites']}, приготовлено: {stats['cooked']}, "
+              f"пропущено ссылок: {stats['skipped_links']}, пропущено рецептов: {stats['skipped']}")
+        if stats['dropped_ingredients']:
+            print(f"Повторов ингредиента в рецепте отброшено: {stats['dropped_ingredients']} "
+                  f"(в этой БД их запрещает первичный ключ Recipe_ingredients)")
+        print(f"Время: {stats['seconds']:.2f} с")
@@ -1,9 +1,19 @@
+import hashlib
 import re
 import shutil
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, ForeignKey, Table, text, DateTime, or_
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, ForeignKey, Table, text, DateTime, or_, exists, literal_column, Index, func, tuple_, null, case, and_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import inspect, event, select
 from datetime import datetime
 import os
 
@@ -15,7 +25,9 @@ recipe_ingredients = Table(
     'Recipe_ingredients', Base.metadata,
     Column('recipe_id', Integer, ForeignKey('Recipes.id'), primary_key=True),
     Column('ingredient_id', Integer, ForeignKey('Ingredients.id'), primary_key=True),
-    Column('quantity', Float, nullable=False)
+    Column('quantity', Text, nullable=False),   # исходная запись количества ("2 штуки", "по вкусу")
+    Column('amount', Float),                     # числовое количество
+    Column('unit', String(50))                   # нормализованная единица измерения
 )
 
 favorites = Table(
@@ -32,8 +44,9 @@ class Cart(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('Users.id'), nullable=False)
     ingredient_name = Column(String(200), nullable=False)
-    quantity = Column(String(50), nullable=False)
-    unit = Column(String(50), nullable=False)
+    quantity = Column(String(50), nullable=False)   # текст количества для нечисловых значений ("щепотка")
+    unit = Column(String(50), nullable=False)       # нормализованная единица измерения
+    amount = Column(Float)                          # числовое количество, NULL для нечисловых
     created_at = Column(DateTime, default=datetime.now)
 
     user = relationship("User", back_populates="cart_items")
@@ -90,7 +103,8 @@ class Recipe(Base):
     __tablename__ = 'Recipes'
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('Users.id'), nullable=False)
+    # У рецептов исходного каталога автора нет
+    user_id = Column(Integer, ForeignKey('Users.id'), nullable=True)
     name = Column(String(200), nullable=False)
     instruction = Column(Text)
     description = Column(Text)
@@ -143,42 +157,2111 @@ class Nutrition(Base):
     recipe = relationship("Recipe", back_populates="nutrition")
 
 
-class DataBase:
+# МОДЕЛЬ ВЕРСИИ СХЕМЫ (журнал примененных миграций)
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now)
+
+
+# МОДЕЛЬ СЧЕТЧИКОВ ПОЛЬЗОВАТЕЛЯ (поддерживается триггерами USER_STATS_TRIGGERS)
+class UserStats(Base):
+    __tablename__ = 'user_stats'
+
+    user_id = Column(Integer, ForeignKey('Users.id'), primary_key=True)
+    recipes_count = Column(Integer, nullable=False, default=0, server_default='0')
+    favorites_count = Column(Integer, nullable=False, default=0, server_default='0')
+    cart_count = Column(Integer, nullable=False, default=0, server_default='0')
+    cooked_count = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+# МОДЕЛЬ СЧЕТЧИКА ССЫЛОК НА ФАЙЛ ИЗОБРАЖЕНИЯ (поддерживается триггерами IMAGE_REFS_TRIGGERS)
+class ImageRef(Base):
+    __tablename__ = 'image_refs'
+
+    image = Column(String(500), primary_key=True)   # значение Recipes.image
+    refcount = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+# СТРОКА СПИСКА РЕЦЕПТОВ
+# Порядок полей совпадает с прежним позиционным кортежем, поэтому доступ по индексу
+# (recipe_data[15]) продолжает работать наравне с доступом по имени (recipe_data.is_favorite).
+# Новые поля добавляются только в конец
+RECIPE_ROW_FIELDS = (
+    'id', 'user_id', 'name', 'instruction', 'description', 'dish_type_id', 'image',
+    'external_url', 'cook_time', 'dish_type', 'reserved', 'calories', 'proteins', 'fats',
+    'carbohydrates', 'is_favorite', 'is_cooked', 'cuisine', 'category', 'cuisine_id', 'servings'
+)
+
+
+# ПОРЯДОК КАТЕГОРИЙ В СПИСКЕ РЕЦЕПТОВ
+# Категории, которые показываются первыми и в этом порядке; остальные идут за ними по алфавиту.
+# Рецепты без типа блюда попадают в DEFAULT_DISH_TYPE
+PRIORITY_DISH_TYPES = [
+    "Салаты",
+    "Десерты",
+    "Основные блюда",
+    "Завтраки",
+    "Гарниры",
+    "Супы",
+    "Закуски",
+    "Напитки",
+    "Соусы"
+]
+DEFAULT_DISH_TYPE = "Основные блюда"
+
+
+def dish_type_rank(dish_type):
+    """Ранг категории в списке рецептов: номер приоритетной категории или их число"""
+    if dish_type in PRIORITY_DISH_TYPES:
+        return PRIORITY_DISH_TYPES.index(dish_type)
+    return len(PRIORITY_DISH_TYPES)
+
+
+class RecipeRow(namedtuple('RecipeRow', RECIPE_ROW_FIELDS)):
+    """Неизменяемая строка списка рецептов без __dict__
+
+    В проекции для карточек instruction и description равны None: длинные тексты
+    загружаются отдельно через DataBase.get_recipe_text только при открытии рецепта.
+    """
+    __slots__ = ()
+
+    @property
+    def has_text(self):
+        """Загружены ли в строку инструкция и описание"""
+        return self.instruction is not None or self.description is not None
+
+
+# ВТОРИЧНЫЕ ИНДЕКСЫ ДЛЯ ЧАСТЫХ ЗАПРОСОВ
+# Объявленные индексы создаются create_all для новой БД и ensure_indexes для существующей
+DECLARED_INDEXES = [
+    # Одна позиция корзины на (пользователь, ингредиент, единица) - ключ для upsert в add_cart_items
+    Index('ux_cart_user_ingredient_unit', Cart.user_id, Cart.ingredient_name, Cart.unit, unique=True),
+    # Фильтр "содержит ингредиент": по ingredient_id сразу получаем recipe_id
+    Index('ix_recipe_ingredients_ingredient', recipe_ingredients.c.ingredient_id, recipe_ingredients.c.recipe_id),
+    # Ингредиенты рецепта вместе с количеством без обращения к таблице
+    Index('ix_recipe_ingredients_recipe_amount', recipe_ingredients.c.recipe_id, recipe_ingredients.c.ingredient_id,
+          recipe_ingredients.c.amount, recipe_ingredients.c.unit),
+    # Один рецепт в избранном пользователя не более одного раза
+    Index('ux_favorites_user_recipe', favorites.c.user_id, favorites.c.recipe_id, unique=True),
+    Index('ix_favorites_recipe', favorites.c.recipe_id),
+    Index('ix_cooked_recipes_recipe', CookedRecipe.recipe_id),
+    Index('ix_recipes_user', Recipe.user_id),
+    Index('ix_recipes_cuisine', Recipe.cuisine_id),
+    Index('ix_recipes_dish_type_name', Recipe.dish_type_id, Recipe.name),
+    Index('ix_recipes_image', Recipe.image),
+]
+
+# Индексы, замененные объявленными выше или лишние; удаляются ensure_indexes
+# (ix_nutrition_recipe повторял первичный ключ Nutrition.recipe_id)
+OBSOLETE_INDEXES = ['ix_cart_user_ingredient_unit', 'ix_recipe_ingredients_recipe', 'ix_nutrition_recipe']
+
+
+# КОЛИЧЕСТВА И ЕДИНИЦЫ ИЗМЕРЕНИЯ
+# Реестр единиц: (каноническое обозначение, величина, множитель к базовой единице, другие написания).
+# Базовые единицы величин: масса - "г", объем - "мл", штуки - "шт". Единицы без пересчета
+# ("зубчик", "щепотка", "по вкусу") образуют каждая свою величину
+UNIT_DEFINITIONS = [
+    ('г', 'mass', 1.0, ('гр', 'грамм', 'грамма', 'граммов')),
+    ('кг', 'mass', 1000.0, ('килограмм', 'килограмма', 'килограммов')),
+    ('мл', 'volume', 1.0, ('миллилитр', 'миллилитра', 'миллилитров')),
+    ('л', 'volume', 1000.0, ('литр', 'литра', 'литров')),
+    ('ч.л.', 'volume', 5.0, ('ч. л.', 'чайная ложка', 'чайные ложки', 'чайных ложек', 'чайной ложки')),
+    ('ст.л.', 'volume', 15.0, ('ст. л.', 'столовая ложка', 'столовые ложки', 'столовых ложек', 'столовой ложки')),
+    ('стакан', 'volume', 250.0, ('ст.', 'стакана', 'стаканов')),
+    ('шт', 'count', 1.0, ('штука', 'штуки', 'штук')),
+    ('зубчик', 'зубчик', 1.0, ('зубчика', 'зубчиков')),
+    ('щепотка', 'щепотка', 1.0, ('щепотки', 'щепоток')),
+    ('по вкусу', 'по вкусу', 1.0, ()),
+]
+
+# Базовая единица каждой пересчитываемой величины и единица для крупных количеств (от 1000 базовых)
+BASE_UNITS = {'mass': ('г', 'кг'), 'volume': ('мл', 'л'), 'count': ('шт', None)}
+
+# Плотность распространенных ингредиентов, г/мл: позволяет сложить ложки и стаканы с граммами.
+# Ключ ищется как подстрока названия ингредиента без учета регистра
+INGREDIENT_DENSITIES = {
+    'вода': 1.0,
+    'молоко': 1.03,
+    'сливки': 1.0,
+    'кефир': 1.03,
+    'сметана': 1.0,
+    'масло растительное': 0.92,
+    'оливковое масло': 0.92,
+    'сахар': 0.8,
+    'соль': 1.2,
+    'мука': 0.55,
+    'крахмал': 0.65,
+    'рис': 0.8,
+    'мед': 1.4,
+    'соевый соус': 1.15,
+    'уксус': 1.0,
+    'лимонный сок': 1.03,
+}
+
+_UNICODE_FRACTIONS = {'½': 0.5, '¼': 0.25, '¾': 0.75, '⅓': 1 / 3, '⅔': 2 / 3}
+
+# Запись числа в количестве: смешанная дробь ("1 1/2", "1½"), диапазон ("2-3", "1,5–2"),
+# десятичная или простая дробь ("1,5", "1/2"). Диапазон дает верхнюю границу - ее и покупаем
+_AMOUNT_PATTERN = (
+    r'\d+\s+\d+\s*/\s*\d+'
+    r'|\d+(?:[.,]\d+)?\s*[-–—]\s*\d+(?:[.,]\d+)?'
+    r'|(?:\d+\s*)?[½¼¾⅓⅔]'
+    r'|\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?'
+)
+_RANGE_SEPARATOR_RE = re.compile(r'\s*[-–—]\s*')
+
+
+def _unit_key(unit):
+    """Ключ поиска единицы: нижний регистр, одиночные пробелы, без точки в конце"""
+    return ' '.join(str(unit or '').lower().split()).rstrip('.')
+
+
+class UnitRegistry:
+    """Реестр единиц измерения: разбор записей количества, пересчет и сведение списков покупок
+
+    Регулярное выражение разбора собирается один раз; написания единиц в нем упорядочены
+    от длинных к коротким, поэтому "ст.л." не принимается за "ст." (стакан).
+    """
+
+    def __init__(self, definitions, densities):
+        self._units = {}        # каноническая единица -> (величина, множитель к базовой)
+        self._aliases = {}      # ключ написания -> каноническая единица
+        for canonical, dimension, factor, aliases in definitions:
+            self._units[canonical] = (dimension, factor)
+            for alias in (canonical,) + tuple(aliases):
+                self._aliases[_unit_key(alias)] = canonical
+
+        self._densities = [(name.casefold(), density) for name, density in densities.items()]
+        self._density_by_name = {}
+
+        alternatives = '|'.join(
+            re.escape(alias) for alias in sorted(self._aliases, key=len, reverse=True)
+        )
+        self._quantity_re = re.compile(
+            r'\s*(?P<amount>' + _AMOUNT_PATTERN + r')?\s*'
+            r'(?P<unit>(?:' + alternatives + r')\.?(?![\w.]))?',
+            re.IGNORECASE
+        )
+
+    @staticmethod
+    def _to_number(text):
+        """Переводит найденное число ("1,5", "1/2", "½", "1 1/2", "2-3") в float
+
+        Для диапазона возвращается верхняя граница, для дроби с нулевым знаменателем - None.
+        """
+        bounds = _RANGE_SEPARATOR_RE.split(text.strip())
+        if len(bounds) == 2:
+            return max(float(bound.replace(',', '.')) for bound in bounds)
+        if text[-1] in _UNICODE_FRACTIONS:
+            whole = text[:-1].strip()
+            return (float(whole) if whole else 0.0) + _UNICODE_FRACTIONS[text[-1]]
+        if '/' in text:
+            head, denominator = text.split('/')
+            *whole, numerator = head.split()
+            if not float(denominator):
+                return None
+            return sum(float(part) for part in whole) + float(numerator) / float(denominator)
+        return float(text.replace(',', '.'))
+
+    def normalize(self, unit):
+        """Каноническое обозначение единицы; неизвестная единица возвращается без изменений"""
+        unit = ' '.join(str(unit or '').split())
+        return self._aliases.get(_unit_key(unit), unit)
+
+    def parse(self, text):
+        """Разбирает запись вида "2 столовые ложки" в (количество или None, единица или None)
+
+        Если число записано с ошибкой ("1/0 г") или в записи нет ни числа, ни известной
+        единицы ("немного"), возвращается (None, None): такая запись хранится как текст.
+        """
+        text = str(text or '').strip()
+        match = self._quantity_re.match(text)
+        amount = self._to_number(match.group('amount')) if match.group('amount') else None
+        if match.group('amount') and amount is None:
+            return None, None
+
+        if match.group('unit'):
+            return amount, self._aliases[_unit_key(match.group('unit'))]
+
+        if amount is None:
+            return None, None
+        rest = text[match.end('amount'):].strip()
+        return amount, (self.normalize(rest) if rest else None)
+
+    def parse_amount(self, value):
+        """Количество как число или None, если запись целиком не является числом"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        text = str(value or '').strip()
+        match = self._quantity_re.match(text)
+        if match.group('amount') and match.end('amount') == len(text):
+            return self._to_number(match.group('amount'))
+        return None
+
+    def density(self, ingredient_name):
+        """Плотность ингредиента в г/мл или None, если она неизвестна"""
+        name = str(ingredient_name or '').casefold()
+        if name not in self._density_by_name:
+            self._density_by_name[name] = next(
+                (density for key, density in self._densities if key in name), None
+            )
+        return self._density_by_name[name]
+
+    def to_base(self, amount, unit):
+        """Переводит количество в базовую единицу своей величины: (величина, количество)"""
+        dimension, factor = self._units.get(unit, (unit, 1.0))
+        return dimension, amount * factor
+
+    @staticmethod
+    def from_base(dimension, amount):
+        """Подбирает единицу для вывода количества в базовых единицах: (количество, единица)"""
+        base_unit, large_unit = BASE_UNITS.get(dimension, (dimension, None))
+        if large_unit and amount >= 1000:
+            return amount / 1000, large_unit
+        return amount, base_unit
+
+    def consolidate(self, rows):
+        """Сводит позиции списка покупок к наименьшему числу строк за один проход
+
+        rows - итерируемое словарей с ключами 'name', 'amount' (число или None), 'unit',
+        'text' (запись нечислового количества). Позиции одного ингредиента в пересчитываемых
+        единицах одной величины складываются; если единица одна, она сохраняется как есть.
+        Объем присоединяется к массе того же ингредиента, если известна его плотность.
+        Возвращает словари 'name', 'quantity', 'unit' и 'units' - исходные единицы строки.
+        """
+        groups = OrderedDict()
+        for row in rows:
+            name, amount, unit = row['name'], row['amount'], row['unit']
+            if amount is None:
+                key = (name, ('text', unit))
+                group = groups.setdefault(key, {'name': name, 'units': [], 'texts': []})
+                group['texts'].append(row['text'])
+            else:
+                dimension, base_amount = self.to_base(amount, unit)
+                key = (name, dimension)
+                group = groups.setdefault(key, {'name': name, 'units': [], 'base': 0.0,
+                                                'amount': 0.0, 'dimension': dimension})
+                group['base'] += base_amount
+                group['amount'] += amount
+            if unit not in group['units']:
+                group['units'].append(unit)
+
+        # Ложки и стаканы ингредиента, который есть и в граммах, пересчитываем по плотности
+        for (name, dimension), group in list(groups.items()):
+            mass_group = groups.get((name, 'mass'))
+            density = self.density(name) if dimension == 'volume' and mass_group else None
+            if density:
+                mass_group['base'] += group['base'] * density
+                mass_group['units'].extend(unit for unit in group['units'] if unit not in mass_group['units'])
+                del groups[(name, dimension)]
+
+        consolidated = []
+        for group in groups.values():
+            if 'texts' in group:
+                quantity, unit = ', '.join(text for text in group['texts'] if text), group['units'][0]
+            elif len(group['units']) == 1:
+                quantity, unit = group['amount'], group['units'][0]
+            else:
+                quantity, unit = self.from_base(group['dimension'], group['base'])
+                quantity = round(quantity, 3)
+            consolidated.append({'name': group['name'], 'quantity': quantity,
+                                 'unit': unit, 'units': group['units']})
+        return consolidated
+
+
+UNITS = UnitRegistry(UNIT_DEFINITIONS, INGREDIENT_DENSITIES)
+
+
+def normalize_unit(unit):
+    """Приводит написание единицы измерения к стандартному ("штуки" -> "шт", "гр." -> "г")"""
+    return UNITS.normalize(unit)
+
+
+def parse_amount(value):
+    """Возвращает количество как число ("1,5" -> 1.5, "½" -> 0.5) или None, если оно не числовое"""
+    return UNITS.parse_amount(value)
+
+
+def format_amount(amount):
+    """Записывает количество без лишних нулей (2.0 -> "2", 1.5 -> "1.5")"""
+    return f"{amount:.3f}".rstrip('0').rstrip('.')
+
+
+def _format_amount_sql(amount):
+    """SQL-выражение, записывающее количество так же, как format_amount"""
+    return func.rtrim(func.rtrim(func.printf('%.3f', amount), '0'), '.')
+
+
+# ПОЛНОТЕКСТОВЫЙ ИНДЕКС РЕЦЕПТОВ (FTS5)
+# rowid записи индекса совпадает с id рецепта; столбец ingredients - названия ингредиентов через пробел
+RECIPES_FTS_TABLE = 'recipes_fts'
+
+# Веса столбцов для BM25: name, description, instruction, ingredients
+RECIPES_FTS_WEIGHTS = (10.0, 2.0, 1.0, 5.0)
+
+_FTS_REFRESH_SQL = """
+    INSERT INTO recipes_fts(rowid, name, description, instruction, ingredients)
+    SELECT r.id, r.name, r.description, r.instruction,
+           (SELECT group_concat(i.name, ' ')
+              FROM "Recipe_ingredients" ri JOIN "Ingredients" i ON i.id = ri.ingredient_id
+             WHERE ri.recipe_id = r.id)
+      FROM "Recipes" r {where};
+"""
+
+RECIPES_FTS_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON "Recipes" BEGIN'
+    + _FTS_REFRESH_SQL.format(where='WHERE r.id = NEW.id') + 'END',
+
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_au AFTER UPDATE ON "Recipes" BEGIN '
+    'DELETE FROM recipes_fts WHERE rowid = OLD.id;'
+    + _FTS_REFRESH_SQL.format(where='WHERE r.id = NEW.id') + 'END',
+
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON "Recipes" BEGIN '
+    'DELETE FROM recipes_fts WHERE rowid = OLD.id; END',
+
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_ri_ai AFTER INSERT ON "Recipe_ingredients" BEGIN '
+    'DELETE FROM recipes_fts WHERE rowid = NEW.recipe_id;'
+    + _FTS_REFRESH_SQL.format(where='WHERE r.id = NEW.recipe_id') + 'END',
+
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_ri_ad AFTER DELETE ON "Recipe_ingredients" BEGIN '
+    'DELETE FROM recipes_fts WHERE rowid = OLD.recipe_id;'
+    + _FTS_REFRESH_SQL.format(where='WHERE r.id = OLD.recipe_id') + 'END',
+
+    'CREATE TRIGGER IF NOT EXISTS recipes_fts_ing_au AFTER UPDATE OF name ON "Ingredients" BEGIN '
+    'DELETE FROM recipes_fts WHERE rowid IN '
+    '(SELECT recipe_id FROM "Recipe_ingredients" WHERE ingredient_id = NEW.id);'
+    + _FTS_REFRESH_SQL.format(
+        where='WHERE r.id IN (SELECT recipe_id FROM "Recipe_ingredients" WHERE ingredient_id = NEW.id)'
+    ) + 'END',
+]
+
+# Триггеры, которые массовая загрузка снимает на время транзакции: вместо обновления
+# записи индекса после каждой вставленной строки индекс заполняется один раз на пачку
+RECIPES_FTS_INSERT_TRIGGERS = ('recipes_fts_ai', 'recipes_fts_ri_ai')
+
+
+# СЧЕТЧИКИ ПРОФИЛЯ ПОЛЬЗОВАТЕЛЯ
+# Счетчик user_stats -> таблица, строки которой он считает (по столбцу user_id)
+USER_STATS_SOURCES = [
+    ('recipes_count', 'Recipes'),
+    ('favorites_count', 'Favorites'),
+    ('cart_count', 'cart'),
+    ('cooked_count', 'cooked_recipes'),
+]
+
+
+def _user_stats_triggers():
+    """SQL триггеров, изменяющих счетчики user_stats при вставке и удалении строк"""
+    triggers = []
+    for counter, table_name in USER_STATS_SOURCES:
+        trigger_name = table_name.lower()
+        triggers.append(
+            f'CREATE TRIGGER IF NOT EXISTS user_stats_{trigger_name}_ai AFTER INSERT ON "{table_name}" '
+            f'WHEN NEW.user_id IS NOT NULL BEGIN '
+            f'INSERT INTO user_stats (user_id, {counter}) VALUES (NEW.user_id, 1) '
+            f'ON CONFLICT(user_id) DO UPDATE SET {counter} = {counter} + 1; END'
+        )
+        triggers.append(
+            f'CREATE TRIGGER IF NOT EXISTS user_stats_{trigger_name}_ad AFTER DELETE ON "{table_name}" '
+            f'WHEN OLD.user_id IS NOT NULL BEGIN '
+            f'UPDATE user_stats SET {counter} = MAX({counter} - 1, 0) WHERE user_id = OLD.user_id; END'
+        )
+    # Рецепт может сменить автора (например, при импорте)
+    triggers.append(
+        'CREATE TRIGGER IF NOT EXISTS user_stats_recipes_au AFTER UPDATE OF user_id ON "Recipes" '
+        'WHEN OLD.user_id IS NOT NEW.user_id BEGIN '
+        'UPDATE user_stats SET recipes_count = MAX(recipes_count - 1, 0) WHERE user_id = OLD.user_id; '
+        'INSERT INTO user_stats (user_id, recipes_count) SELECT NEW.user_id, 1 WHERE NEW.user_id IS NOT NULL '
+        'ON CONFLICT(user_id) DO UPDATE SET recipes_count = recipes_count + 1; END'
+    )
+    return triggers
+
+
+USER_STATS_TRIGGERS = _user_stats_triggers()
+
+
+# СЧЕТЧИКИ ССЫЛОК НА ИЗОБРАЖЕНИЯ
+# Сколько рецептов ссылается на каждый файл: удаление рецепта проверяет одну строку
+# image_refs по первичному ключу вместо подсчета по всей таблице Recipes
+IMAGE_REFS_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS image_refs_recipes_ai AFTER INSERT ON "Recipes" '
+    'WHEN NEW.image IS NOT NULL BEGIN '
+    'INSERT INTO image_refs (image, refcount) VALUES (NEW.image, 1) '
+    'ON CONFLICT(image) DO UPDATE SET refcount = refcount + 1; END',
+
+    'CREATE TRIGGER IF NOT EXISTS image_refs_recipes_ad AFTER DELETE ON "Recipes" '
+    'WHEN OLD.image IS NOT NULL BEGIN '
+    'UPDATE image_refs SET refcount = MAX(refcount - 1, 0) WHERE image = OLD.image; END',
+
+    'CREATE TRIGGER IF NOT EXISTS image_refs_recipes_au AFTER UPDATE OF image ON "Recipes" '
+    'WHEN OLD.image IS NOT NEW.image BEGIN '
+    'UPDATE image_refs SET refcount = MAX(refcount - 1, 0) WHERE image = OLD.image; '
+    'INSERT INTO image_refs (image, refcount) SELECT NEW.image, 1 WHERE NEW.image IS NOT NULL '
+    'ON CONFLICT(image) DO UPDATE SET refcount = refcount + 1; END',
+]
+
+
+def build_fts_query(search_text, column=None):
+    """Строит выражение MATCH для FTS5 с поиском по префиксу каждого слова
+
+    Слова берутся в кавычки, поэтому спецсимволы FTS5 во вводе пользователя безопасны.
+    Возвращает None, если в тексте нет ни одного слова.
+    """
+    words = re.findall(r'\w+', search_text or '')
+    if not words:
+        return None
+
+    column_prefix = f"{column} : " if column else ""
+    return " AND ".join(f'{column_prefix}"{word}"*' for word in words)
+
+
+# ПРОФИЛИ НАСТРОЙКИ ДВИЖКА SQLITE
+# Параметры применяются к каждому новому соединению через PRAGMA.
+# "default" - настройки SQLite по умолчанию (журнал отката, synchronous=FULL, кэш ~2 МБ),
+#   точка отсчета для замеров benchmark.py,
+# "safe" - WAL и полная синхронизация при каждом коммите,
+# "fast" - WAL с synchronous=NORMAL (fsync только при контрольной точке), крупный кэш и mmap.
+# В режиме WAL читатели не блокируют писателя и друг друга, поэтому пул держит несколько
+# соединений: фоновые потоки читают параллельно, а запись ждет очереди через busy_timeout
+ENGINE_PROFILES = {
+    'default': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,             # как timeout=5.0 у sqlite3.connect
+        'statement_cache_size': 128,      # как cached_statements у sqlite3.connect
+        'pool_size': 4,
+        'max_overflow': 4,
+        'pool_timeout': 30,
+    },
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,              # ~8 МБ (отрицательное значение - в килобайтах)
+        'mmap_size': 0,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,             # мс
+        'statement_cache_size': 100,
+        'pool_size': 4,                   # постоянных соединений в пуле
+        'max_overflow': 4,                # временных соединений сверх pool_size
+        'pool_timeout': 30,               # с ожидания свободного соединения
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,             # ~64 МБ
+        'mmap_size': 268435456,           # 256 МБ
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'statement_cache_size': 500,
+        'pool_size': 4,
+        'max_overflow': 4,
+        'pool_timeout': 30,
+    },
+}
+
+# ===== ИЗОБРАЖЕНИЯ РЕЦЕПТОВ =====
+# Каталог изображений проекта: стоковые изображения и файлы старого формата (до хранилища по хэшу).
+# Сами файлы хранилища лежат рядом с файлом БД, в каталоге IMAGE_STORE_DIR_NAME
+RECIPE_IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'img', 'recipe_img')
+IMAGE_STORE_DIR_NAME = 'recipe_img'
+
+# Стоковые изображения, которые миграция assign_recipe_images назначает рецептам новой БД;
+# они остаются на месте и не удаляются вместе с последним ссылающимся рецептом,
+# а в хранилище попадают жесткой ссылкой на исходный файл
+STOCK_RECIPE_IMAGES = (
+    'apple_pie.jpg', 'cabbage_rolls.jpg', 'caesar.jpg',
+    'mashed_potatoes.jpg', 'olivier.jpg', 'ramen.jpg',
+    'french_toast.jpg', 'pasta_carbonara.jpg'
+)
+
+# Имя файла в хранилище изображений: "<первые 2 символа SHA-1>/<SHA-1 содержимого>.<расширение>"
+IMAGE_STORE_NAME_RE = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{40})\.[0-9a-z]+$')
+
+# Каталог миниатюр создается рядом с файлом БД
+THUMBNAIL_DIR_NAME = 'thumbnails'
+THUMBNAIL_JPEG_QUALITY = 90
+
+DEFAULT_ENGINE_PROFILE = 'fast'
+ENGINE_PROFILE_ENV = 'TASTE_PUZZLE_DB_PROFILE'
+
+
+def resolve_engine_profile(profile=None):
+    """Определяет имя профиля движка: аргумент, переменная окружения, QSettings или значение по умолчанию"""
+    if not profile:
+        profile = os.environ.get(ENGINE_PROFILE_ENV)
+
+    if not profile:
+        try:
+            from PyQt6.QtCore import QSettings
+            profile = QSettings("PuzzleVkusov", "AppSettings").value("db_profile", None)
+        except Exception:
+            profile = None
+
+    if profile not in ENGINE_PROFILES:
+        profile = DEFAULT_ENGINE_PROFILE
+
+    return profile
+
+
+def _make_pragma_listener(settings):
+    """Создает обработчик события connect, применяющий PRAGMA профиля к соединению"""
+    pragmas = [
+        f"PRAGMA journal_mode={settings['journal_mode']}",
+        f"PRAGMA synchronous={settings['synchronous']}",
+        f"PRAGMA cache_size={int(settings['cache_size'])}",
+        f"PRAGMA mmap_size={int(settings['mmap_size'])}",
+        f"PRAGMA temp_store={settings['temp_store']}",
+        f"PRAGMA busy_timeout={int(settings['busy_timeout'])}",
+    ]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+class IngredientIndex:
+    """Инвертированный индекс ингредиентов: ingredient_id -> сжатое множество id рецептов
+
+    Как в roaring-битмапах, у каждого ингредиента свой контейнер: редкий ингредиент
+    хранит отсортированный массив array('I') по 4 байта на рецепт, частый - битовую
+    карту в целом числе Python (бит N установлен, если рецепт N содержит ингредиент),
+    когда она не длиннее массива. Поэтому память зависит от числа связей
+    рецепт-ингредиент, а не от наибольшего id. Запросы "содержит все" / "содержит
+    любой" сводятся к побитовым AND / OR без обращения к SQLite.
+    """
+
     def __init__(self):
-        """Инициализация подключения к базе данных"""
+        self._lock = threading.RLock()
+        self._postings = {}             # ingredient_id -> array('I') id рецептов или битовая карта
+        self._names = {}                # ingredient_id -> название в нижнем регистре
+        self.loaded = False
+
+    def build(self, pairs, ingredients):
+        """Полностью перестраивает индекс по парам (recipe_id, ingredient_id) и списку (id, name)"""
+        collected = {}
+        for recipe_id, ingredient_id in pairs:
+            recipe_ids = collected.get(ingredient_id)
+            if recipe_ids is None:
+                recipe_ids = collected[ingredient_id] = array('I')
+            recipe_ids.append(recipe_id)
+
+        # Каждый контейнер собирается один раз, после того как прочитаны все пары
+        postings = {ingredient_id: self._pack(sorted(set(recipe_ids)))
+                    for ingredient_id, recipe_ids in collected.items()}
+        names = {ing_id: (name or '').casefold() for ing_id, name in ingredients}
+
+        with self._lock:
+            self._postings = postings
+            self._names = names
+            self.loaded = True
+
+    def add_ingredient(self, ingredient_id, name):
+        """Регистрирует название ингредиента для поиска по фрагменту"""
+        with self._lock:
+            self._names[ingredient_id] = (name or '').casefold()
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Инкрементально заменяет набор ингредиентов рецепта"""
+        with self._lock:
+            self.remove_recipe(recipe_id)
+            for ingredient_id in set(ingredient_ids):
+                posting = self._postings.get(ingredient_id)
+                if posting is None:
+                    self._postings[ingredient_id] = array('I', [recipe_id])
+                elif isinstance(posting, int):
+                    self._postings[ingredient_id] = posting | (1 << recipe_id)
+                else:
+                    posting.insert(bisect_left(posting, recipe_id), recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        """Инкрементально удаляет рецепт из индекса"""
+        with self._lock:
+            for ingredient_id, posting in list(self._postings.items()):
+                if isinstance(posting, int):
+                    if (posting >> recipe_id) & 1:
+                        posting &= ~(1 << recipe_id)
+                        if posting:
+                            self._postings[ingredient_id] = posting
+                        else:
+                            del self._postings[ingredient_id]
+                    continue
+                position = bisect_left(posting, recipe_id)
+                if position < len(posting) and posting[position] == recipe_id:
+                    del posting[position]
+                    if not posting:
+                        del self._postings[ingredient_id]
+
+    def ingredient_ids_matching(self, name_fragment):
+        """Возвращает id ингредиентов, в названии которых встречается фрагмент (без учета регистра)"""
+        fragment = (name_fragment or '').casefold()
+        with self._lock:
+            return [ing_id for ing_id, name in self._names.items() if fragment in name]
+
+    def bitmap_for_name(self, name_fragment):
+        """Битовая карта рецептов, содержащих хотя бы один ингредиент, подходящий под фрагмент"""
+        bitmap = 0
+        with self._lock:
+            for ingredient_id in self.ingredient_ids_matching(name_fragment):
+                posting = self._postings.get(ingredient_id)
+                if posting is not None:
+                    bitmap |= self._to_bitmap(posting)
+        return bitmap
+
+    def recipes_with_all(self, name_fragments):
+        """Битовая карта рецептов, содержащих ВСЕ указанные ингредиенты (AND по фрагментам)"""
+        result = None
+        for fragment in name_fragments:
+            bitmap = self.bitmap_for_name(fragment)
+            result = bitmap if result is None else result & bitmap
+            if not result:
+                return 0
+        return result or 0
+
+    def recipes_with_any(self, name_fragments):
+        """Битовая карта рецептов, содержащих ХОТЯ БЫ ОДИН из указанных ингредиентов (OR)"""
+        result = 0
+        for fragment in name_fragments:
+            result |= self.bitmap_for_name(fragment)
+        return result
+
+    def memory_usage(self):
+        """Примерный объем контейнеров индекса в байтах"""
+        with self._lock:
+            return sum(sys.getsizeof(posting) for posting in self._postings.values())
+
+    @staticmethod
+    def _pack(recipe_ids):
+        """Контейнер для отсортированного списка id: битовая карта, если она не длиннее массива"""
+        if recipe_ids and len(recipe_ids) * 32 >= recipe_ids[-1]:
+            return IngredientIndex._ids_to_bitmap(recipe_ids)
+        return array('I', recipe_ids)
+
+    @staticmethod
+    def _to_bitmap(posting):
+        return posting if isinstance(posting, int) else IngredientIndex._ids_to_bitmap(posting)
+
+    @staticmethod
+    def _ids_to_bitmap(recipe_ids):
+        """Битовая карта из списка id, собранная в bytearray за один проход"""
+        if not recipe_ids:
+            return 0
+        buffer = bytearray((max(recipe_ids) >> 3) + 1)
+        for recipe_id in recipe_ids:
+            buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+        return int.from_bytes(buffer, 'little')
+
+    @staticmethod
+    def bitmap_to_ids(bitmap):
+        """Преобразует битовую карту в отсортированный список id рецептов"""
+        bits = bin(bitmap)[:1:-1]
+        ids = []
+        position = bits.find('1')
+        while position != -1:
+            ids.append(position)
+            position = bits.find('1', position + 1)
+        return ids
+
+
+class ReferenceDataCache:
+    """Общий для процесса кэш справочников: типы блюд, кухни, ингредиенты
+
+    Для каждого справочника хранится список (id, name) и карты name -> id и id -> name.
+    Справочник загружается при первом обращении и сбрасывается методом invalidate.
+    """
+
+    def __init__(self, loaders):
+        self._lock = threading.RLock()
+        self._loaders = loaders     # вид справочника -> функция, возвращающая [(id, name)]
+        self._entries = {}          # вид справочника -> (rows, name_to_id, id_to_name)
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, kind):
+        """Возвращает запись справочника, загружая ее при промахе"""
+        with self._lock:
+            entry = self._entries.get(kind)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            rows = [(row_id, name) for row_id, name in self._loaders[kind]()]
+            entry = (rows, {name: row_id for row_id, name in rows}, dict(rows))
+            self._entries[kind] = entry
+            return entry
+
+    def get(self, kind):
+        """Возвращает копию списка (id, name) справочника"""
+        return list(self._entry(kind)[0])
+
+    def id_by_name(self, kind, name):
+        """Возвращает id элемента справочника по названию или None"""
+        return self._entry(kind)[1].get(name)
+
+    def name_by_id(self, kind, row_id):
+        """Возвращает название элемента справочника по id или None"""
+        return self._entry(kind)[2].get(row_id)
+
+    def invalidate(self, kind=None):
+        """Сбрасывает один справочник или весь кэш"""
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(kind, None)
+
+    def get_stats(self):
+        """Возвращает счетчики попаданий/промахов и список загруженных справочников"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'loaded': sorted(self._entries)
+            }
+
+
+class UserRecipeFlags:
+    """Множества избранных и приготовленных рецептов по пользователям
+
+    Множества пользователя загружаются одним запросом при входе (или при первой
+    проверке) и дальше обновляются сквозной записью вместе с базой.
+    """
+
+    def __init__(self, loader):
+        self._lock = threading.RLock()
+        self._loader = loader       # функция user_id -> (множество избранных, множество приготовленных)
+        self._users = {}            # user_id -> {'favorites': set, 'cooked': set}
+
+    def _sets(self, user_id):
+        """Возвращает множества пользователя, загружая их при первом обращении"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                favorite_ids, cooked_ids = self._loader(user_id)
+                entry = {'favorites': set(favorite_ids), 'cooked': set(cooked_ids)}
+                self._users[user_id] = entry
+            return entry
+
+    def load(self, user_id):
+        """Заново загружает множества пользователя из базы"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._sets(user_id)
+
+    def contains(self, kind, user_id, recipe_id):
+        """Проверяет, входит ли рецепт в множество kind ("favorites" или "cooked")"""
+        with self._lock:
+            return recipe_id in self._sets(user_id)[kind]
+
+    def ids(self, kind, user_id):
+        """Возвращает копию множества kind пользователя"""
+        with self._lock:
+            return set(self._sets(user_id)[kind])
+
+    def set_flag(self, kind, user_id, recipe_id, value):
+        """Добавляет рецепт в множество или убирает его оттуда (только для загруженных пользователей)"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            if value:
+                entry[kind].add(recipe_id)
+            else:
+                entry[kind].discard(recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        """Убирает удаленный рецепт из множеств всех пользователей"""
+        with self._lock:
+            for entry in self._users.values():
+                entry['favorites'].discard(recipe_id)
+                entry['cooked'].discard(recipe_id)
+
+    def forget(self, user_id=None):
+        """Сбрасывает множества одного пользователя или всех"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+class QueryResultCache:
+    """Ограниченный LRU-кэш результатов запросов с проверкой поколения данных
+
+    Каждая запись помнит поколение данных, при котором была получена. Любое
+    изменение БД увеличивает поколение и сбрасывает кэш; результат запроса,
+    начатого до изменения, в кэш уже не попадает.
+    """
+
+    def __init__(self, max_size=32):
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # ключ -> (поколение, результат)
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def bump_generation(self):
+        """Отмечает изменение данных: все накопленные результаты устаревают"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def get(self, key):
+        """Возвращает результат по ключу или None, если его нет или он устарел"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self.generation:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, value):
+        """Сохраняет результат, полученный при поколении generation"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        """Возвращает размер кэша, поколение и счетчики попаданий/промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+class SessionMetrics:
+    """Счетчики сессий, соединений и SQL-запросов с разбивкой по действиям пользователя
+
+    Общие счетчики копятся за все время работы; пока в потоке открыто действие
+    (DataBase.track_action или DataBase.transaction), те же события дополнительно
+    засчитываются ему, а по завершении действие попадает в историю последних действий.
+    """
+
+    COUNTERS = ('sessions', 'joined', 'nested', 'checkouts', 'connects', 'statements')
+
+    def __init__(self, history_size=50):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.history = deque(maxlen=history_size)
+
+    def count(self, counter, delta=1):
+        """Засчитывает событие в общие счетчики и в текущее действие потока"""
+        with self._lock:
+            self.totals[counter] += delta
+        action = getattr(self._local, 'action', None)
+        if action is not None:
+            action[counter] += delta
+
+    def current_action(self):
+        """Возвращает счетчики действия, открытого в текущем потоке, или None"""
+        return getattr(self._local, 'action', None)
+
+    def begin_action(self, name):
+        """Открывает действие в текущем потоке и возвращает его счетчики"""
+        action = dict.fromkeys(self.COUNTERS, 0)
+        action['action'] = name
+        action['started'] = time.perf_counter()
+        self._local.action = action
+        return action
+
+    def end_action(self):
+        """Закрывает действие текущего потока и сохраняет его в историю"""
+        action = self._local.action
+        self._local.action = None
+        action['seconds'] = time.perf_counter() - action.pop('started')
+        with self._lock:
+            self.history.append(action)
+        return action
+
+    def get_stats(self):
+        """Возвращает общие счетчики и историю последних действий (новые в конце)"""
+        with self._lock:
+            return {
+                'totals': dict(self.totals),
+                'actions': [dict(action) for action in self.history]
+            }
+
+
+class UnitOfWork:
+    """Единица работы: одна сессия и одна транзакция на несколько вызовов DataBase
+
+    Создается через DataBase.transaction(). Пока блок with открыт, методы DataBase
+    в этом потоке получают вместо новой сессии обертку над общей (UnitOfWorkSession).
+    """
+
+    def __init__(self, session, action):
+        self.session = session
+        self.action = action
+        self.rollback_only = False  # один из вызовов откатился - вся единица работы будет отменена
+        self.error = None           # первое исключение, из-за которого откатился вызов
+        self.committed = False
+        self.released_images = []   # файлы изображений, освобождаемые после commit
+
+    def begin(self):
+        """Открывает транзакцию на соединении сессии, если она еще не открыта
+
+        pysqlite сам не выполняет BEGIN перед SAVEPOINT: без этого освобождение точки
+        сохранения первого вызова сразу фиксировало бы его изменения.
+        """
+        connection = self.session.connection()
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN')
+
+    def mark_rollback_only(self, error=None):
+        """Помечает единицу работы к откату при выходе из блока
+
+        error - исключение, из-за которого откатился вызов; первое из них
+        повторно выбрасывается из DataBase.transaction() после отката.
+        """
+        self.rollback_only = True
+        if self.error is None:
+            self.error = error
+
+
+class UnitOfWorkSession:
+    """Сессия, которую методы DataBase получают внутри единицы работы
+
+    Каждый вызов идет в своей точке сохранения (SAVEPOINT) общей транзакции.
+    commit() сбрасывает изменения вызова и освобождает точку сохранения, rollback()
+    откатывает изменения вызова до нее и помечает всю единицу работы к откату,
+    close() освобождает точку сохранения вызова, который только читал. После
+    ошибки вызова общая сессия остается рабочей для следующих вызовов; фиксация
+    или откат всей транзакции выполняются один раз при выходе из DataBase.transaction().
+    """
+
+    def __init__(self, unit_of_work):
+        self._unit_of_work = unit_of_work
+        unit_of_work.begin()
+        self._savepoint = unit_of_work.session.begin_nested()
+
+    def commit(self):
+        if self._savepoint is None:
+            self._unit_of_work.session.flush()
+            return
+        self._savepoint.commit()
+        self._savepoint = None
+
+    def rollback(self):
+        if self._savepoint is not None:
+            # Точка сохранения откатывается и после неудачного flush
+            self._savepoint.rollback()
+            self._savepoint = None
+        else:
+            # Точка сохранения уже освобождена - откатываем всю транзакцию сразу
+            self._unit_of_work.session.rollback()
+        self._unit_of_work.mark_rollback_only(sys.exc_info()[1])
+
+    def close(self):
+        if self._savepoint is not None:
+            self._savepoint.commit()
+            self._savepoint = None
+
+    def __getattr__(self, name):
+        return getattr(self._unit_of_work.session, name)
+
+
+class ThreadSession:
+    """Сессия текущего потока, выданная самому внешнему вызову DataBase
+
+    Пока она открыта, вложенные вызовы (метод DataBase, вызванный из другого метода)
+    получают отдельную сессию и не могут закрыть, зафиксировать или откатить сессию
+    вызывающего. close() закрывает сессию потока только у этого, внешнего, вызова.
+    """
+
+    def __init__(self, session, local):
+        self._session = session
+        self._local = local
+        local.thread_session = self
+
+    def close(self):
+        if getattr(self._local, 'thread_session', None) is not self:
+            return
+        self._local.thread_session = None
+        self._session.close()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class RecipeImageStore:
+    """Хранилище изображений рецептов с адресацией по содержимому
+
+    Файл называется SHA-1 своего содержимого и лежит в подкаталоге по первым двум
+    символам хэша, поэтому одинаковые изображения хранятся один раз, а каталог
+    не разрастается в один плоский список. Имя файла (относительно root) записывается
+    в Recipes.image; сколько рецептов на него ссылается, считает таблица image_refs.
+    Имена старого формата ("olivier.jpg") ищутся в legacy_root - каталоге изображений проекта.
+    """
+
+    def __init__(self, root, legacy_root=RECIPE_IMAGES_DIR):
+        self.root = root
+        self.legacy_root = legacy_root
+
+    @staticmethod
+    def digest_of(image):
+        """SHA-1 из имени файла хранилища или None для имен в старом формате"""
+        match = IMAGE_STORE_NAME_RE.match(image or '')
+        return match.group(2) if match else None
+
+    def path(self, image):
+        """Полный путь к файлу изображения"""
+        return os.path.join(self.root if self.digest_of(image) else self.legacy_root, image)
+
+    def put(self, image_data, extension=None, link=False):
+        """Кладет изображение (байты или путь к файлу) в хранилище и возвращает его имя
+
+        Если файл с таким содержимым уже есть, он не перезаписывается. link=True для
+        пути к файлу создает жесткую ссылку вместо копии (если это возможно), чтобы
+        исходный файл, который остается на месте, не занимал место на диске дважды.
+        """
+        if isinstance(image_data, bytes):
+            data = image_data
+        elif isinstance(image_data, str) and os.path.isfile(image_data):
+            with open(image_data, 'rb') as source:
+                data = source.read()
+            extension = extension or os.path.splitext(image_data)[1]
+        else:
+            return None
+
+        extension = (extension or '.jpg').lower()
+        if extension == '.jpeg':
+            extension = '.jpg'
+        digest = hashlib.sha1(data).hexdigest()
+        image = f"{digest[:2]}/{digest}{extension}"
+        path = self.path(image)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if link and isinstance(image_data, str):
+                try:
+                    os.link(image_data, path)
+                    return image
+                except FileExistsError:
+                    return image
+                except OSError:
+                    # Другая файловая система или ссылки не поддерживаются - копируем
+                    pass
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as target:
+                target.write(data)
+            os.replace(temp_path, path)
+        return image
+
+    def remove(self, image):
+        """Удаляет файл изображения и опустевший подкаталог"""
+        path = self.path(image)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        if self.digest_of(image):
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        return True
+
+
+class ThumbnailCache:
+    """Дисковый кэш уменьшенных копий изображений рецептов
+
+    Миниатюра хранится в файле, имя которого составлено из SHA-1 содержимого
+    исходного изображения, размера и режима масштабирования, поэтому замена файла
+    изображения сама собой дает новую миниатюру. Хэш исходного файла запоминается
+    по (путь, размер, время изменения): повторная загрузка - это чтение небольшого
+    файла миниатюры без декодирования полного JPEG.
+    Возвращает QImage, которые можно создавать и вне потока интерфейса.
+    """
+
+    def __init__(self, cache_dir, image_store):
+        self.cache_dir = cache_dir
+        self.image_store = image_store
+        self._lock = threading.Lock()
+        self._digests = {}      # (путь, размер, mtime) -> SHA-1 содержимого
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def source_path(self, image):
+        """Полный путь к исходному файлу изображения рецепта"""
+        return self.image_store.path(image)
+
+    def _source_digest(self, path):
+        """SHA-1 содержимого исходного файла или None, если файла нет"""
         try:
-            db_path = os.path.join('../data/Taste_Pazzle.db')
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as source:
+                for chunk in iter(lambda: source.read(1 << 16), b''):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def thumbnail_path(self, digest, width, height, expand=False, extension='.jpg'):
+        """Путь к файлу миниатюры; файлы разложены по подкаталогам по первым символам хэша"""
+        mode = 'e' if expand else 'f'
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{width}x{height}{mode}{extension}")
+
+    def get(self, image, width, height, expand=False):
+        """Возвращает QImage миниатюры изображения image или None, если его нет
+
+        expand=False вписывает изображение в width x height (KeepAspectRatio),
+        expand=True заполняет прямоугольник целиком (KeepAspectRatioByExpanding).
+        """
+        from PyQt6.QtGui import QImage, QImageReader, QImageIOHandler
+        from PyQt6.QtCore import Qt
 
-            self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
-            self.Session = sessionmaker(bind=self.engine)
+        if not image:
+            return None
+        source = self.source_path(image)
+        try:
+            # Имя файла хранилища уже содержит хэш, читать файл для него не нужно
+            digest = RecipeImageStore.digest_of(image)
+            if digest is None:
+                digest = self._source_digest(source)
+            elif not os.path.exists(source):
+                digest = None
+        except OSError:
+            digest = None
+        if digest is None:
+            return None
 
-            Base.metadata.create_all(self.engine)
+        for extension in ('.jpg', '.png'):
+            cached_path = self.thumbnail_path(digest, width, height, expand, extension)
+            if os.path.exists(cached_path):
+                thumbnail = QImage(cached_path)
+                if not thumbnail.isNull():
+                    with self._lock:
+                        self.hits += 1
+                    return thumbnail
+
+        with self._lock:
+            self.misses += 1
+        mode = Qt.AspectRatioMode.KeepAspectRatioByExpanding if expand else Qt.AspectRatioMode.KeepAspectRatio
+        reader = QImageReader(source)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            # Размер задается до поворота по EXIF, поэтому для повернутых снимков
+            # прямоугольник миниатюры транспонируется
+            rotated = bool(reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90)
+            target = size.scaled(height if rotated else width, width if rotated else height, mode)
+            if target.width() < size.width():
+                # JPEG декодируется сразу в уменьшенном масштабе, без полного растра
+                reader.setScaledSize(target)
+        thumbnail = reader.read()
+        if thumbnail.isNull():
+            return None
 
-            # Создаем дополнительные таблицы если их нет
-            self._create_additional_tables()
+        if thumbnail.size().scaled(width, height, mode) != thumbnail.size():
+            thumbnail = thumbnail.scaled(width, height, mode, Qt.TransformationMode.SmoothTransformation)
+        self._store(thumbnail, digest, width, height, expand)
+        return thumbnail
 
-            # Добавляем отсутствующие столбцы
-            self._migrate_database()
+    def _store(self, thumbnail, digest, width, height, expand):
+        """Атомарно записывает миниатюру; прозрачные изображения сохраняются в PNG"""
+        extension = '.png' if thumbnail.hasAlphaChannel() else '.jpg'
+        path = self.thumbnail_path(digest, width, height, expand, extension)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image_format = 'PNG' if extension == '.png' else 'JPG'
+            if thumbnail.save(temp_path, image_format, -1 if extension == '.png' else THUMBNAIL_JPEG_QUALITY):
+                os.replace(temp_path, path)
+                with self._lock:
+                    self.writes += 1
+        except OSError as e:
+            print(f"Ошибка записи миниатюры: {e}")
+        finally:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
 
-            self._check_existing_data()
+    def clear(self):
+        """Удаляет все миниатюры с диска"""
+        with self._lock:
+            self._digests.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def get_stats(self):
+        """Возвращает счетчики попаданий, промахов и записанных миниатюр"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'hit_rate': self.hits / total if total else 0.0
+            }
 
-            self._check_existing_data()
 
-            self.assign_unique_images_to_recipes()
-            self.check_image_status()
-            self.migrate_existing_images()
+class PixmapCache:
+    """LRU-кэш готовых QPixmap с бюджетом в байтах
+
+    Хранит декодированные миниатюры по ключу ("image", файл, ширина, высота, режим)
+    и текстовые заглушки по ключу ("text", текст, ширина, высота, режим). Размер
+    записи - байты пикселей (ширина * высота * глубина / 8); при превышении бюджета
+    вытесняются давно не использованные записи. QPixmap живут только в потоке
+    интерфейса, поэтому кэш используется из него.
+    """
+
+    def __init__(self, max_bytes):
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # ключ -> (QPixmap, байты)
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def pixmap_bytes(pixmap):
+        """Объем памяти пикселей QPixmap в байтах"""
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key):
+        """Возвращает QPixmap по ключу или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, pixmap):
+        """Сохраняет QPixmap; запись больше всего бюджета не кэшируется"""
+        if pixmap is None or pixmap.isNull():
+            return
+        size = self.pixmap_bytes(pixmap)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (pixmap, size)
+            self.bytes_used += size
+            self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes_used -= entry[1]
+
+    def _evict(self):
+        while self.bytes_used > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes_used -= size
+            self.evictions += 1
+
+    def set_budget(self, max_bytes):
+        """Меняет бюджет памяти, сразу вытесняя лишнее"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def discard_image(self, image):
+        """Удаляет все размеры миниатюр файла image (файл перезаписан или удален)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == 'image' and key[1] == image]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def get_stats(self):
+        """Возвращает число записей, занятую память, бюджет и счетчики попаданий/промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self.bytes_used,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
 
 
+class DataBase:
+    # Максимальный размер списка id, передаваемого в SQL через IN (лимит параметров старых SQLite)
+    MAX_SQL_IN_IDS = 900
+
+    # Сколько последних комбинаций фильтров главного окна хранить в кэше результатов
+    # get_recipes_with_filters
+    RESULT_CACHE_SIZE = 32
+
+    # Сколько последних страниц get_recipes_page хранить в отдельном кэше страниц,
+    # чтобы прокрутка длинного списка не вытесняла результаты фильтров
+    PAGE_CACHE_SIZE = 64
+
+    # Бюджет памяти кэша готовых изображений (QPixmap) в байтах
+    PIXMAP_CACHE_BYTES = 48 * 1024 * 1024
+
+    # Размер страницы постраничной выборки рецептов по умолчанию
+    RECIPES_PAGE_SIZE = 24
+
+    # Упорядоченный реестр одноразовых миграций: (версия, название, метод).
+    # Новые шаги добавляются только в конец списка со следующим номером версии
+    MIGRATIONS = [
+        (1, 'create_tables', '_migration_create_tables'),
+        (2, 'seed_dish_types', '_migrate_database'),
+        (3, 'assign_recipe_images', 'assign_unique_images_to_recipes'),
+        (4, 'normalize_image_paths', 'migrate_existing_images'),
+        (5, 'create_recipe_search_index', '_migration_create_search_index'),
+        (6, 'numeric_quantities', '_migration_numeric_quantities'),
+        (7, 'reparse_ingredient_units', '_migration_reparse_ingredient_units'),
+        (8, 'create_user_stats', '_migration_create_user_stats'),
+        (9, 'content_addressed_images', '_migration_content_addressed_images'),
+        (10, 'nutrition_primary_key', '_migration_nutrition_primary_key'),
+        (11, 'relocate_image_store', '_migration_relocate_image_store'),
+        (12, 'reparse_ranges_and_fractions', '_migration_reparse_ingredient_units'),
+    ]
+
+    def __init__(self, db_path='../data/Taste_Pazzle.db', auto_migrate=True, profile=None):
+        """Инициализация подключения к базе данных
+
+        При обычном запуске читается только номер версии схемы; одноразовые
+        миграции выполняются лишь если они еще не были применены.
+        profile - имя профиля движка из ENGINE_PROFILES ("default", "safe" или "fast").
+        """
+        try:
+            self._fts_available = None
+            self._ingredient_index = IngredientIndex()
+            self.reference_cache = ReferenceDataCache({
+                'dish_types': self._load_dish_types,
+                'cuisines': self._load_cuisines,
+                'ingredients': self._load_ingredients,
+            })
+            self.user_flags = UserRecipeFlags(self._load_user_flags)
+            self.result_cache = QueryResultCache(self.RESULT_CACHE_SIZE)
+            self.page_cache = QueryResultCache(self.PAGE_CACHE_SIZE)
+            self.pixmap_cache = PixmapCache(self.PIXMAP_CACHE_BYTES)
+            # Хранилище изображений и миниатюры лежат рядом с файлом БД
+            data_dir = os.path.dirname(os.path.abspath(db_path))
+            self.image_store = RecipeImageStore(os.path.join(data_dir, IMAGE_STORE_DIR_NAME))
+            self.thumbnails = ThumbnailCache(os.path.join(data_dir, THUMBNAIL_DIR_NAME), self.image_store)
+            self.engine_profile = resolve_engine_profile(profile)
+            profile_settings = ENGINE_PROFILES[self.engine_profile]
+
+            # Соединения переходят между потоками через пул, но одновременно
+            # каждое используется только одним потоком
+            self.engine = create_engine(
+                f'sqlite:///{db_path}',
+                echo=False,
+                poolclass=QueuePool,
+                pool_size=profile_settings['pool_size'],
+                max_overflow=profile_settings['max_overflow'],
+                pool_timeout=profile_settings['pool_timeout'],
+                connect_args={
+                    'cached_statements': profile_settings['statement_cache_size'],
+                    'check_same_thread': False
+                }
+            )
+            event.listen(self.engine, 'connect', _make_pragma_listener(profile_settings))
+            self.session_metrics = SessionMetrics()
+            self._install_session_metrics()
+            self._local = threading.local()
+            # Сессия своя у каждого потока; после commit загруженные значения не сбрасываются.
+            # Вложенные вызовы и единицы работы получают отдельные сессии из _session_maker
+            self._session_maker = sessionmaker(bind=self.engine, expire_on_commit=False)
+            self._session_factory = scoped_session(self._session_maker)
+            self.Session = self._open_session
+
+            if auto_migrate:
+                self.apply_pending_migrations()
+                self.ensure_indexes()
+
         except Exception as e:
             print(f"Ошибка подключения к базе данных: {e}")
             raise
 
-    def _migrate_database(self):
-        """Упрощенная миграция - просто создаем все таблицы"""
+    # ===== ВЕРСИОНИРОВАННЫЕ МИГРАЦИИ =====
+    def get_schema_version(self):
+        """Возвращает номер последней примененной миграции (0 для новой БД)"""
+        SchemaVersion.__table__.create(self.engine, checkfirst=True)
+        with self.engine.connect() as connection:
+            version = connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+        return version or 0
+
+    def get_pending_migrations(self):
+        """Возвращает список миграций, которые еще не применены к БД"""
+        current_version = self.get_schema_version()
+        return [migration for migration in self.MIGRATIONS if migration[0] > current_version]
+
+    def apply_pending_migrations(self, verbose=False):
+        """Применяет по порядку все непримененные миграции и фиксирует их версии"""
+        applied = []
+        for version, name, method_name in self.get_pending_migrations():
+            if verbose:
+                print(f"Применение миграции {version}: {name}...")
+
+            getattr(self, method_name)()
+
+            session = self.Session()
+            try:
+                session.add(SchemaVersion(version=version, name=name))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+            applied.append((version, name))
+
+        if applied:
+            self._data_changed()
+        return applied
+
+    # ===== КЭШ РЕЗУЛЬТАТОВ ЗАПРОСОВ =====
+    def _data_changed(self):
+        """Увеличивает поколение данных; вызывается после каждого изменения БД"""
+        self.result_cache.bump_generation()
+        self.page_cache.bump_generation()
+
+    @property
+    def data_generation(self):
+        """Текущее поколение данных"""
+        return self.result_cache.generation
+
+    def get_result_cache_stats(self):
+        """Возвращает размер и долю попаданий кэша фильтров и кэша страниц"""
+        return {'filters': self.result_cache.get_stats(), 'pages': self.page_cache.get_stats()}
+
+    def get_image_cache_stats(self):
+        """Возвращает статистику кэша QPixmap в памяти и дискового кэша миниатюр"""
+        return {'pixmaps': self.pixmap_cache.get_stats(), 'thumbnails': self.thumbnails.get_stats()}
+
+    def get_engine_pragmas(self):
+        """Возвращает фактические значения PRAGMA текущего соединения (для диагностики профиля)"""
+        names = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout']
+        with self.engine.connect() as connection:
+            return {name: connection.execute(text(f"PRAGMA {name}")).scalar() for name in names}
+
+    # ===== СЕССИИ И ЕДИНИЦА РАБОТЫ =====
+    def _install_session_metrics(self):
+        """Подключает к движку счетчики соединений и SQL-запросов"""
+        metrics = self.session_metrics
+
+        def on_connect(dbapi_connection, connection_record):
+            metrics.count('connects')
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            metrics.count('checkouts')
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            metrics.count('statements')
+
+        event.listen(self.engine, 'connect', on_connect)
+        event.listen(self.engine, 'checkout', on_checkout)
+        event.listen(self.engine, 'before_cursor_execute', on_execute)
+
+    def _open_session(self):
+        """Возвращает сессию для одного вызова (доступна как self.Session())
+
+        Внутри db.transaction() возвращается обертка над общей сессией единицы
+        работы, иначе - сессия текущего потока (у каждого потока своя). Если сессия
+        потока уже занята вызывающим методом, вложенный вызов получает отдельную
+        сессию, которую сам и закрывает.
+        """
+        unit_of_work = getattr(self._local, 'unit_of_work', None)
+        if unit_of_work is not None:
+            self.session_metrics.count('joined')
+            return UnitOfWorkSession(unit_of_work)
+        if getattr(self._local, 'thread_session', None) is not None:
+            self.session_metrics.count('nested')
+            return self._session_maker()
+        self.session_metrics.count('sessions')
+        return ThreadSession(self._session_factory(), self._local)
+
+    @contextmanager
+    def track_action(self, name):
+        """Засчитывает сессии, соединения и запросы внутри блока действию name
+
+        Вложенное действие засчитывается внешнему. Счетчики действия доступны
+        в блоке и после него попадают в get_session_stats()['actions'].
+        """
+        current = self.session_metrics.current_action()
+        if current is not None:
+            yield current
+            return
+        action = self.session_metrics.begin_action(name)
+        try:
+            yield action
+        finally:
+            self.session_metrics.end_action()
+
+    @contextmanager
+    def transaction(self, action=None):
+        """Единица работы: все вызовы DataBase внутри блока идут в одной сессии и транзакции
+
+            with db.transaction('save_recipe') as tx:
+                recipe_id = db.add_recipe(...)
+                db.add_cart_items(...)
+
+        Изменения фиксируются одним commit при выходе из блока. Исключение в блоке
+        или отказ любого из вызовов откатывают все: метод, вернувший None/False
+        из-за ошибки или не найденной записи, вызывает session.rollback(), а он
+        откатывает изменения этого вызова и помечает единицу работы к откату
+        (tx.mark_rollback_only() делает то же из кода блока). Следующие вызовы
+        блока выполняются как обычно. Если вызов откатился из-за исключения, после
+        отката всей транзакции это исключение выбрасывается из блока with.
+        Результат виден в tx.committed. Вложенный transaction() присоединяется к внешнему.
+        """
+        current = getattr(self._local, 'unit_of_work', None)
+        if current is not None:
+            try:
+                yield current
+            except Exception:
+                current.mark_rollback_only()
+                raise
+            return
+
+        with self.track_action(action or 'transaction'):
+            self.session_metrics.count('sessions')
+            unit_of_work = UnitOfWork(self._session_maker(), action)
+            self._local.unit_of_work = unit_of_work
+            try:
+                unit_of_work.begin()
+                yield unit_of_work
+                if unit_of_work.rollback_only:
+                    unit_of_work.session.rollback()
+                else:
+                    unit_of_work.session.commit()
+                    unit_of_work.committed = True
+            except Exception:
+                unit_of_work.session.rollback()
+                raise
+            finally:
+                self._local.unit_of_work = None
+                unit_of_work.session.close()
+                if unit_of_work.committed:
+                    self._data_changed()
+                    for image in unit_of_work.released_images:
+                        self.release_image(image)
+                else:
+                    self.invalidate_caches()
+
+            if unit_of_work.error is not None:
+                raise unit_of_work.error
+
+    def in_transaction(self):
+        """Открыта ли в текущем потоке единица работы"""
+        return getattr(self._local, 'unit_of_work', None) is not None
+
+    def invalidate_caches(self):
+        """Сбрасывает все данные в памяти: после отката единицы работы или записи в обход методов DataBase"""
+        self._data_changed()
+        self.user_flags.forget()
+        self.reference_cache.invalidate()
+        self._ingredient_index = IngredientIndex()
+
+    def get_session_stats(self):
+        """Возвращает общее число сессий, соединений и запросов, счетчики последних действий и состояние пула"""
+        stats = self.session_metrics.get_stats()
+        stats['pool'] = self.engine.pool.status()
+        return stats
+
+    def release_thread_session(self):
+        """Закрывает и убирает из реестра сессию текущего потока (перед завершением потока)"""
+        self._local.thread_session = None
+        self._session_factory.remove()
+
+    def close(self):
+        """Закрывает сессию текущего потока и все соединения пула"""
+        self._local.thread_session = None
+        self._session_factory.remove()
+        self.engine.dispose()
+
+    # ===== УПРАВЛЕНИЕ ИНДЕКСАМИ =====
+    def _get_existing_index_names(self):
+        """Возвращает множество имен индексов, существующих в БД"""
+        with self.engine.connect() as connection:
+            rows = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+            return {row[0] for row in rows}
+
+    def ensure_indexes(self):
+        """Создает отсутствующие объявленные индексы и возвращает список созданных"""
+        existing = self._get_existing_index_names()
+        created = []
+
+        for index in DECLARED_INDEXES:
+            if index.name in existing:
+                continue
+
+            try:
+                if index.name == 'ux_favorites_user_recipe':
+                    self._deduplicate_favorites()
+                elif index.name == 'ux_cart_user_ingredient_unit':
+                    self._consolidate_cart_items()
+                index.create(self.engine, checkfirst=True)
+                created.append(index.name)
+            except Exception as e:
+                print(f"Ошибка создания индекса {index.name}: {e}")
+
+        for name in OBSOLETE_INDEXES:
+            if name in existing:
+                with self.engine.begin() as connection:
+                    connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+        return created
+
+    def _consolidate_cart_items(self):
+        """Заполняет числовое количество корзины, нормализует единицы и сливает повторяющиеся позиции"""
+        session = self.Session()
+        try:
+            groups = {}
+            for item in session.query(Cart).order_by(Cart.id):
+                unit = normalize_unit(item.unit)
+                groups.setdefault((item.user_id, item.ingredient_name, unit), []).append(item)
+
+            # Сначала удаляем лишние строки, чтобы обновление единиц не нарушило уникальный индекс
+            for items in groups.values():
+                for item in items[1:]:
+                    session.delete(item)
+            session.flush()
+
+            for (user_id, name, unit), items in groups.items():
+                amounts = [parse_amount(item.amount if item.amount is not None else item.quantity)
+                           for item in items]
+                numeric = [amount for amount in amounts if amount is not None]
+                first = items[0]
+                first.unit = unit
+                first.amount = sum(numeric) if numeric else None
+                if numeric:
+                    first.quantity = format_amount(first.amount)
+            session.commit()
+            self._data_changed()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _deduplicate_favorites(self):
+        """Удаляет повторяющиеся записи избранного перед созданием уникального индекса"""
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                'DELETE FROM "Favorites" WHERE rowid NOT IN '
+                '(SELECT MIN(rowid) FROM "Favorites" GROUP BY user_id, recipe_id)'
+            ))
+        self._data_changed()
+
+    def get_index_report(self):
+        """Возвращает сведения обо всех индексах БД: таблица, столбцы, уникальность и размер"""
+        declared_names = {index.name for index in DECLARED_INDEXES}
+        report = []
+
+        with self.engine.connect() as connection:
+            indexes = connection.execute(text(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name"
+            )).fetchall()
+
+            # Размер страниц индекса доступен только при наличии виртуальной таблицы dbstat
+            try:
+                sizes = dict(connection.execute(text(
+                    "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+                )).fetchall())
+            except Exception:
+                sizes = {}
+
+            for name, table_name in indexes:
+                info = connection.execute(text(f'PRAGMA index_info("{name}")')).fetchall()
+                unique = any(
+                    row[1] == name and row[2]
+                    for row in connection.execute(text(f'PRAGMA index_list("{table_name}")'))
+                )
+                report.append({
+                    'name': name,
+                    'table': table_name,
+                    'columns': [row[2] for row in info],
+                    'unique': unique,
+                    'declared': name in declared_names,
+                    'size_bytes': sizes.get(name)
+                })
+
+        return report
+
+    # ===== ПОЛНОТЕКСТОВЫЙ ПОИСК (FTS5) =====
+    def _migration_create_search_index(self):
+        """Миграция: создает FTS5-индекс рецептов, триггеры синхронизации и заполняет его"""
+        try:
+            with self.engine.begin() as connection:
+                try:
+                    connection.execute(text(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {RECIPES_FTS_TABLE} "
+                        "USING fts5(name, description, instruction, ingredients, "
+                        "tokenize = 'unicode61 remove_diacritics 2')"
+                    ))
+                except Exception:
+                    # Старые версии SQLite не поддерживают remove_diacritics 2
+                    connection.execute(text(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {RECIPES_FTS_TABLE} "
+                        "USING fts5(name, description, instruction, ingredients, tokenize = 'unicode61')"
+                    ))
+
+                for trigger_sql in RECIPES_FTS_TRIGGERS:
+                    connection.execute(text(trigger_sql))
+
+                connection.execute(text(f"DELETE FROM {RECIPES_FTS_TABLE}"))
+                connection.execute(text(_FTS_REFRESH_SQL.format(where='')))
+        except Exception as e:
+            # Без FTS5 поиск продолжает работать через LIKE
+            print(f"Полнотекстовый поиск недоступен: {e}")
+
+        self._fts_available = None
+
+    def _migration_create_user_stats(self):
+        """Миграция: таблица счетчиков профиля, триггеры их обновления и начальное заполнение"""
+        UserStats.__table__.create(self.engine, checkfirst=True)
+        with self.engine.begin() as connection:
+            for trigger_sql in USER_STATS_TRIGGERS:
+                connection.execute(text(trigger_sql))
+            self._rebuild_user_stats(connection)
+
+    def _migration_content_addressed_images(self):
+        """Миграция: переносит изображения в хранилище по хэшу содержимого и заводит image_refs
+
+        Копии одного файла под разными именами сливаются в один файл хранилища.
+        Файл переносится жесткой ссылкой: старое имя удаляется только после фиксации
+        новых ссылок, а стоковые изображения остаются на месте и делят файл с хранилищем.
+        """
+        ImageRef.__table__.create(self.engine, checkfirst=True)
+        moved = []
+        with self.engine.begin() as connection:
+            images = connection.execute(text(
+                'SELECT DISTINCT image FROM "Recipes" WHERE image IS NOT NULL'
+            )).scalars().all()
+            for image in images:
+                if RecipeImageStore.digest_of(image):
+                    continue
+                path = self.image_store.path(image)
+                new_image = self.image_store.put(path, link=True)
+                if new_image is None:
+                    continue
+                connection.execute(text('UPDATE "Recipes" SET image = :new WHERE image = :old'),
+                                   {'new': new_image, 'old': image})
+                if image not in STOCK_RECIPE_IMAGES:
+                    moved.append(path)
+
+            for trigger_sql in IMAGE_REFS_TRIGGERS:
+                connection.execute(text(trigger_sql))
+            self._rebuild_image_refs(connection)
+
+        for path in moved:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Не удалось удалить старый файл изображения {path}: {e}")
+        if moved:
+            self._data_changed()
+
+    def _migration_nutrition_primary_key(self):
+        """Миграция: пересоздает таблицу КБЖУ старых БД с первичным ключом recipe_id, как в модели
+
+        В исходной БД у Nutrition не было ключа; из повторяющихся строк рецепта остается последняя.
+        """
+        with self.engine.begin() as connection:
+            columns = connection.execute(text('PRAGMA table_info("Nutrition")')).fetchall()
+            if not columns or any(column[5] for column in columns):
+                return
+
+            # pysqlite сам не открывает транзакцию перед ALTER TABLE и CREATE TABLE
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            connection.execute(text('ALTER TABLE "Nutrition" RENAME TO "Nutrition_legacy"'))
+            Nutrition.__table__.create(connection)
+            connection.execute(text(
+                'INSERT INTO "Nutrition" (recipe_id, calories, proteins, fats, carbohydrates) '
+                'SELECT recipe_id, calories, proteins, fats, carbohydrates FROM "Nutrition_legacy" '
+                'WHERE rowid IN (SELECT MAX(rowid) FROM "Nutrition_legacy" GROUP BY recipe_id)'
+            ))
+            connection.execute(text('DROP TABLE "Nutrition_legacy"'))
+
+    def _migration_relocate_image_store(self):
+        """Миграция: переносит файлы хранилища из каталога изображений проекта к файлу БД
+
+        Раньше хранилище лежало в RECIPE_IMAGES_DIR рядом с исходниками. Копии стоковых
+        изображений заменяются жесткими ссылками на исходные файлы, остальные файлы переносятся.
+        """
+        store = self.image_store
+        stock_images = {}
+        for image_file in STOCK_RECIPE_IMAGES:
+            path = store.path(image_file)
+            if os.path.isfile(path):
+                with open(path, 'rb') as source:
+                    stock_images[hashlib.sha1(source.read()).hexdigest()] = path
+
+        with self.engine.connect() as connection:
+            images = connection.execute(text(
+                'SELECT DISTINCT image FROM "Recipes" WHERE image IS NOT NULL'
+            )).scalars().all()
+
+        for image in images:
+            digest = store.digest_of(image)
+            old_path = os.path.join(store.legacy_root, image)
+            if digest is None or not os.path.isfile(old_path):
+                continue
+            new_path = store.path(image)
+            if digest in stock_images:
+                store.put(stock_images[digest], link=True)
+                os.remove(old_path)
+            elif os.path.exists(new_path):
+                os.remove(old_path)
+            else:
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                shutil.move(old_path, new_path)
+            try:
+                os.rmdir(os.path.dirname(old_path))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _rebuild_image_refs(connection):
+        """Пересчитывает image_refs по таблице Recipes"""
+        connection.execute(text("DELETE FROM image_refs"))
+        connection.execute(text(
+            'INSERT INTO image_refs (image, refcount) '
+            'SELECT image, COUNT(*) FROM "Recipes" WHERE image IS NOT NULL GROUP BY image'
+        ))
+
+    def _release_image_after_commit(self, image):
+        """Освобождает изображение сейчас или, внутри единицы работы, после ее commit"""
+        unit_of_work = getattr(self._local, 'unit_of_work', None)
+        if unit_of_work is not None:
+            if image:
+                unit_of_work.released_images.append(image)
+            return
+        self.release_image(image)
+
+    def release_image(self, image):
+        """Удаляет файл изображения, если на него больше не ссылается ни один рецепт
+
+        Вызывается после фиксации удаления рецепта или смены его изображения;
+        счетчик ссылок читается по первичному ключу image_refs.
+        """
+        if not image:
+            return False
+        try:
+            with self.engine.begin() as connection:
+                refcount = connection.execute(
+                    select(ImageRef.refcount).where(ImageRef.image == image)
+                ).scalar()
+                if refcount:
+                    return False
+                if refcount is None and connection.execute(
+                    select(Recipe.id).where(Recipe.image == image).limit(1)
+                ).first() is not None:
+                    # Ссылки еще не учтены (таблицу image_refs не создали)
+                    return False
+                connection.execute(ImageRef.__table__.delete().where(ImageRef.image == image))
+            self.pixmap_cache.discard_image(image)
+            if image in STOCK_RECIPE_IMAGES:
+                return False
+            return self.image_store.remove(image)
+        except Exception as e:
+            print(f"Ошибка освобождения изображения {image}: {e}")
+            return False
+
+    @staticmethod
+    def _rebuild_user_stats(connection):
+        """Пересчитывает все счетчики user_stats по исходным таблицам"""
+        connection.execute(text("DELETE FROM user_stats"))
+        counters = ", ".join(counter for counter, _ in USER_STATS_SOURCES)
+        subqueries = ", ".join(
+            f'(SELECT COUNT(*) FROM "{table_name}" t WHERE t.user_id = u.id)'
+            for _, table_name in USER_STATS_SOURCES
+        )
+        connection.execute(text(
+            f'INSERT INTO user_stats (user_id, {counters}) SELECT u.id, {subqueries} FROM "Users" u'
+        ))
+
+    def is_fts_available(self):
+        """Проверяет (один раз за сеанс), что полнотекстовый индекс рецептов создан"""
+        if self._fts_available is None:
+            try:
+                with self.engine.connect() as connection:
+                    self._fts_available = connection.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+                    ), {'name': RECIPES_FTS_TABLE}).first() is not None
+            except Exception:
+                self._fts_available = False
+        return self._fts_available
+
+    def suspend_search_index(self, connection):
+        """Снимает триггеры вставки FTS-индекса в транзакции connection (для массовой загрузки)
+
+        Возвращает True, если индекс есть и его нужно заполнить через resume_search_index
+        в той же транзакции; при откате транзакции триггеры восстанавливаются сами.
+        """
+        if not self.is_fts_available():
+            return False
+        # pysqlite сам открывает транзакцию только перед INSERT/UPDATE/DELETE, а DROP TRIGGER
+        # должен откатываться вместе с пачкой
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        for trigger_name in RECIPES_FTS_INSERT_TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger_name}"))
+        return True
+
+    def resume_search_index(self, connection, first_id, last_id):
+        """Индексирует рецепты с id от first_id до last_id и возвращает триггеры вставки"""
+        connection.execute(text(f"DELETE FROM {RECIPES_FTS_TABLE} WHERE rowid BETWEEN :first_id AND :last_id"),
+                           {'first_id': first_id, 'last_id': last_id})
+        connection.execute(text(_FTS_REFRESH_SQL.format(where='WHERE r.id BETWEEN :first_id AND :last_id')),
+                           {'first_id': first_id, 'last_id': last_id})
+        for trigger_sql in RECIPES_FTS_TRIGGERS:
+            connection.execute(text(trigger_sql))
+
+    def _fts_ranked_subquery(self, match_expression):
+        """Подзапрос (recipe_id, rank) по FTS5-индексу; меньший rank - более релевантный результат"""
+        weights = ", ".join(str(weight) for weight in RECIPES_FTS_WEIGHTS)
+        return text(
+            f"SELECT rowid AS recipe_id, bm25({RECIPES_FTS_TABLE}, {weights}) AS rank "
+            f"FROM {RECIPES_FTS_TABLE} WHERE {RECIPES_FTS_TABLE} MATCH :match"
+        ).bindparams(match=match_expression).columns(
+            recipe_id=Integer, rank=Float
+        ).subquery('fts')
+
+    def search_recipe_ids(self, search_text, column=None, limit=None):
+        """Возвращает id рецептов, найденных полнотекстовым поиском, в порядке релевантности (BM25)"""
+        match_expression = build_fts_query(search_text, column)
+        if not match_expression or not self.is_fts_available():
+            return []
+
+        session = self.Session()
+        try:
+            fts = self._fts_ranked_subquery(match_expression)
+            query = session.query(fts.c.recipe_id).order_by(fts.c.rank)
+            if limit:
+                query = query.limit(limit)
+            return [row.recipe_id for row in query.all()]
+        except Exception as e:
+            return []
+        finally:
+            session.close()
+
+    def suggest_recipe_names(self, prefix, limit=10):
+        """Подсказки названий рецептов по префиксам слов, упорядоченные по релевантности"""
+        match_expression = build_fts_query(prefix, column='name')
+        if not match_expression or not self.is_fts_available():
+            return []
+
+        session = self.Session()
+        try:
+            fts = self._fts_ranked_subquery(match_expression)
+            rows = session.query(Recipe.name).join(
+                fts, fts.c.recipe_id == Recipe.id
+            ).order_by(fts.c.rank).limit(limit).all()
+            return [row.name for row in rows]
+        except Exception as e:
+            return []
+        finally:
+            session.close()
+
+    def get_recipe_names(self):
+        """Возвращает названия всех рецептов (подсказки поиска без FTS5)"""
+        session = self.Session()
         try:
-            # Создаем все таблицы из моделей
-            Base.metadata.create_all(self.engine)
+            return [row.name for row in session.query(Recipe.name).all()]
+        except Exception as e:
+            return []
+        finally:
+            session.close()
 
+    def _migration_create_tables(self):
+        """Миграция: создает все таблицы из моделей"""
+        Base.metadata.create_all(self.engine)
+
+        # Создаем дополнительные таблицы если их нет
+        self._create_additional_tables()
+
+    def _migration_numeric_quantities(self):
+        """Миграция: числовое количество и нормализованная единица для ингредиентов рецептов и корзины
+
+        Исходная текстовая запись количества сохраняется в столбце quantity.
+        """
+        with self.engine.begin() as connection:
+            for table_name, columns in (('Recipe_ingredients', (('amount', 'REAL'), ('unit', 'VARCHAR(50)'))),
+                                        ('cart', (('amount', 'REAL'),))):
+                existing = {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table_name}")'))}
+                for column_name, column_type in columns:
+                    if column_name not in existing:
+                        connection.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {column_type}'))
+
+            self._fill_ingredient_amounts(connection)
+
+        self._consolidate_cart_items()
+
+    def _migration_reparse_ingredient_units(self):
+        """Миграция: заново разбирает количества ингредиентов реестром единиц
+
+        Версия 7: прежний разбор принимал столовые ложки за стаканы, а зубчики - за граммы.
+        Версия 12: смешанные дроби ("1 1/2") и диапазоны ("2-3") теряли часть числа, а
+        ошибочные записи ("1/0 г") получали выдуманную единицу вместо текста.
+        """
+        with self.engine.begin() as connection:
+            self._fill_ingredient_amounts(connection)
+
+        self._consolidate_cart_items()
+
+    def _fill_ingredient_amounts(self, connection):
+        """Заполняет amount и unit ингредиентов рецептов по исходной записи quantity"""
+        rows = connection.execute(text('SELECT rowid, quantity FROM "Recipe_ingredients"')).fetchall()
+        updates = []
+        for rowid, quantity in rows:
+            amount, unit = self._parse_quantity(quantity)
+            updates.append({'row_id': rowid, 'amount': amount, 'unit': normalize_unit(unit) if unit else None})
+        if updates:
+            connection.execute(
+                text('UPDATE "Recipe_ingredients" SET amount = :amount, unit = :unit WHERE rowid = :row_id'),
+                updates
+            )
+
+    def _migrate_database(self):
+        """Миграция: добавляет стандартные типы блюд"""
+        try:
             session = self.Session()
             try:
                 dish_type_names = ["Салаты", "Десерты", "Основные блюда", "Завтраки", "Гарниры", "Супы"]
@@ -189,9 +2272,12 @@ class DataBase:
                         session.add(dish_type)
 
                 session.commit()
+                self._data_changed()
             finally:
                 session.close()
 
+            self.reference_cache.invalidate('dish_types')
+
         except Exception as e:
             raise
 
@@ -204,6 +2290,9 @@ class DataBase:
 
             for recipe in recipes:
                 if recipe.image and isinstance(recipe.image, str):
+                    # Имена хранилища изображений ("xx/<sha1>.jpg") уже относительные
+                    if RecipeImageStore.digest_of(recipe.image):
+                        continue
                     if '/' in recipe.image or '\\' in recipe.image:
                         old_path = recipe.image
                         new_filename = os.path.basename(old_path)
@@ -212,21 +2301,24 @@ class DataBase:
 
             if migrated_count > 0:
                 session.commit()
+                self._data_changed()
 
-        except Exception as e:
+        except Exception:
+            # Миграция с ошибкой не записывается в schema_version и повторится при следующем запуске
             session.rollback()
+            raise
         finally:
             session.close()
 
     def assign_unique_images_to_recipes(self):
-        """Назначает каждому рецепту уникальное изображение на основе его названия"""
+        """Назначает рецептам без изображения стоковое изображение по названию
+
+        Файлы кладутся в хранилище по содержимому (RecipeImageStore): рецепты с одним
+        и тем же стоковым изображением ссылаются на один файл, копии не создаются.
+        """
         session = self.Session()
         try:
-            available_images = [
-                'apple_pie.jpg', 'cabbage_rolls.jpg', 'caesar.jpg',
-                'mashed_potatoes.jpg', 'olivier.jpg', 'ramen.jpg',
-                'french_toast.jpg', 'pasta_carbonara.jpg'
-            ]
+            available_images = list(STOCK_RECIPE_IMAGES)
 
             keyword_mapping = {
                 'яблочн': 'apple_pie.jpg',
@@ -252,141 +2344,39 @@ class DataBase:
             }
 
             recipes = session.query(Recipe).all()
-
-            used_images = set()
             updated_count = 0
+            stored_images = {}      # стоковый файл -> имя в хранилище
 
             for recipe in recipes:
                 # Пропускаем рецепты, у которых уже есть изображение
                 if recipe.image and recipe.image.strip():
-                    used_images.add(recipe.image)
                     continue
 
+                # Сначала ищем по ключевым словам, затем выбираем по хэшу названия
                 recipe_name_lower = recipe.name.lower()
-                image_assigned = False
-
-                # Сначала проверяем по ключевым словам
-                for keyword, image_file in keyword_mapping.items():
-                    if keyword in recipe_name_lower:
-                        # Создаем уникальное имя для изображения
-                        import hashlib
-                        recipe_hash = hashlib.md5(f"{recipe.id}_{recipe.name}".encode()).hexdigest()[:8]
-                        unique_image_name = f"{recipe_hash}_{image_file}"
-
-                        # Копируем изображение с уникальным именем
-                        current_dir = os.path.dirname(os.path.abspath(__file__))
-                        project_root = os.path.dirname(current_dir)
-                        images_dir = os.path.join(project_root, 'img', 'recipe_img')
-
-                        original_path = os.path.join(images_dir, image_file)
-                        unique_path = os.path.join(images_dir, unique_image_name)
-
-                        if os.path.exists(original_path):
-                            try:
-                                import shutil
-                                shutil.copy2(original_path, unique_path)
-                                recipe.image = unique_image_name
-                                used_images.add(unique_image_name)
-                                updated_count += 1
-                                image_assigned = True
-                                break
-                            except Exception as e:
-                                continue
-
-                # Если не назначили по ключевому слову, используем хэш
-                if not image_assigned and available_images:
-                    import hashlib
-                    recipe_hash = hashlib.md5(f"{recipe.id}_{recipe.name}".encode()).hexdigest()[:8]
-                    hash_int = int(hashlib.md5(recipe.name.encode()).hexdigest()[:8], 16)
-                    image_index = hash_int % len(available_images)
-
-                    for i in range(len(available_images)):
-                        current_index = (image_index + i) % len(available_images)
-                        image_file = available_images[current_index]
-
-                        # Создаем уникальное имя
-                        unique_image_name = f"{recipe_hash}_{image_file}"
-
-                        if unique_image_name not in used_images:
-                            # Копируем изображение
-                            current_dir = os.path.dirname(os.path.abspath(__file__))
-                            project_root = os.path.dirname(current_dir)
-                            images_dir = os.path.join(project_root, 'img', 'recipe_img')
-
-                            original_path = os.path.join(images_dir, image_file)
-                            unique_path = os.path.join(images_dir, unique_image_name)
-
-                            if os.path.exists(original_path):
-                                try:
-                                    import shutil
-                                    shutil.copy2(original_path, unique_path)
-                                    recipe.image = unique_image_name
-                                    used_images.add(unique_image_name)
-                                    updated_count += 1
-                                    image_assigned = True
-                                    break
-                                except Exception as e:
-                                    continue
-
-                if not image_assigned and available_images:
-                    # Если всё ещё не назначили, создаем последний вариант
-                    import hashlib
-                    recipe_hash = hashlib.md5(f"{recipe.id}_{recipe.name}".encode()).hexdigest()[:8]
-                    unique_image_name = f"{recipe_hash}_{available_images[0]}"
-
-                    # Копируем изображение
-                    current_dir = os.path.dirname(os.path.abspath(__file__))
-                    project_root = os.path.dirname(current_dir)
-                    images_dir = os.path.join(project_root, 'img', 'recipe_img')
-
-                    original_path = os.path.join(images_dir, available_images[0])
-                    unique_path = os.path.join(images_dir, unique_image_name)
-
-                    if os.path.exists(original_path):
-                        try:
-                            import shutil
-                            shutil.copy2(original_path, unique_path)
-                            recipe.image = unique_image_name
-                            updated_count += 1
-                        except Exception as e:
-                            pass
+                candidates = [image_file for keyword, image_file in keyword_mapping.items()
+                              if keyword in recipe_name_lower][:1]
+                hash_int = int(hashlib.md5(recipe.name.encode()).hexdigest()[:8], 16)
+                image_index = hash_int % len(available_images)
+                candidates += available_images[image_index:] + available_images[:image_index]
+
+                for image_file in candidates:
+                    if image_file not in stored_images:
+                        stored_images[image_file] = self.image_store.put(
+                            self.image_store.path(image_file), link=True
+                        )
+                    image_name = stored_images[image_file]
+                    if image_name:
+                        recipe.image = image_name
+                        updated_count += 1
+                        break
 
             session.commit()
-            self._verify_image_assignments()
+            self._data_changed()
 
-        except Exception as e:
+        except Exception:
             session.rollback()
-            import traceback
-            print(traceback.format_exc())
-        finally:
-            session.close()
-
-    def _verify_image_assignments(self):
-        """Проверяет, что все рецепты имеют уникальные изображения"""
-        session = self.Session()
-        try:
-            recipes = session.query(Recipe).all()
-            image_count = {}
-
-            for recipe in recipes:
-                if recipe.image:
-                    if recipe.image in image_count:
-                        image_count[recipe.image] += 1
-                    else:
-                        image_count[recipe.image] = 1
-
-            for image_file, count in image_count.items():
-                status = "OK" if count == 1 else "ПОВТОР"
-                print(f"{image_file}: {count} рецептов - {status}")
-
-            recipes_without_images = [r for r in recipes if not r.image]
-            if recipes_without_images:
-                print(f"Рецепты без изображений: {len(recipes_without_images)}")
-                for recipe in recipes_without_images:
-                    print(f"  - {recipe.name}")
-
-        except Exception as e:
-            print(f"Ошибка при проверке назначения изображений: {e}")
+            raise
         finally:
             session.close()
 
@@ -398,20 +2388,17 @@ class DataBase:
             recipes_with_images = session.query(Recipe).filter(Recipe.image.isnot(None)).all()
 
             available_images = 0
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.dirname(current_dir)
-            images_dir = os.path.join(project_root, 'img', 'recipe_img')
 
             for recipe in recipes_with_images:
                 if recipe.image and isinstance(recipe.image, str):
-                    image_path = os.path.join(images_dir, recipe.image)
+                    image_path = self.image_store.path(recipe.image)
                     if os.path.exists(image_path):
                         available_images += 1
 
             recipes = session.query(Recipe).all()
             for recipe in recipes:
                 if recipe.image:
-                    image_path = os.path.join(images_dir, recipe.image)
+                    image_path = self.image_store.path(recipe.image)
                     status = "Есть файл" if os.path.exists(image_path) else "Файл не найден"
                 else:
                     status = "Нет изображения"
@@ -465,8 +2452,8 @@ class DataBase:
 
 
     # ===== МЕТОДЫ ДЛЯ РАБОТЫ С КАТЕГОРИЯМИ =====
-    def get_dish_types(self):
-        """Получает список типов блюд"""
+    def _load_dish_types(self):
+        """Загружает список типов блюд из БД (источник для кэша справочников)"""
         session = self.Session()
         try:
             dish_types = session.query(Dish_types).all()
@@ -474,8 +2461,8 @@ class DataBase:
         finally:
             session.close()
 
-    def get_cuisines(self):
-        """Получает список кухонь"""
+    def _load_cuisines(self):
+        """Загружает список кухонь из БД (источник для кэша справочников)"""
         session = self.Session()
         try:
             cuisines = session.query(Cuisines).all()
@@ -483,23 +2470,25 @@ class DataBase:
         finally:
             session.close()
 
+    def get_dish_types(self):
+        """Получает список типов блюд"""
+        return self.reference_cache.get('dish_types')
+
+    def get_cuisines(self):
+        """Получает список кухонь"""
+        return self.reference_cache.get('cuisines')
+
     def get_dish_type_by_name(self, dish_type_name):
         """Получает ID типа блюда по названию"""
-        session = self.Session()
-        try:
-            dish_type = session.query(Dish_types).filter(Dish_types.name == dish_type_name).first()
-            return dish_type.id if dish_type else None
-        finally:
-            session.close()
+        return self.reference_cache.id_by_name('dish_types', dish_type_name)
 
     def get_cuisine_by_name(self, cuisine_name):
         """Получает ID кухни по названию"""
-        session = self.Session()
-        try:
-            cuisine = session.query(Cuisines).filter(Cuisines.name == cuisine_name).first()
-            return cuisine.id if cuisine else None
-        finally:
-            session.close()
+        return self.reference_cache.id_by_name('cuisines', cuisine_name)
+
+    def get_reference_cache_stats(self):
+        """Возвращает статистику кэша справочников (попадания, промахи)"""
+        return self.reference_cache.get_stats()
 
     def get_categories(self):
         """Получение всех категорий"""
@@ -537,7 +2526,7 @@ class DataBase:
             recipe = session.query(Recipe).filter_by(id=recipe_id).first()
 
             if recipe and recipe.image:
-                image_path = f"../img/recipe_img/{recipe.image}"
+                image_path = self.image_store.path(recipe.image)
                 from PyQt6.QtGui import QPixmap
                 pixmap = QPixmap(image_path)
                 if not pixmap.isNull():
@@ -551,6 +2540,54 @@ class DataBase:
         except Exception as e:
             return self._create_text_pixmap("Изображение")
 
+    def get_recipe_thumbnail(self, image, width, height, expand=False, placeholder=None):
+        """Миниатюра изображения рецепта по имени файла (без обращения к БД)
+
+        Имя файла берется из строки списка рецептов (RecipeRow.image). Возвращает
+        QPixmap размера width x height: сначала из кэша в памяти, затем из дискового
+        кэша миниатюр; если изображения нет, а placeholder задан - текстовую
+        заглушку того же размера, иначе None.
+        """
+        if image:
+            pixmap = self.get_cached_thumbnail(image, width, height, expand)
+            if pixmap is not None:
+                return pixmap
+            try:
+                thumbnail = self.thumbnails.get(image, width, height, expand)
+                if thumbnail is not None:
+                    return self.store_thumbnail(image, width, height, expand, thumbnail)
+            except Exception as e:
+                print(f"Ошибка загрузки миниатюры {image}: {e}")
+
+        if placeholder is None:
+            return None
+        return self.get_placeholder_pixmap(placeholder, width, height, expand)
+
+    def get_cached_thumbnail(self, image, width, height, expand=False):
+        """QPixmap миниатюры из кэша в памяти или None (без обращения к диску)"""
+        return self.pixmap_cache.get(('image', image, width, height, expand))
+
+    def store_thumbnail(self, image, width, height, expand, thumbnail):
+        """Превращает QImage миниатюры в QPixmap, кладет в кэш в памяти и возвращает его"""
+        from PyQt6.QtGui import QPixmap
+
+        pixmap = QPixmap.fromImage(thumbnail)
+        self.pixmap_cache.put(('image', image, width, height, expand), pixmap)
+        return pixmap
+
+    def get_placeholder_pixmap(self, text, width, height, expand=False):
+        """Текстовая заглушка размера width x height (из кэша, если уже рисовалась)"""
+        from PyQt6.QtCore import Qt
+
+        key = ('text', text, width, height, expand)
+        pixmap = self.pixmap_cache.get(key)
+        if pixmap is None:
+            mode = Qt.AspectRatioMode.KeepAspectRatioByExpanding if expand else Qt.AspectRatioMode.KeepAspectRatio
+            pixmap = self._create_text_pixmap(text).scaled(width, height, mode,
+                                                           Qt.TransformationMode.SmoothTransformation)
+            self.pixmap_cache.put(key, pixmap)
+        return pixmap
+
     def _create_text_pixmap(self, text):
         """Создает QPixmap с текстовой заглушкой"""
         from PyQt6.QtGui import QPixmap, QPainter, QColor, QFont
@@ -573,91 +2610,62 @@ class DataBase:
 
         return pixmap
 
+    @staticmethod
+    def _ingredient_quantity_values(quantity, unit):
+        """Значения столбцов quantity/amount/unit для записи ингредиента рецепта"""
+        amount = parse_amount(quantity)
+        unit = normalize_unit(unit)
+        if amount is None:
+            return {'quantity': str(quantity), 'amount': None, 'unit': unit}
+        return {'quantity': f"{format_amount(amount)} {unit}".strip(), 'amount': amount, 'unit': unit}
+
     def _parse_quantity(self, quantity_str):
         """Парсит количество из строки в числовое значение и определяет единицу измерения"""
         try:
             if isinstance(quantity_str, (int, float)):
                 return float(quantity_str), 'г'
 
-            numbers = re.findall(r'\d+\.?\d*', str(quantity_str))
-            if numbers:
-                quantity = float(numbers[0])
-                unit = 'г'
-                quantity_lower = str(quantity_str).lower()
-
-                if 'шт' in quantity_lower or 'штук' in quantity_lower:
-                    unit = 'шт'
-                elif 'ст' in quantity_lower or 'стакан' in quantity_lower:
-                    unit = 'стакан'
-                elif 'ст.л.' in quantity_lower or 'стол' in quantity_lower:
-                    unit = 'ст.л.'
-                elif 'ч.л.' in quantity_lower or 'чай' in quantity_lower:
-                    unit = 'ч.л.'
-                elif 'мл' in quantity_lower:
-                    unit = 'мл'
-                elif 'л' in quantity_lower and 'мл' not in quantity_lower:
-                    unit = 'л'
-                elif 'кг' in quantity_lower:
-                    unit = 'кг'
-                elif 'г' in quantity_lower and 'кг' not in quantity_lower:
-                    unit = 'г'
-
-                return quantity, unit
-            else:
-                return 1.0, str(quantity_str)
+            # Единица ищется реестром по самому длинному совпадению ("ст.л." раньше "ст.")
+            quantity, unit = UNITS.parse(quantity_str)
+            if quantity is None:
+                # Единица без числа ("щепотка") означает одну единицу, прочая запись остается текстом
+                return (1.0, unit) if unit else (None, None)
+            return quantity, unit or 'г'
 
         except Exception as e:
-            return 1.0, 'шт'
+            return None, None
 
-    def save_recipe_image(self, image_data, recipe_id, recipe_name):
-        """Сохраняет изображение рецепта с уникальным именем и возвращает имя файла"""
-        try:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.dirname(current_dir)
-            images_dir = os.path.join(project_root, 'img', 'recipe_img')
-            os.makedirs(images_dir, exist_ok=True)
-
-            # Создаем уникальное имя файла на основе ID рецепта
-            import hashlib
-            recipe_hash = hashlib.md5(f"{recipe_id}_{recipe_name}".encode()).hexdigest()[:8]
-
-            # Определяем расширение файла
-            if isinstance(image_data, str) and os.path.exists(image_data):
-                extension = os.path.splitext(image_data)[1].lower()
-            else:
-                extension = '.jpg'
-
-            image_filename = f"user_{recipe_hash}{extension}"
-            image_path = os.path.join(images_dir, image_filename)
-
-            if isinstance(image_data, bytes):
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
-            elif isinstance(image_data, str) and os.path.exists(image_data):
-                shutil.copy2(image_data, image_path)
-            else:
-                return None
-
-            return image_filename
+    def save_recipe_image(self, image_data, recipe_id=None, recipe_name=None):
+        """Сохраняет изображение рецепта в хранилище и возвращает имя файла
 
+        Имя определяется содержимым (RecipeImageStore), поэтому одинаковые изображения
+        разных рецептов хранятся одним файлом. recipe_id и recipe_name оставлены
+        для совместимости вызовов.
+        """
+        try:
+            return self.image_store.put(image_data)
         except Exception as e:
+            print(f"Ошибка сохранения изображения: {e}")
             return None
 
     def add_recipe(self, user_id, name, instruction, description, dish_type_id, cuisine_id,
-                   cook_time, ingredients_list, nutrition_data, image=None):
+                   cook_time, ingredients_list, nutrition_data, image=None, servings=None, external_url=None):
         """Добавление нового рецепта"""
         session = self.Session()
         try:
 
             # Проверяем существование dish_type_id и cuisine_id
+            # rollback() перед отказом отменяет и открытую единицу работы
             if dish_type_id:
                 dish_type = session.query(Dish_types).get(dish_type_id)
                 if not dish_type:
+                    session.rollback()
                     return None
 
             if cuisine_id:
                 cuisine = session.query(Cuisines).get(cuisine_id)
                 if not cuisine:
+                    session.rollback()
                     return None
 
             # Создаем рецепт
@@ -668,7 +2676,9 @@ class DataBase:
                 description=description,
                 dish_type_id=dish_type_id,
                 cuisine_id=cuisine_id,
-                cook_time=cook_time
+                cook_time=cook_time,
+                servings=servings,
+                external_url=external_url
             )
             session.add(new_recipe)
             session.flush()
@@ -687,7 +2697,7 @@ class DataBase:
                 recipe_ingredient = recipe_ingredients.insert().values(
                     recipe_id=new_recipe.id,
                     ingredient_id=ing_id,
-                    quantity=quantity
+                    **self._ingredient_quantity_values(quantity, unit)
                 )
                 session.execute(recipe_ingredient)
 
@@ -702,8 +2712,12 @@ class DataBase:
                 )
                 session.add(nutrition)
 
+            recipe_id = new_recipe.id
             session.commit()
-            return new_recipe.id
+            self._data_changed()
+
+            self._ingredient_index.set_recipe(recipe_id, [ing_id for ing_id, _, _ in ingredients_list])
+            return recipe_id
 
         except Exception as e:
             session.rollback()
@@ -711,22 +2725,46 @@ class DataBase:
         finally:
             session.close()
 
-    def get_recipe_by_id(self, recipe_id):
-        """Получает рецепт по ID"""
+    def get_recipe_by_id(self, recipe_id, user_id=None):
+        """Получает рецепт по ID как RecipeRow с инструкцией и описанием (или None)
+
+        Возвращается отвязанная от сессии строка значений, а не объект ORM, поэтому ее
+        можно передавать между потоками. Статусы избранного и приготовления - для user_id.
+        """
         session = self.Session()
         try:
-            recipe = session.query(Recipe).filter_by(id=recipe_id).first()
-            return recipe
+            row = self._recipe_listing_query(session, user_id, with_text=True).filter(
+                Recipe.id == recipe_id
+            ).first()
+            return self._listing_row_to_tuple(row) if row else None
         except Exception:
             return None
         finally:
             session.close()
 
+    def get_recipe_text(self, recipe_id):
+        """Возвращает (инструкция, описание) рецепта - длинные поля, не входящие в проекцию карточек"""
+        session = self.Session()
+        try:
+            row = session.query(Recipe.instruction, Recipe.description).filter(Recipe.id == recipe_id).first()
+            return (row.instruction, row.description) if row else (None, None)
+        except Exception:
+            return None, None
+        finally:
+            session.close()
+
+    def with_recipe_text(self, recipe_row):
+        """Дополняет строку карточки инструкцией и описанием"""
+        if recipe_row.has_text:
+            return recipe_row
+        instruction, description = self.get_recipe_text(recipe_row.id)
+        return recipe_row._replace(instruction=instruction, description=description)
+
     def get_dish_types_with_objects(self):
-        """Получает список типов блюд как объекты (для обратной совместимости)"""
+        """Получает список типов блюд как строки с атрибутами id и name (для обратной совместимости)"""
         session = self.Session()
         try:
-            dish_types = session.query(Dish_types).all()
+            dish_types = session.query(Dish_types.id, Dish_types.name).all()
             return dish_types
         except Exception:
             return []
@@ -734,10 +2772,10 @@ class DataBase:
             session.close()
 
     def get_cuisines_with_objects(self):
-        """Получает список кухонь как объекты (для обратной совместимости)"""
+        """Получает список кухонь как строки с атрибутами id и name (для обратной совместимости)"""
         session = self.Session()
         try:
-            cuisines = session.query(Cuisines).all()
+            cuisines = session.query(Cuisines.id, Cuisines.name).all()
             return cuisines
         except Exception:
             return []
@@ -760,12 +2798,16 @@ class DataBase:
         return self.mark_recipe_as_cooked(user_id, recipe_id, cooked)
 
     def update_recipe(self, recipe_id, name, instruction, description, dish_type_id, cuisine_id,
-                      cook_time, ingredients_list, nutrition_data, image=None):
-        """Обновление существующего рецепта с раздельными полями для типа блюда и кухни"""
+                      cook_time, ingredients_list, nutrition_data, image=None, servings=None, external_url=None):
+        """Обновление существующего рецепта с раздельными полями для типа блюда и кухни
+
+        servings и external_url меняются, только если переданы (не None).
+        """
         session = self.Session()
         try:
             recipe = session.query(Recipe).filter_by(id=recipe_id).first()
             if not recipe:
+                session.rollback()
                 return False
 
             # Обновляем основные данные
@@ -775,11 +2817,17 @@ class DataBase:
             recipe.dish_type_id = dish_type_id
             recipe.cuisine_id = cuisine_id
             recipe.cook_time = cook_time
+            if servings is not None:
+                recipe.servings = servings
+            if external_url is not None:
+                recipe.external_url = external_url
 
             # Обрабатываем изображение если оно есть
+            old_image = recipe.image
             if image:
                 image_filename = self.save_recipe_image(image, recipe_id, name)
-                recipe.image = image_filename
+                if image_filename:
+                    recipe.image = image_filename
 
             # Обновляем ингредиенты
             session.execute(
@@ -790,7 +2838,7 @@ class DataBase:
                     recipe_ingredients.insert().values(
                         recipe_id=recipe_id,
                         ingredient_id=ing_id,
-                        quantity=quantity
+                        **self._ingredient_quantity_values(quantity, unit)
                     )
                 )
 
@@ -810,6 +2858,11 @@ class DataBase:
                 session.add(new_nutrition)
 
             session.commit()
+            self._data_changed()
+
+            if old_image and old_image != recipe.image:
+                self._release_image_after_commit(old_image)
+            self._ingredient_index.set_recipe(recipe_id, [ing_id for ing_id, _, _ in ingredients_list])
             return True
 
         except Exception as e:
@@ -818,140 +2871,210 @@ class DataBase:
         finally:
             session.close()
 
+    # ===== ДВИЖОК ВЫБОРКИ СПИСКОВ РЕЦЕПТОВ =====
+    def _recipe_listing_query(self, session, user_id, with_text=False):
+        """Строит единый запрос списка рецептов: рецепт, тип блюда, кухня, КБЖУ и статусы пользователя.
+
+        Статусы избранного и приготовления вычисляются через EXISTS в том же SQL-запросе,
+        поэтому количество обращений к БД не зависит от числа найденных рецептов.
+        Без with_text выбирается проекция для карточек: инструкция и описание не читаются.
+        """
+        is_favorite = exists().where(
+            (favorites.c.user_id == user_id) &
+            (favorites.c.recipe_id == Recipe.id)
+        ).correlate(Recipe).label('is_favorite')
+
+        is_cooked = exists().where(
+            (CookedRecipe.user_id == user_id) &
+            (CookedRecipe.recipe_id == Recipe.id)
+        ).correlate(Recipe).label('is_cooked')
+
+        if with_text:
+            instruction, description = Recipe.instruction, Recipe.description
+        else:
+            instruction = null().label('instruction')
+            description = null().label('description')
+
+        return session.query(
+            Recipe.id,
+            Recipe.user_id,
+            Recipe.name,
+            instruction,
+            description,
+            Recipe.dish_type_id,
+            Recipe.image,
+            Recipe.external_url,
+            Recipe.cook_time,
+            Dish_types.name.label('dish_type_name'),
+            Cuisines.name.label('cuisine_name'),
+            Nutrition.calories,
+            Nutrition.proteins,
+            Nutrition.fats,
+            Nutrition.carbohydrates,
+            is_favorite,
+            is_cooked,
+            Recipe.cuisine_id,
+            Recipe.servings
+        ).outerjoin(
+            Dish_types, Recipe.dish_type_id == Dish_types.id
+        ).outerjoin(
+            Cuisines, Recipe.cuisine_id == Cuisines.id
+        ).outerjoin(
+            Nutrition, Nutrition.recipe_id == Recipe.id
+        )
+
+    @staticmethod
+    def _listing_row_to_tuple(row, default_dish_type=None, default_cuisine=None):
+        """Преобразует строку движка выборки в RecipeRow"""
+        dish_type = row.dish_type_name or default_dish_type
+        cuisine_name = row.cuisine_name or default_cuisine
+        return RecipeRow(
+            row.id,
+            row.user_id,
+            row.name,
+            row.instruction,
+            row.description,
+            row.dish_type_id,
+            row.image,
+            row.external_url,
+            row.cook_time,
+            dish_type,
+            None,
+            row.calories,
+            row.proteins,
+            row.fats,
+            row.carbohydrates,
+            bool(row.is_favorite),
+            bool(row.is_cooked),
+            cuisine_name,
+            dish_type,
+            row.cuisine_id,
+            row.servings
+        )
+
+    @staticmethod
+    def _listing_filter_key(user_id, cuisine=None, max_time=None, favorites_only=False,
+                            cooked_only=False, ingredient_filter=None, name_filter=None):
+        """Приводит фильтры списка рецептов к каноническому кортежу (он же ключ кэша)"""
+        if cuisine == "Любая кухня":
+            cuisine = None
+        if not (ingredient_filter and isinstance(ingredient_filter, list)):
+            ingredient_filter = None
+        name_filter = name_filter.strip() if name_filter and name_filter.strip() else None
+
+        return (
+            user_id, cuisine, max_time or None, bool(favorites_only), bool(cooked_only),
+            frozenset(ingredient_filter) if ingredient_filter else None, name_filter
+        )
+
+    def _filtered_listing_query(self, session, filters):
+        """Строит запрос списка рецептов с фильтрами
+
+        Возвращает (query, ingredient_recipe_ids). ingredient_recipe_ids - множество id,
+        если набор рецептов по ингредиентам слишком велик для IN и строки нужно
+        проверять по нему при обходе, иначе None. Если ни один рецепт не подходит по ингредиентам,
+        возвращает (None, None).
+        """
+        user_id, cuisine, max_time, favorites_only, cooked_only, ingredient_filter, name_filter = filters
+        query = self._recipe_listing_query(session, user_id)
+
+        # Фильтр по кухне
+        if cuisine:
+            query = query.filter(Cuisines.name == cuisine)
+
+        # Фильтр по времени приготовления
+        if max_time:
+            query = query.filter(Recipe.cook_time <= max_time)
+
+        # Фильтр по избранному
+        if favorites_only:
+            favorite_subquery = session.query(favorites.c.recipe_id).filter(
+                favorites.c.user_id == user_id
+            ).subquery()
+            query = query.filter(Recipe.id.in_(favorite_subquery))
+
+        # Фильтр по приготовленным рецептам
+        if cooked_only:
+            cooked_subquery = session.query(CookedRecipe.recipe_id).filter_by(user_id=user_id).subquery()
+            query = query.filter(Recipe.id.in_(cooked_subquery))
+
+        # Фильтр по названию: префиксный поиск по FTS5-индексу с ранжированием BM25,
+        # при его отсутствии - LIKE по вариантам регистра
+        name_match = build_fts_query(name_filter, column='name') if name_filter else None
+        if name_match and self.is_fts_available():
+            fts = self._fts_ranked_subquery(name_match)
+            query = query.join(fts, fts.c.recipe_id == Recipe.id).order_by(fts.c.rank)
+        elif name_filter:
+            search_terms = [
+                f"%{name_filter}%",
+                f"%{name_filter.lower()}%",
+                f"%{name_filter.upper()}%",
+                f"%{name_filter.title()}%",
+            ]
+            search_terms = list(set(search_terms))
+            conditions = []
+            for term in search_terms:
+                conditions.append(Recipe.name.ilike(term))
+            query = query.filter(or_(*conditions))
+
+        # Фильтр по ингредиентам - рецепт должен содержать ВСЕ указанные ингредиенты.
+        # Пересечение вычисляется в памяти по инвертированному индексу (побитовое AND)
+        ingredient_recipe_ids = None
+        if ingredient_filter:
+            ingredient_bitmap = self.get_ingredient_index().recipes_with_all(ingredient_filter)
+            if not ingredient_bitmap:
+                return None, None
+
+            # Небольшой набор id передаем в SQL, большой проверяем по множеству при обходе
+            recipe_ids = IngredientIndex.bitmap_to_ids(ingredient_bitmap)
+            if len(recipe_ids) <= self.MAX_SQL_IN_IDS:
+                query = query.filter(Recipe.id.in_(recipe_ids))
+            else:
+                ingredient_recipe_ids = set(recipe_ids)
+
+        return query, ingredient_recipe_ids
+
     def get_recipes_with_filters(self, user_id, cuisine=None, max_time=None,
                                  favorites_only=False, cooked_only=False,
                                  ingredient_filter=None, name_filter=None):
-        """Получение рецептов с фильтрами с группировкой по типам блюд"""
+        """Получение рецептов с фильтрами с группировкой по типам блюд
+
+        Результат запоминается в кэше по комбинации фильтров до следующего
+        изменения данных.
+        """
+        key = self._listing_filter_key(user_id, cuisine, max_time, favorites_only,
+                                       cooked_only, ingredient_filter, name_filter)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return {dish_type: list(recipes) for dish_type, recipes in cached.items()}
+
+        generation = self.result_cache.generation
+        try:
+            grouped_recipes = self._query_recipes_with_filters(key)
+        except Exception as e:
+            return {}
+
+        self.result_cache.put(key, generation, grouped_recipes)
+        return {dish_type: list(recipes) for dish_type, recipes in grouped_recipes.items()}
+
+    def _query_recipes_with_filters(self, filters):
+        """Выполняет запрос рецептов по фильтрам без кэша"""
         session = self.Session()
 
         grouped_recipes = {}
 
         try:
-            query = session.query(
-                Recipe,
-                Dish_types.name.label('dish_type_name'),
-                Cuisines.name.label('cuisine_name')
-            ).outerjoin(
-                Dish_types, Recipe.dish_type_id == Dish_types.id
-            ).outerjoin(
-                Cuisines, Recipe.cuisine_id == Cuisines.id
-            )
+            query, ingredient_recipe_ids = self._filtered_listing_query(session, filters)
+            if query is None:
+                return {}
 
-            # Фильтр по кухне
-            if cuisine and cuisine != "Любая кухня":
-                query = query.filter(Cuisines.name == cuisine)
-
-            # Фильтр по времени приготовления
-            if max_time:
-                query = query.filter(Recipe.cook_time <= max_time)
-
-            # Фильтр по избранному
-            if favorites_only:
-                favorite_subquery = session.query(favorites.c.recipe_id).filter(
-                    favorites.c.user_id == user_id
-                ).subquery()
-                query = query.filter(Recipe.id.in_(favorite_subquery))
-
-            # Фильтр по приготовленным рецептам
-            if cooked_only:
-                cooked_subquery = session.query(CookedRecipe.recipe_id).filter_by(user_id=user_id).subquery()
-                query = query.filter(Recipe.id.in_(cooked_subquery))
-
-            # Фильтр по названию
-            if name_filter and name_filter.strip():
-                name_filter = name_filter.strip()
-                search_terms = [
-                    f"%{name_filter}%",
-                    f"%{name_filter.lower()}%",
-                    f"%{name_filter.upper()}%",
-                    f"%{name_filter.title()}%",
-                ]
-                search_terms = list(set(search_terms))
-                conditions = []
-                for term in search_terms:
-                    conditions.append(Recipe.name.ilike(term))
-                query = query.filter(or_(*conditions))
-
-            # Фильтр по ингредиентам
-            if ingredient_filter and isinstance(ingredient_filter, list) and ingredient_filter:
-
-                # Для каждого ингредиента создаем под запрос
-                subqueries = []
-                for ing_name in ingredient_filter:
-                    matching_ingredients = session.query(Ingredient).filter(
-                        Ingredient.name.ilike(f'%{ing_name}%')
-                    ).all()
-
-                    if matching_ingredients:
-                        ing_ids = [ing.id for ing in matching_ingredients]
-
-                        # Создаем под запрос для текущего ингредиента
-                        ing_subquery = session.query(recipe_ingredients.c.recipe_id).filter(
-                            recipe_ingredients.c.ingredient_id.in_(ing_ids)
-                        ).subquery()
-
-                        # Добавляем в список под запросов
-                        subqueries.append(ing_subquery)
-                    else:
-                        # Если один ингредиент не найден, возвращаем пустой результат
-                        return {}
-
-                # Объединяем все под запросы - рецепт должен содержать ВСЕ указанные ингредиенты
-                if subqueries:
-                    # Начинаем с первого под запроса
-                    combined_subquery = subqueries[0]
-
-                    # Пересекаем со всеми остальными под запросами
-                    for subquery in subqueries[1:]:
-                        combined_subquery = session.query(combined_subquery.c.recipe_id).intersect(
-                            session.query(subquery.c.recipe_id)
-                        ).subquery()
-
-                    query = query.filter(Recipe.id.in_(combined_subquery))
-
-            # Выполняем запрос
-            results = query.all()
-
-            for recipe, dish_type_name, cuisine_name in results:
-                # Получаем данные о питательности
-                nutrition = recipe.nutrition
-                calories = nutrition.calories if nutrition else None
-                proteins = nutrition.proteins if nutrition else None
-                fats = nutrition.fats if nutrition else None
-                carbohydrates = nutrition.carbohydrates if nutrition else None
-
-                # Проверяем статусы
-                is_favorite = session.query(favorites).filter_by(
-                    user_id=user_id, recipe_id=recipe.id
-                ).first() is not None
-
-                is_cooked = session.query(CookedRecipe).filter_by(
-                    user_id=user_id, recipe_id=recipe.id
-                ).first() is not None
-
-                dish_type = dish_type_name or "Основные блюда"
-
-                recipe_tuple = (
-                    recipe.id,
-                    recipe.user_id,
-                    recipe.name,
-                    recipe.instruction,
-                    recipe.description,
-                    recipe.dish_type_id,
-                    recipe.image,
-                    recipe.external_url,
-                    recipe.cook_time,
-                    dish_type,
-                    None,
-                    calories,
-                    proteins,
-                    fats,
-                    carbohydrates,
-                    is_favorite,
-                    is_cooked,
-                    cuisine_name,
-                    dish_type
-                )
+            # Выполняем единственный запрос
+            for row in query.all():
+                if ingredient_recipe_ids is not None and row.id not in ingredient_recipe_ids:
+                    continue
+
+                recipe_tuple = self._listing_row_to_tuple(row, default_dish_type="Основные блюда")
+                dish_type = recipe_tuple.dish_type
 
                 # Динамически создаем категорию если её нет
                 if dish_type not in grouped_recipes:
@@ -961,29 +3084,152 @@ class DataBase:
 
             return grouped_recipes
 
+        finally:
+            session.close()
+
+    # ===== ПОСТРАНИЧНАЯ И ПОТОКОВАЯ ВЫБОРКА РЕЦЕПТОВ =====
+    def get_recipes_page(self, user_id, after=None, limit=None, **filters):
+        """Возвращает одну страницу рецептов с фильтрами: (рецепты, ключ следующей страницы)
+
+        Рецепты упорядочены так же, как окно показывает категории: по рангу типа
+        блюда в PRIORITY_DISH_TYPES, типу блюда, названию и id, и выбираются по ключу
+        (keyset): after - ключ, возвращенный предыдущим вызовом, или None для первой
+        страницы. Ключ следующей страницы равен None, когда рецептов больше нет.
+        Фильтры - те же именованные аргументы, что у get_recipes_with_filters.
+        Страницы кэшируются в собственном ограниченном кэше page_cache и не
+        вытесняют результаты get_recipes_with_filters из result_cache.
+        """
+        limit = limit or self.RECIPES_PAGE_SIZE
+        filter_key = self._listing_filter_key(user_id, **filters)
+        key = (filter_key, after, limit)
+        cached = self.page_cache.get(key)
+        if cached is not None:
+            return list(cached[0]), cached[1]
+
+        generation = self.page_cache.generation
+        try:
+            page = self._query_recipes_page(filter_key, after, limit)
         except Exception as e:
-           return {}
+            print(f"Ошибка загрузки страницы рецептов: {e}")
+            return [], None
+
+        self.page_cache.put(key, generation, page)
+        return list(page[0]), page[1]
+
+    def _query_recipes_page(self, filters, after, limit):
+        """Выполняет запрос одной страницы рецептов без кэша"""
+        session = self.Session()
+        try:
+            query, ingredient_recipe_ids = self._filtered_listing_query(session, filters)
+            if query is None:
+                return [], None
+
+            # Страницы идут в том же порядке, в каком окно показывает категории:
+            # сначала по рангу категории, затем по ее названию, названию рецепта и id
+            dish_type_order = func.coalesce(func.nullif(Dish_types.name, ''), DEFAULT_DISH_TYPE)
+            dish_type_rank_order = case(
+                {name: rank for rank, name in enumerate(PRIORITY_DISH_TYPES)},
+                value=dish_type_order,
+                else_=len(PRIORITY_DISH_TYPES)
+            )
+            sort_key = (dish_type_rank_order, dish_type_order, Recipe.name, Recipe.id)
+            query = query.order_by(None).order_by(*sort_key)
+
+            recipes = []
+            position = after
+            while len(recipes) < limit:
+                page_query = query
+                if position is not None:
+                    page_query = page_query.filter(
+                        tuple_(*sort_key) > tuple_(*position)
+                    )
+                rows = page_query.limit(limit).all()
+
+                consumed = 0
+                for row in rows:
+                    consumed += 1
+                    dish_type = row.dish_type_name or DEFAULT_DISH_TYPE
+                    position = (dish_type_rank(dish_type), dish_type, row.name, row.id)
+                    if ingredient_recipe_ids is not None and row.id not in ingredient_recipe_ids:
+                        continue
+                    recipes.append(self._listing_row_to_tuple(row, default_dish_type=DEFAULT_DISH_TYPE))
+                    if len(recipes) == limit:
+                        break
+
+                # Выборка закончилась, только если пачка неполная и просмотрена целиком;
+                # иначе следующая страница продолжается от последней выданной строки
+                if len(rows) < limit and consumed == len(rows):
+                    return recipes, None
+
+            return recipes, position
         finally:
             session.close()
 
+    def iter_recipes_with_filters(self, user_id, batch_size=None, **filters):
+        """Генератор, выдающий рецепты с фильтрами пачками по batch_size
+
+        Каждая пачка читается отдельным коротким запросом по ключу страницы,
+        поэтому между пачками соединение с БД не удерживается.
+        """
+        after = None
+        while True:
+            recipes, after = self.get_recipes_page(user_id, after=after, limit=batch_size, **filters)
+            if recipes:
+                yield recipes
+            if after is None:
+                return
+
+    # ===== ИНВЕРТИРОВАННЫЙ ИНДЕКС ИНГРЕДИЕНТОВ =====
+    def get_ingredient_index(self):
+        """Возвращает индекс ингредиентов, загружая его из БД при первом обращении"""
+        if not self._ingredient_index.loaded:
+            session = self.Session()
+            try:
+                ingredients = session.query(Ingredient.id, Ingredient.name).all()
+                # Пары читаются потоком: в памяти не держится список всех строк
+                pairs = session.execute(
+                    select(recipe_ingredients.c.recipe_id, recipe_ingredients.c.ingredient_id),
+                    execution_options={'yield_per': 10000}
+                )
+                self._ingredient_index.build(pairs, ingredients)
+            finally:
+                session.close()
+        return self._ingredient_index
+
+    def find_recipes_by_ingredients(self, ingredient_names, match_all=True):
+        """Возвращает id рецептов, содержащих все (match_all) или любой из указанных ингредиентов"""
+        try:
+            index = self.get_ingredient_index()
+            if match_all:
+                bitmap = index.recipes_with_all(ingredient_names)
+            else:
+                bitmap = index.recipes_with_any(ingredient_names)
+            return IngredientIndex.bitmap_to_ids(bitmap)
+        except Exception as e:
+            return []
+
     def get_recipe_ingredients(self, recipe_id):
         """Получение ингредиентов рецепта"""
         session = self.Session()
         try:
-            recipe = session.query(Recipe).filter_by(id=recipe_id).first()
-            if recipe:
-                ingredients_data = []
-                for ingredient in recipe.ingredients:
-                    stmt = recipe_ingredients.select().where(
-                        (recipe_ingredients.c.recipe_id == recipe_id) &
-                        (recipe_ingredients.c.ingredient_id == ingredient.id)
-                    )
-                    result = session.execute(stmt).first()
-                    if result:
-                        quantity, unit = self._parse_quantity(result.quantity)
-                        ingredients_data.append((ingredient.name, quantity, unit))
-                return ingredients_data
-            return []
+            rows = session.execute(
+                select(Ingredient.name, recipe_ingredients.c.amount, recipe_ingredients.c.unit,
+                       recipe_ingredients.c.quantity)
+                .join(Ingredient, Ingredient.id == recipe_ingredients.c.ingredient_id)
+                .where(recipe_ingredients.c.recipe_id == recipe_id)
+                .order_by(literal_column('"Recipe_ingredients".rowid'))
+            ).all()
+
+            ingredients_data = []
+            for name, amount, unit, quantity in rows:
+                if amount is None or not unit:
+                    parsed_amount, parsed_unit = self._parse_quantity(quantity)
+                    if parsed_amount is None:
+                        # Нечисловое количество показывается исходной записью
+                        parsed_amount, parsed_unit = quantity, unit or ''
+                    amount, unit = parsed_amount, parsed_unit
+                ingredients_data.append((name, amount, unit))
+            return ingredients_data
         except Exception as e:
             return []
         finally:
@@ -995,18 +3241,7 @@ class DataBase:
         try:
             recipe = session.query(Recipe).filter_by(id=recipe_id).first()
             if recipe:
-                # Проверяем, используется ли это изображение другими рецептами
-                can_delete_image = False
-                if recipe.image and isinstance(recipe.image, str):
-                    # Находим все рецепты с таким же именем файла изображения
-                    same_image_recipes = session.query(Recipe).filter(
-                        Recipe.image == recipe.image,
-                        Recipe.id != recipe_id
-                    ).count()
-
-                    # Удаляем файл только если это уникальное изображение
-                    if same_image_recipes == 0:
-                        can_delete_image = True
+                image = recipe.image
 
                 # Удаляем связанные записи
                 session.execute(
@@ -1024,24 +3259,17 @@ class DataBase:
                 for cooked_recipe in cooked_recipes:
                     session.delete(cooked_recipe)
 
-                # Удаляем файл изображения если он существует и не используется другими рецептами
-                if can_delete_image:
-                    current_dir = os.path.dirname(os.path.abspath(__file__))
-                    project_root = os.path.dirname(current_dir)
-                    image_path = os.path.join(project_root, 'img', 'recipe_img', recipe.image)
-                    if os.path.exists(image_path):
-                        try:
-                            os.remove(image_path)
-                        except Exception as e:
-                            print(f"Ошибка удаления файла изображения: {e}")
-                    else:
-                        print(f"Файл изображения не найден: {recipe.image}")
-                else:
-                    print(f"Изображение '{recipe.image}' используется другими рецептами, не удаляем")
-
                 session.delete(recipe)
                 session.commit()
+                self._data_changed()
+
+                # Файл удаляется, только если на него больше не ссылается ни один рецепт (image_refs)
+                self._release_image_after_commit(image)
+
+                self._ingredient_index.remove_recipe(recipe_id)
+                self.user_flags.remove_recipe(recipe_id)
                 return True
+            session.rollback()
             return False
         except Exception as e:
             session.rollback()
@@ -1055,70 +3283,124 @@ class DataBase:
         """Получает все элементы корзины для пользователя из БД"""
         session = self.Session()
         try:
-            items = session.query(Cart).filter_by(user_id=user_id).all()
-            return [{
-                'name': item.ingredient_name,
-                'quantity': item.quantity,
-                'unit': item.unit
-            } for item in items]
+            return self._cart_items(session, user_id)
         except Exception as e:
             return []
         finally:
             session.close()
 
+    @staticmethod
+    def _cart_items(session, user_id):
+        """Читает сводный список покупок пользователя одним запросом SUM ... GROUP BY
+
+        Суммы по (ингредиент, единица) затем сводятся реестром единиц: граммы и килограммы,
+        ложки и миллилитры одного ингредиента дают одну строку. Для числовых позиций
+        'quantity' - число, для нечисловых - исходный текст; 'units' - единицы строк в БД.
+        """
+        rows = session.execute(
+            select(
+                Cart.ingredient_name,
+                Cart.unit,
+                func.sum(Cart.amount).label('total'),
+                func.group_concat(case((Cart.amount.is_(None), Cart.quantity)), ', ').label('text')
+            )
+            .where(Cart.user_id == user_id)
+            .group_by(Cart.ingredient_name, Cart.unit)
+            .order_by(func.min(Cart.id))
+        ).all()
+        items = []
+        for row in rows:
+            if row.total is not None:
+                items.append({'name': row.ingredient_name, 'amount': row.total, 'unit': row.unit, 'text': None})
+            if row.text:
+                items.append({'name': row.ingredient_name, 'amount': None, 'unit': row.unit, 'text': row.text})
+        return UNITS.consolidate(items)
+
     def add_cart_item(self, user_id, ingredient_name, quantity, unit):
         """Добавляет элемент в корзину в БД"""
+        return self.add_cart_items(user_id, [(ingredient_name, quantity, unit)]) is not None
+
+    def add_cart_items(self, user_id, items):
+        """Добавляет в корзину список (название, количество, единица) одной транзакцией
+
+        Позиция с тем же названием и единицей не дублируется: количество прибавляется
+        к существующему через INSERT ... ON CONFLICT DO UPDATE.
+        Возвращает новое содержимое корзины или None при ошибке.
+        """
         session = self.Session()
         try:
-            existing_item = session.query(Cart).filter_by(
-                user_id=user_id,
-                ingredient_name=ingredient_name,
-                unit=unit
-            ).first()
-
-            if existing_item:
-                try:
-                    existing_quantity = float(existing_item.quantity) if existing_item.quantity.replace('.',
-                                                                                                        '').isdigit() else 0
-                    new_quantity = float(quantity) if str(quantity).replace('.', '').isdigit() else 0
-                    existing_item.quantity = str(existing_quantity + new_quantity)
-                except:
-                    pass
-            else:
-                cart_item = Cart(
-                    user_id=user_id,
-                    ingredient_name=ingredient_name,
-                    quantity=str(quantity),
-                    unit=unit
+            rows = []
+            for name, quantity, unit in items:
+                amount = parse_amount(quantity)
+                rows.append({
+                    'user_id': user_id,
+                    'ingredient_name': name,
+                    'quantity': format_amount(amount) if amount is not None else str(quantity),
+                    'amount': amount,
+                    'unit': normalize_unit(unit),
+                    'created_at': datetime.now()
+                })
+
+            if rows:
+                stmt = sqlite_insert(Cart.__table__).values(rows)
+                cart_table = Cart.__table__
+                # Нечисловое количество не меняет числовое; если обе записи нечисловые, остается прежний текст
+                new_amount = case(
+                    (and_(cart_table.c.amount.is_(None), stmt.excluded.amount.is_(None)), None),
+                    else_=func.coalesce(cart_table.c.amount, 0) + func.coalesce(stmt.excluded.amount, 0)
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['user_id', 'ingredient_name', 'unit'],
+                    set_={
+                        'amount': new_amount,
+                        'quantity': case(
+                            (new_amount.is_(None), cart_table.c.quantity),
+                            else_=_format_amount_sql(new_amount)
+                        )
+                    }
                 )
-                session.add(cart_item)
+                session.execute(stmt)
 
+            cart = self._cart_items(session, user_id)
             session.commit()
-            return True
+            self._data_changed()
+            return cart
         except Exception as e:
             session.rollback()
-            return False
+            print(f"Ошибка добавления в корзину: {e}")
+            return None
         finally:
             session.close()
 
     def remove_cart_items(self, user_id, items_to_remove):
-        """Удаляет элементы из корзины в БД"""
+        """Удаляет элементы корзины (словари с 'name' и 'unit' или списком 'units') одной транзакцией
+
+        Возвращает новое содержимое корзины или None при ошибке.
+        """
         session = self.Session()
         try:
-            removed_count = 0
-            for item_data in items_to_remove:
-                result = session.query(Cart).filter_by(
-                    user_id=user_id,
-                    ingredient_name=item_data['name'],
-                    unit=item_data['unit']
-                ).delete()
-                removed_count += result
-
+            keys = list({
+                (item_data['name'], unit)
+                for item_data in items_to_remove
+                for unit in item_data.get('units') or [item_data['unit']]
+            })
+
+            # Пара (название, единица) занимает два параметра запроса
+            chunk_size = self.MAX_SQL_IN_IDS // 2
+            for start in range(0, len(keys), chunk_size):
+                session.query(Cart).filter(
+                    Cart.user_id == user_id,
+                    tuple_(Cart.ingredient_name, Cart.unit).in_(keys[start:start + chunk_size])
+                ).delete(synchronize_session=False)
+
+            cart = self._cart_items(session, user_id)
             session.commit()
-            return removed_count > 0
+            self._data_changed()
+            return cart
         except Exception as e:
             session.rollback()
-            return False
+            print(f"Ошибка удаления из корзины: {e}")
+            return None
         finally:
             session.close()
 
@@ -1128,6 +3410,7 @@ class DataBase:
         try:
             deleted_count = session.query(Cart).filter_by(user_id=user_id).delete()
             session.commit()
+            self._data_changed()
             return True
         except Exception as e:
             session.rollback()
@@ -1161,6 +3444,7 @@ class DataBase:
             new_user = User(login=login, password=password)
             session.add(new_user)
             session.commit()
+            self._data_changed()
             return True, "Пользователь успешно зарегистрирован"
         except Exception as e:
             session.rollback()
@@ -1168,24 +3452,68 @@ class DataBase:
         finally:
             session.close()
 
-    def get_user_profile(self, user_id):
-        """Получение профиля пользователя с учетом корзины"""
+    def _load_user_flags(self, user_id):
+        """Загружает id избранных и приготовленных рецептов пользователя"""
         session = self.Session()
         try:
-            user = session.query(User).filter_by(id=user_id).first()
-            if user:
-                recipes_count = session.query(Recipe).filter_by(user_id=user_id).count()
-                favorites_count = session.query(favorites).filter_by(user_id=user_id).count()
-                cart_count = session.query(Cart).filter_by(user_id=user_id).count()
-                cooked_count = session.query(CookedRecipe).filter_by(user_id=user_id).count()
+            favorite_ids = session.execute(
+                select(favorites.c.recipe_id).where(favorites.c.user_id == user_id)
+            ).scalars().all()
+            cooked_ids = session.execute(
+                select(CookedRecipe.recipe_id).where(CookedRecipe.user_id == user_id)
+            ).scalars().all()
+            return favorite_ids, cooked_ids
+        finally:
+            session.close()
+
+    def load_user_state(self, user_id):
+        """Загружает в память избранное и приготовленное пользователя при входе"""
+        try:
+            self.user_flags.load(user_id)
+            return True
+        except Exception as e:
+            print(f"Ошибка загрузки избранного пользователя: {e}")
+            return False
 
+    def forget_user_state(self, user_id=None):
+        """Освобождает данные пользователя в памяти при выходе"""
+        self.user_flags.forget(user_id)
+
+    def get_favorite_ids(self, user_id):
+        """Возвращает множество id избранных рецептов пользователя"""
+        try:
+            return self.user_flags.ids('favorites', user_id)
+        except Exception as e:
+            return set()
+
+    def get_cooked_ids(self, user_id):
+        """Возвращает множество id приготовленных рецептов пользователя"""
+        try:
+            return self.user_flags.ids('cooked', user_id)
+        except Exception as e:
+            return set()
+
+    def get_user_profile(self, user_id):
+        """Получение профиля пользователя с учетом корзины
+
+        Счетчики читаются из user_stats одним чтением по первичному ключу;
+        их поддерживают триггеры, поэтому COUNT по таблицам не выполняется.
+        """
+        session = self.Session()
+        try:
+            row = session.query(
+                User.id, User.login,
+                UserStats.recipes_count, UserStats.favorites_count,
+                UserStats.cart_count, UserStats.cooked_count
+            ).outerjoin(UserStats, UserStats.user_id == User.id).filter(User.id == user_id).first()
+            if row:
                 return {
-                    'id': user.id,
-                    'login': user.login,
-                    'recipes_count': recipes_count,
-                    'favorites_count': favorites_count,
-                    'cart_count': cart_count,
-                    'cooked_count': cooked_count
+                    'id': row.id,
+                    'login': row.login,
+                    'recipes_count': row.recipes_count or 0,
+                    'favorites_count': row.favorites_count or 0,
+                    'cart_count': row.cart_count or 0,
+                    'cooked_count': row.cooked_count or 0
                 }
             return None
         except Exception as e:
@@ -1194,17 +3522,29 @@ class DataBase:
             session.close()
 
     # ===== МЕТОДЫ ДЛЯ РАБОТЫ С ИНГРЕДИЕНТАМИ =====
-    def get_ingredients(self):
-        """Получение всех ингредиентов"""
+    def _load_ingredients(self):
+        """Загружает список ингредиентов из БД (источник для кэша справочников)"""
         session = self.Session()
         try:
             ingredients = session.query(Ingredient).all()
             return [(ing.id, ing.name) for ing in ingredients]
-        except Exception as e:
-            return []
         finally:
             session.close()
 
+    def get_ingredients(self):
+        """Получение всех ингредиентов"""
+        try:
+            return self.reference_cache.get('ingredients')
+        except Exception as e:
+            return []
+
+    def get_ingredient_by_name(self, ingredient_name):
+        """Получает ID ингредиента по названию"""
+        try:
+            return self.reference_cache.id_by_name('ingredients', ingredient_name)
+        except Exception as e:
+            return None
+
     def add_ingredient(self, name):
         """Добавление нового ингредиента"""
         session = self.Session()
@@ -1215,8 +3555,14 @@ class DataBase:
 
             new_ingredient = Ingredient(name=name)
             session.add(new_ingredient)
+            session.flush()
+            ingredient_id = new_ingredient.id
             session.commit()
-            return new_ingredient.id
+            self._data_changed()
+
+            self._ingredient_index.add_ingredient(ingredient_id, name)
+            self.reference_cache.invalidate('ingredients')
+            return ingredient_id
         except Exception as e:
             session.rollback()
             return None
@@ -1249,6 +3595,8 @@ class DataBase:
                 session.execute(stmt)
 
             session.commit()
+            self._data_changed()
+            self.user_flags.set_flag('favorites', user_id, recipe_id, not existing)
             return True
         except Exception as e:
             session.rollback()
@@ -1257,51 +3605,25 @@ class DataBase:
             session.close()
 
     def is_recipe_favorite(self, user_id, recipe_id):
-        """Проверка, находится ли рецепт в избранном"""
-        session = self.Session()
+        """Проверка, находится ли рецепт в избранном (по множеству в памяти)"""
         try:
-            stmt = favorites.select().where(
-                (favorites.c.user_id == user_id) &
-                (favorites.c.recipe_id == recipe_id)
-            )
-            result = session.execute(stmt).first()
-            return result is not None
+            return self.user_flags.contains('favorites', user_id, recipe_id)
         except Exception as e:
             return False
-        finally:
-            session.close()
 
     def get_favorite_recipes(self, user_id):
-        """Получает избранные рецепты пользователя"""
+        """Получает избранные рецепты пользователя одним запросом в порядке добавления"""
         session = self.Session()
         try:
-            # Получаем ID избранных рецептов
-            stmt = favorites.select().where(favorites.c.user_id == user_id)
-            favorite_ids = [row.recipe_id for row in session.execute(stmt)]
-
-            if not favorite_ids:
-                return []
-
-            # Получаем полные данные рецептов
-            recipes = []
-            for recipe_id in favorite_ids:
-                recipe = session.query(Recipe).filter_by(id=recipe_id).first()
-                if recipe:
-                    # Собираем данные в том же формате, что и get_recipes_with_filters
-                    dish_type_name = recipe.dish_type.name if recipe.dish_type else "Без категории"
-                    cuisine_name = recipe.cuisine.name if recipe.cuisine else "Не указана"
-                    calories = recipe.nutrition.calories if recipe.nutrition else None
-
-                    recipe_tuple = (
-                        recipe.id, recipe.user_id, recipe.name, recipe.instruction,
-                        recipe.description, recipe.dish_type_id, recipe.image,
-                        recipe.external_url, recipe.cook_time, dish_type_name,
-                        None, calories, None, None, None, True, False,
-                        cuisine_name, dish_type_name
-                    )
-                    recipes.append(recipe_tuple)
-
-            return recipes
+            query = self._recipe_listing_query(session, user_id).join(
+                favorites,
+                (favorites.c.recipe_id == Recipe.id) & (favorites.c.user_id == user_id)
+            ).order_by(literal_column('"Favorites".rowid'))
+
+            return [
+                self._listing_row_to_tuple(row, default_dish_type="Без категории", default_cuisine="Не указана")
+                for row in query.all()
+            ]
         except Exception as e:
             return []
         finally:
@@ -1325,6 +3647,8 @@ class DataBase:
                 ).delete()
 
             session.commit()
+            self._data_changed()
+            self.user_flags.set_flag('cooked', user_id, recipe_id, cooked)
             return True
         except Exception as e:
             session.rollback()
@@ -1333,42 +3657,22 @@ class DataBase:
             session.close()
 
     def is_recipe_cooked(self, user_id, recipe_id):
-        """Проверяет, отмечен ли рецепт как приготовленный"""
-        session = self.Session()
+        """Проверяет, отмечен ли рецепт как приготовленный (по множеству в памяти)"""
         try:
-            cooked = session.query(CookedRecipe).filter_by(
-                user_id=user_id, recipe_id=recipe_id
-            ).first()
-            return cooked is not None
+            return self.user_flags.contains('cooked', user_id, recipe_id)
         except Exception as e:
             return False
-        finally:
-            session.close()
 
     def get_cooked_recipes(self, user_id):
-        """Получает приготовленные рецепты пользователя"""
+        """Получает приготовленные рецепты пользователя одним запросом в порядке приготовления"""
         session = self.Session()
         try:
-            cooked_recipes = session.query(CookedRecipe).filter_by(user_id=user_id).all()
-            result = []
-            for cooked_recipe in cooked_recipes:
-                recipe = cooked_recipe.recipe
-                dish_type_name = recipe.dish_type.name if recipe.dish_type else None
-                cuisine_name = recipe.cuisine.name if recipe.cuisine else None
-                calories = recipe.nutrition.calories if recipe.nutrition else None
-                proteins = recipe.nutrition.proteins if recipe.nutrition else None
-                fats = recipe.nutrition.fats if recipe.nutrition else None
-                carbohydrates = recipe.nutrition.carbohydrates if recipe.nutrition else None
-
-                recipe_tuple = (
-                    recipe.id, recipe.user_id, recipe.name, recipe.instruction,
-                    recipe.description, recipe.dish_type_id, recipe.image,
-                    recipe.external_url, recipe.cook_time, dish_type_name,
-                    None, calories, proteins, fats, carbohydrates, False, True,
-                    cuisine_name, dish_type_name
-                )
-                result.append(recipe_tuple)
-            return result
+            query = self._recipe_listing_query(session, user_id).join(
+                CookedRecipe,
+                (CookedRecipe.recipe_id == Recipe.id) & (CookedRecipe.user_id == user_id)
+            ).order_by(CookedRecipe.cooked_at, Recipe.id)
+
+            return [self._listing_row_to_tuple(row) for row in query.all()]
         except Exception as e:
             return []
         finally:
@@ -1379,43 +3683,25 @@ class DataBase:
         """Поиск рецептов по названию или ингредиентам"""
         session = self.Session()
         try:
-            query = session.query(Recipe)
+            query = self._recipe_listing_query(session, user_id)
 
             if category_filter and category_filter != "Все":
                 query = query.join(Category, Recipe.dish_type_id == Category.id).filter(Category.name == category_filter)
 
-            search_query = f"%{search_term}%"
-            query = query.filter(
-                (Recipe.name.ilike(search_query)) |
-                (Recipe.description.ilike(search_query)) |
-                (Recipe.instruction.ilike(search_query))
-            )
-
-            recipes = query.all()
-
-            result = []
-            for recipe in recipes:
-                dish_type_name = recipe.dish_type.name if recipe.dish_type else None
-                cuisine_name = recipe.cuisine.name if recipe.cuisine else None
-                calories = recipe.nutrition.calories if recipe.nutrition else None
-                proteins = recipe.nutrition.proteins if recipe.nutrition else None
-                fats = recipe.nutrition.fats if recipe.nutrition else None
-                carbohydrates = recipe.nutrition.carbohydrates if recipe.nutrition else None
-
-                is_favorite = session.query(favorites).filter_by(
-                    user_id=user_id, recipe_id=recipe.id
-                ).first() is not None
-
-                recipe_tuple = (
-                    recipe.id, recipe.user_id, recipe.name, recipe.instruction,
-                    recipe.description, recipe.dish_type_id, recipe.image,
-                    recipe.external_url, recipe.cook_time, dish_type_name,
-                    None, calories, proteins, fats, carbohydrates, is_favorite, False,
-                    cuisine_name, dish_type_name
+            # Полнотекстовый поиск по названию, описанию, инструкции и ингредиентам
+            match_expression = build_fts_query(search_term)
+            if match_expression and self.is_fts_available():
+                fts = self._fts_ranked_subquery(match_expression)
+                query = query.join(fts, fts.c.recipe_id == Recipe.id).order_by(fts.c.rank)
+            else:
+                search_query = f"%{search_term}%"
+                query = query.filter(
+                    (Recipe.name.ilike(search_query)) |
+                    (Recipe.description.ilike(search_query)) |
+                    (Recipe.instruction.ilike(search_query))
                 )
-                result.append(recipe_tuple)
 
-            return result
+            return [self._listing_row_to_tuple(row) for row in query.all()]
         except Exception as e:
             return []
         finally:
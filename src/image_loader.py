@@ -0,0 +1,157 @@
+import itertools
+from functools import partial
+
+from PyQt6.QtCore import QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+
+
+class ImageDecodeSignals(QObject):
+    """Сигнал, через который рабочий поток возвращает декодированную миниатюру"""
+    finished = pyqtSignal(object, object)     # ключ миниатюры, QImage или None
+
+
+class ImageDecodeTask(QRunnable):
+    """Задача пула потоков: миниатюра одного изображения одного размера"""
+
+    def __init__(self, signals, thumbnails, key):
+        super().__init__()
+        # Задача остается у ImageLoader, чтобы ее можно было снять из очереди
+        self.setAutoDelete(False)
+        self.signals = signals
+        self.thumbnails = thumbnails
+        self.key = key
+
+    def run(self):
+        image, width, height, expand = self.key
+        try:
+            result = self.thumbnails.get(image, width, height, expand)
+        except Exception as e:
+            print(f"Ошибка декодирования изображения {image}: {e}")
+            result = None
+        self.signals.finished.emit(self.key, result)
+
+
+class ImageLoader(QObject):
+    """Фоновая загрузка миниатюр рецептов для карточек
+
+    Миниатюры читаются из дискового кэша или декодируются QImageReader сразу
+    в уменьшенном размере (ThumbnailCache.get) в отдельном пуле потоков, чтобы
+    сборка сетки карточек не блокировала интерфейс. Карточка сразу показывает
+    заглушку, а изображение подставляется, когда приходит сигнал о готовности.
+    Запросы одного изображения одного размера объединяются в одну задачу;
+    запрос отменяется при удалении виджета-владельца, и задача, которую больше
+    никто не ждет, снимается из очереди пула.
+    """
+
+    # Сколько изображений декодируется одновременно
+    MAX_THREADS = 4
+
+    image_ready = pyqtSignal(int, object)     # id запроса, QPixmap или None
+
+    def __init__(self, db, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads or min(self.MAX_THREADS, max(QThread.idealThreadCount(), 1)))
+
+        self._request_ids = itertools.count(1)
+        self._tasks = {}        # ключ миниатюры -> ImageDecodeTask
+        self._waiting = {}      # ключ миниатюры -> [id запросов]
+        self._requests = {}     # id запроса -> (ключ, on_result)
+        self.stats = {'requests': 0, 'memory_hits': 0, 'decoded': 0, 'cancelled': 0, 'dequeued': 0}
+
+        self._signals = ImageDecodeSignals()
+        self._signals.finished.connect(self._on_finished)
+
+    def load(self, image, width, height, expand=False, on_result=None, owner=None):
+        """Запрашивает QPixmap миниатюры; возвращает id запроса или None
+
+        Если миниатюра уже есть в кэше в памяти, on_result(pixmap) вызывается сразу
+        и возвращается None. Иначе on_result(pixmap или None) будет вызван в потоке
+        интерфейса после декодирования. owner - QObject, при удалении которого
+        запрос отменяется.
+        """
+        self.stats['requests'] += 1
+        cached = self.db.get_cached_thumbnail(image, width, height, expand)
+        if cached is not None:
+            self.stats['memory_hits'] += 1
+            if on_result is not None:
+                on_result(cached)
+            return None
+
+        key = (image, width, height, expand)
+        request_id = next(self._request_ids)
+        self._requests[request_id] = (key, on_result)
+        self._waiting.setdefault(key, []).append(request_id)
+        if key not in self._tasks:
+            task = ImageDecodeTask(self._signals, self.db.thumbnails, key)
+            self._tasks[key] = task
+            self.pool.start(task)
+        if owner is not None:
+            owner.destroyed.connect(partial(self.cancel, request_id))
+        return request_id
+
+    def show_thumbnail(self, label, image, width, height, expand=False, placeholder=None):
+        """Показывает в QLabel миниатюру изображения, пока она грузится - заглушку
+
+        Без имени файла сразу ставится заглушка. Возвращает id запроса или None.
+        """
+        if not image:
+            if placeholder is not None:
+                label.setPixmap(self.db.get_placeholder_pixmap(placeholder, width, height, expand))
+            return None
+
+        def on_result(pixmap):
+            if pixmap is not None:
+                label.setPixmap(pixmap)
+
+        request_id = self.load(image, width, height, expand, on_result=on_result, owner=label)
+        if request_id is not None and placeholder is not None:
+            label.setPixmap(self.db.get_placeholder_pixmap(placeholder, width, height, expand))
+        return request_id
+
+    def cancel(self, request_id, *args):
+        """Отменяет запрос; задачу, которую больше никто не ждет, снимает из очереди пула"""
+        request = self._requests.pop(request_id, None)
+        if request is None:
+            return
+        self.stats['cancelled'] += 1
+        key = request[0]
+        waiting = self._waiting.get(key, [])
+        if request_id in waiting:
+            waiting.remove(request_id)
+        if not waiting:
+            self._waiting.pop(key, None)
+            task = self._tasks.get(key)
+            # Уже запущенная задача доработает, ее результат попадет в кэш
+            if task is not None and self.pool.tryTake(task):
+                del self._tasks[key]
+                self.stats['dequeued'] += 1
+
+    def is_pending(self, request_id):
+        """Ожидает ли запрос результата"""
+        return request_id in self._requests
+
+    def wait_for_done(self, msecs=-1):
+        """Дожидается завершения всех запущенных задач"""
+        return self.pool.waitForDone(msecs)
+
+    def _on_finished(self, key, thumbnail):
+        self._tasks.pop(key, None)
+        self.stats['decoded'] += 1
+        pixmap = None
+        if thumbnail is not None:
+            pixmap = self.db.store_thumbnail(*key, thumbnail)
+
+        for request_id in self._waiting.pop(key, []):
+            request = self._requests.pop(request_id, None)
+            if request is None:
+                continue
+            self.image_ready.emit(request_id, pixmap)
+            if request[1] is not None:
+                try:
+                    request[1](pixmap)
+                except RuntimeError:
+                    # Виджет уже удален, а сигнал destroyed еще не обработан
+                    pass
+                except Exception as e:
+                    print(f"Ошибка обработки изображения {key[0]}: {e}")
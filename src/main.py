@@ -76,6 +76,7 @@ class PuzzleVkusovApp:
             # ЗАГРУЗКА КОРЗИНЫ ИЗ БАЗЫ ДАННЫХ ПЕРЕД СОЗДАНИЕМ ГЛАВНОГО ОКНА
             cart_items = self.db.get_cart_items(self.current_user_id)
             print(f"Загружено {len(cart_items)} элементов корзины для пользователя {self.current_user_id}")
+            self.db.load_user_state(self.current_user_id)
 
             self.main_window = MainWindow(self.db, self.current_user_id, self.logout)
             self.main_window.show()
@@ -93,6 +94,7 @@ class PuzzleVkusovApp:
             # ЗАКРЫТИЕ ГЛАВНОГО ОКНА И ПОКАЗ ОКНА ВХОДА
             if hasattr(self, 'main_window'):
                 self.main_window.close()
+            self.db.forget_user_state(self.current_user_id)
             self.current_user_id = None
             self.show_login()
         except Exception as e:
@@ -108,7 +110,27 @@ class PuzzleVkusovApp:
             return 1
 
 
+def run_migrations():
+    """Применяет непримененные миграции БД без запуска интерфейса (режим --migrate)"""
+    try:
+        db = DataBase(auto_migrate=False)
+        print(f"Текущая версия схемы: {db.get_schema_version()}")
+
+        applied = db.apply_pending_migrations(verbose=True)
+        if applied:
+            print(f"Применено миграций: {len(applied)}. Новая версия схемы: {db.get_schema_version()}")
+        else:
+            print("Непримененных миграций нет")
+        return 0
+    except Exception as e:
+        print(f"Ошибка применения миграций: {e}")
+        return 1
+
+
 if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        sys.exit(run_migrations())
+
     try:
         puzzle_app = PuzzleVkusovApp()
         sys.exit(puzzle_app.run())
@@ -5,7 +5,8 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPu
 from PyQt6.QtCore import Qt, QSettings, QSize, QTimer, QRect, QPoint, QStringListModel
 from PyQt6.QtGui import QAction, QIcon
 
-from src.database import Recipe
+from src.async_database import AsyncDataBase
+from src.image_loader import ImageLoader
 from src.modules.recipe_dialog import RecipeDialog, RecipeCardDialog
 from src.modules.settings_dialog import SettingsDialog
 from src.modules.help_dialog import HelpDialog
@@ -16,10 +17,13 @@ from src.modules.cart_manager import CartWidget
 class SmartSearchLineEdit(QLineEdit):
     """Умное поле поиска с подсказками"""
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, suggestion_provider=None):
         super().__init__(parent)
         self.setPlaceholderText("Поиск по названию...")
 
+        # Функция, возвращающая подсказки по введенному тексту (например, полнотекстовый поиск БД)
+        self.suggestion_provider = suggestion_provider
+
         # Настраиваем автодополнение
         self.completer = QCompleter([])
         self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
@@ -27,6 +31,11 @@ class SmartSearchLineEdit(QLineEdit):
         self.completer.setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
         self.setCompleter(self.completer)
 
+        if self.suggestion_provider:
+            # Подсказки уже отобраны и ранжированы источником - показываем их без фильтрации
+            self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+            self.textEdited.connect(self.update_suggestions)
+
         layout = QHBoxLayout(self)
         layout.addStretch()
         layout.setContentsMargins(5, 0, 5, 0)
@@ -38,6 +47,16 @@ class SmartSearchLineEdit(QLineEdit):
         """Устанавливает список подсказок для автодополнения"""
         self.completer.setModel(QStringListModel(suggestions))
 
+    def update_suggestions(self, text):
+        """Запрашивает подсказки для введенного текста у источника и показывает их"""
+        try:
+            suggestions = self.suggestion_provider(text) if text.strip() else []
+            self.set_search_suggestions(suggestions)
+            if suggestions:
+                self.completer.complete()
+        except Exception as e:
+            print(f"Ошибка получения подсказок: {e}")
+
 
 # ====================================================================================
 # FlowLayout - кастомный layout для расположения виджетов как в веб-потоке
@@ -175,7 +194,7 @@ class FlowLayout(QLayout):
 
 
 class RecipeCard(QFrame):
-    """Виджет карточки рецепта для главного окна"""
+    """Виджет карточки рецепта для главного окна (recipe_data - RecipeRow)"""
 
     def __init__(self, recipe_data, db, parent=None):
         """ Инициализация карточки рецепта. """
@@ -234,15 +253,22 @@ class RecipeCard(QFrame):
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        pixmap = self.db.get_recipe_image(self.recipe_data[0])
+        # Миниатюра берется из кэша по имени файла из строки списка; если ее еще нет
+        # в памяти, карточка показывает заглушку, а изображение декодируется в фоне
+        image_loader = getattr(self.parent, 'image_loader', None)
+        if image_loader is not None:
+            image_loader.show_thumbnail(self.image_label, self.recipe_data.image, 248, 148, expand=True,
+                                        placeholder=self.recipe_data.name)
+            pixmap = self.image_label.pixmap()
+        else:
+            pixmap = self.db.get_recipe_thumbnail(self.recipe_data.image, 248, 148, expand=True,
+                                                  placeholder=self.recipe_data.name)
         if pixmap and not pixmap.isNull():
-            scaled_pixmap = pixmap.scaled(248, 148, Qt.AspectRatioMode.KeepAspectRatioByExpanding,
-                                          Qt.TransformationMode.SmoothTransformation)
-            self.image_label.setPixmap(scaled_pixmap)
+            self.image_label.setPixmap(pixmap)
             self.image_label.setScaledContents(True)  # Включаем масштабирование содержимого
         else:
             # Текстовую заглушку с названием рецепта
-            recipe_name = self.recipe_data[2]
+            recipe_name = self.recipe_data.name
             if len(recipe_name) > 22:
                 display_text = recipe_name[:22] + '...'
             else:
@@ -273,7 +299,7 @@ class RecipeCard(QFrame):
         info_layout.setSpacing(10)
 
         # Название рецепта
-        name_label = QLabel(self.recipe_data[2])
+        name_label = QLabel(self.recipe_data.name)
         name_label.setAlignment(Qt.AlignmentFlag.AlignLeft)
         name_label.setStyleSheet("""
             QLabel {
@@ -303,7 +329,7 @@ class RecipeCard(QFrame):
         info_row.setSpacing(10)
 
         # Кухня
-        cuisine = self.recipe_data[17] if len(self.recipe_data) > 17 else None
+        cuisine = self.recipe_data.cuisine
         if cuisine:
             cuisine_widget = QWidget()
             cuisine_widget.setFixedHeight(24)
@@ -336,7 +362,7 @@ class RecipeCard(QFrame):
 
         time_layout = QHBoxLayout(time_widget)
         time_layout.setContentsMargins(6, 2, 6, 2)
-        time_label = QLabel(f"⏱{self.recipe_data[8] or '?'}м")
+        time_label = QLabel(f"⏱{self.recipe_data.cook_time or '?'}м")
         time_label.setStyleSheet("font-size: 10px; font-weight: 500; color: #1976d2;")
         time_layout.addWidget(time_label)
         info_row.addWidget(time_widget)
@@ -352,7 +378,7 @@ class RecipeCard(QFrame):
         status_layout.setSpacing(10)
 
         # Кнопка "Избранное"
-        self.is_favorite = self.recipe_data[15] if len(self.recipe_data) > 15 else False
+        self.is_favorite = self.recipe_data.is_favorite
         self.favorite_btn = QPushButton("❤️" if self.is_favorite else "🤍")
         self.favorite_btn.setFixedSize(50, 50)
         # Стили для кнопки избранного
@@ -371,7 +397,7 @@ class RecipeCard(QFrame):
         self.favorite_btn.setToolTip("В избранном" if self.is_favorite else "Добавить в избранное")
         self.favorite_btn.clicked.connect(self.toggle_favorite_status)
 
-        self.is_cooked = self.recipe_data[16] if len(self.recipe_data) > 16 else False
+        self.is_cooked = self.recipe_data.is_cooked
         self.cooked_btn = QPushButton("✅" if self.is_cooked else "⏳")
         self.cooked_btn.setFixedSize(50, 50)
         self.cooked_btn.setStyleSheet("""
@@ -389,7 +415,7 @@ class RecipeCard(QFrame):
         self.cooked_btn.setToolTip("Приготовлено" if self.is_cooked else "Отметить как приготовленное")
         self.cooked_btn.clicked.connect(self.toggle_cooked_status)
 
-        dish_type = self.recipe_data[18] if len(self.recipe_data) > 18 else "Без категории"
+        dish_type = self.recipe_data.category or "Без категории"
         dish_type_widget = QWidget()
         dish_type_widget.setFixedHeight(24)
         dish_type_widget.setStyleSheet("""
@@ -448,7 +474,8 @@ class RecipeCard(QFrame):
         try:
             if self.user_id:
                 new_status = not self.is_favorite
-                success = self.db.toggle_favorite(self.user_id, self.recipe_data[0])
+                with self.db.track_action('toggle_favorite'):
+                    success = self.db.toggle_favorite(self.user_id, self.recipe_data.id)
 
                 if success:
                     self.is_favorite = new_status
@@ -456,10 +483,7 @@ class RecipeCard(QFrame):
                     self.favorite_btn.setToolTip("В избранном" if new_status else "Добавить в избранное")
 
                     # Обновляем данные в recipe_data для синхронизации
-                    if len(self.recipe_data) > 15:
-                        self.recipe_data = list(self.recipe_data)
-                        self.recipe_data[15] = new_status
-                        self.recipe_data = tuple(self.recipe_data)
+                    self.recipe_data = self.recipe_data._replace(is_favorite=new_status)
 
                     # Обновляем статистику в профиле
                     if self.parent and hasattr(self.parent, 'profile_widget'):
@@ -473,17 +497,15 @@ class RecipeCard(QFrame):
         try:
             if self.user_id:
                 new_status = not self.is_cooked
-                success = self.db.mark_recipe_as_cooked(self.user_id, self.recipe_data[0], new_status)
+                with self.db.track_action('toggle_cooked'):
+                    success = self.db.mark_recipe_as_cooked(self.user_id, self.recipe_data.id, new_status)
 
                 if success:
                     self.is_cooked = new_status
                     self.cooked_btn.setText("✅" if new_status else "⏳")
                     self.cooked_btn.setToolTip("Приготовлено" if new_status else "Отметить как приготовленное")
 
-                    if len(self.recipe_data) > 16:
-                        self.recipe_data = list(self.recipe_data)
-                        self.recipe_data[16] = new_status
-                        self.recipe_data = tuple(self.recipe_data)
+                    self.recipe_data = self.recipe_data._replace(is_cooked=new_status)
 
                     # Обновляем статистику в профиле
                     if self.parent and hasattr(self.parent, 'profile_widget'):
@@ -529,6 +551,10 @@ class AutoCompleteComboBox(QComboBox):
 class MainWindow(QMainWindow):
     """Главное окно приложения с вкладками рецептов, профиля и корзины."""
 
+    # Сколько рецептов загружать за раз и за сколько пикселей до конца списка догружать следующие
+    RECIPES_BATCH_SIZE = 24
+    RECIPES_PREFETCH_MARGIN = 300
+
     def __init__(self, db, user_id, logout_callback):
         super().__init__()
         self.db = db
@@ -537,6 +563,14 @@ class MainWindow(QMainWindow):
 
         self.settings = QSettings("PuzzleVkusov", "AppSettings")
         self.current_recipe_cards = []
+        self.category_sections = {}
+        self.recipe_filters = None      # фильтры текущей выборки; None - все рецепты уже показаны
+        self.recipe_page_after = None   # ключ следующей страницы рецептов
+
+        # Запросы к БД главного окна и вкладок выполняются в фоновых потоках
+        self.async_db = AsyncDataBase(self.db, parent=self)
+        # Изображения карточек декодируются в отдельном пуле потоков
+        self.image_loader = ImageLoader(self.db, parent=self)
 
         self.filter_timer = QTimer()
         self.filter_timer.setSingleShot(True)
@@ -673,6 +707,7 @@ class MainWindow(QMainWindow):
         self.recipes_scroll.setHorizontalScrollBarPolicy(
             Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.recipes_scroll.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
+        self.recipes_scroll.verticalScrollBar().valueChanged.connect(self.on_recipes_scrolled)
 
         # Главный контейнер для всех рецептов
         self.recipes_container = QWidget()
@@ -708,10 +743,10 @@ class MainWindow(QMainWindow):
         recipes_layout.addWidget(self.recipes_scroll, 1)
 
         # === ВКЛАДКА ПРОФИЛЯ ===
-        self.profile_widget = ProfileWidget(self.db, self.user_id, self)
+        self.profile_widget = ProfileWidget(self.db, self.user_id, self, self.async_db)
 
         # === ВКЛАДКА КОРЗИНЫ ===
-        self.cart_widget = CartWidget(self.db, self.user_id, self)
+        self.cart_widget = CartWidget(self.db, self.user_id, self, self.async_db)
 
         self.tabs.addTab(recipes_tab, "📖 Рецепты")
         self.tabs.addTab(self.profile_widget, "👤 Профиль")
@@ -824,7 +859,7 @@ class MainWindow(QMainWindow):
         row2_layout.setSpacing(10)
 
         row2_layout.addWidget(QLabel("Название:"))
-        self.name_filter = SmartSearchLineEdit()
+        self.name_filter = SmartSearchLineEdit(suggestion_provider=self.db.suggest_recipe_names)
         self.name_filter.setMinimumWidth(250)
         self.name_filter.textChanged.connect(lambda: self.apply_filters(debounced=True))
         self.load_search_suggestions()
@@ -1036,11 +1071,12 @@ class MainWindow(QMainWindow):
     def load_search_suggestions(self):
         """Загружает подсказки для поиска по названиям рецептов"""
         try:
-            # Получаем все рецепты для подсказок
-            session = self.db.Session()
-            recipes = session.query(Recipe).all()
-            recipe_names = [recipe.name for recipe in recipes]
-            session.close()
+            # При наличии полнотекстового индекса подсказки запрашиваются по мере ввода
+            if self.db.is_fts_available():
+                return
+
+            # Получаем названия всех рецептов для подсказок
+            recipe_names = self.db.get_recipe_names()
 
             # Устанавливаем подсказки
             self.name_filter.set_search_suggestions(recipe_names)
@@ -1126,71 +1162,88 @@ class MainWindow(QMainWindow):
 
             name_filter = self.name_filter.text().strip()
 
-            # Получаем сгруппированные рецепты
-            grouped_recipes = self.db.get_recipes_with_filters(
-                self.user_id,
-                cuisine=cuisine,
-                max_time=max_time,
-                favorites_only=favorites_only,
-                cooked_only=cooked_only,
-                ingredient_filter=ingredient_filter,
-                name_filter=name_filter
-            )
-
-            # Проверяем, что grouped_recipes не является None
-            if grouped_recipes is None:
-                grouped_recipes = {}
-
-            self.display_recipes_by_category(grouped_recipes)
+            self.clear_recipe_container()
+
+            # Рецепты читаются пачками в фоновом потоке: первая пачка отрисовывается
+            # по готовности, следующие догружаются при прокрутке
+            self.recipe_filters = {
+                'cuisine': cuisine,
+                'max_time': max_time,
+                'favorites_only': favorites_only,
+                'cooked_only': cooked_only,
+                'ingredient_filter': list(ingredient_filter),
+                'name_filter': name_filter
+            }
+            self.recipe_page_after = None
+            self.load_next_recipe_batch()
 
             self.load_search_suggestions()
 
         except Exception as e:
             self.show_error_message(f"Ошибка загрузки рецептов: {str(e)}")
 
-    def display_recipes_by_category(self, grouped_recipes):
-        """Отображает рецепты, сгруппированные по категориям"""
-        self.clear_recipe_container()
+    def load_next_recipe_batch(self):
+        """Запрашивает следующую пачку рецептов; возвращает False, если рецептов больше нет"""
+        if self.recipe_filters is None:
+            return False
+        if self.async_db.is_pending('recipes'):
+            return True
+
+        self.async_db.call(
+            'recipes', 'get_recipes_page', self.user_id,
+            after=self.recipe_page_after,
+            limit=self.RECIPES_BATCH_SIZE,
+            on_result=self.on_recipe_batch_loaded,
+            on_error=lambda message: self.show_error_message(f"Ошибка загрузки рецептов: {message}"),
+            **self.recipe_filters
+        )
+        return True
 
-        if not grouped_recipes:
-            self.show_no_recipes_message()
-            return
-
-        priority_categories = [
-            "Салаты",
-            "Десерты",
-            "Основные блюда",
-            "Завтраки",
-            "Гарниры",
-            "Супы",
-            "Закуски",
-            "Напитки",
-            "Соусы"
-        ]
-
-        total_recipes = 0
-
-        # Сначала показываем приоритетные категории в заданном порядке
-        for category in priority_categories:
-            if category in grouped_recipes and grouped_recipes[category]:
-                recipes = grouped_recipes[category]
-                total_recipes += len(recipes)
-                self.create_category_section(category, recipes)
-                # Удаляем категорию из grouped_recipes, чтобы не показывать её дважды
-                del grouped_recipes[category]
-
-        # Затем показываем оставшиеся категории в алфавитном порядке
-        other_categories = sorted(grouped_recipes.keys())
-        for category in other_categories:
-            if grouped_recipes[category]:
-                recipes = grouped_recipes[category]
-                total_recipes += len(recipes)
-                self.create_category_section(category, recipes)
+    def on_recipe_batch_loaded(self, page):
+        """Добавляет в окно пачку рецептов, полученную из фонового потока"""
+        recipes, self.recipe_page_after = page
+        first_batch = not self.category_sections
+        if self.recipe_page_after is None:
+            self.recipe_filters = None
 
-        self.recipes_container_layout.addStretch()
+        if first_batch:
+            if not recipes:
+                self.show_no_recipes_message()
+                return
+            self.recipes_container_layout.addStretch()
+
+        for recipe in recipes:
+            category = recipe.dish_type
+            section = self.category_sections.get(category)
+            if section is None:
+                # Страницы приходят в порядке показа категорий, поэтому новая секция
+                # всегда встает после уже показанных (перед растяжкой в конце)
+                section = self._create_category_section(category)
+                self.recipes_container_layout.insertWidget(len(self.category_sections), section['widget'])
+                self.category_sections[category] = section
+
+            card = RecipeCard(recipe, self.db, self)
+            section['flow_layout'].addWidget(card)
+            section['count'] += 1
+            section['header'].setText(f"{self.get_category_icon(category)} {category} ({section['count']})")
+            self.current_recipe_cards.append(card)
 
-    def create_category_section(self, category, recipes):
-        """Создает секцию для категории с рецептами"""
+        # Если карточки еще не заполнили область прокрутки, догружаем следующую пачку
+        QTimer.singleShot(0, self.fill_recipe_viewport)
+
+    def fill_recipe_viewport(self):
+        """Догружает рецепты, пока не появится полоса прокрутки или не кончатся рецепты"""
+        if self.recipe_filters is not None and self.recipes_scroll.verticalScrollBar().maximum() == 0:
+            self.load_next_recipe_batch()
+
+    def on_recipes_scrolled(self, value):
+        """Догружает рецепты, когда прокрутка подходит к концу списка"""
+        scroll_bar = self.recipes_scroll.verticalScrollBar()
+        if self.recipe_filters is not None and value >= scroll_bar.maximum() - self.RECIPES_PREFETCH_MARGIN:
+            self.load_next_recipe_batch()
+
+    def _create_category_section(self, category):
+        """Создает пустую секцию категории: заголовок, контейнер карточек и разделитель"""
         category_section = QWidget()
         category_section.setStyleSheet("""
             QWidget {
@@ -1204,7 +1257,7 @@ class MainWindow(QMainWindow):
         category_layout.setSpacing(10)
 
         # Заголовок категории
-        header = QLabel(f"{self.get_category_icon(category)} {category} ({len(recipes)})")
+        header = QLabel(f"{self.get_category_icon(category)} {category}")
         header.setStyleSheet("""
             QLabel {
                 font-size: 18px;
@@ -1233,12 +1286,6 @@ class MainWindow(QMainWindow):
         flow_layout = FlowLayout(cards_container, margin=15, h_spacing=15, v_spacing=15)
         cards_container.setLayout(flow_layout)
 
-        # Добавляем карточки
-        for recipe in recipes:
-            card = RecipeCard(recipe, self.db, self)
-            flow_layout.addWidget(card)
-            self.current_recipe_cards.append(card)
-
         category_layout.addWidget(cards_container)
 
         # Добавляем разделитель между категориями
@@ -1253,8 +1300,7 @@ class MainWindow(QMainWindow):
         """)
         category_layout.addWidget(separator)
 
-        # Добавляем всю секцию в основной контейнер
-        self.recipes_container_layout.addWidget(category_section)
+        return {'widget': category_section, 'header': header, 'flow_layout': flow_layout, 'count': 0}
 
     def get_category_icon(self, category):
         icons = {
@@ -1282,6 +1328,10 @@ class MainWindow(QMainWindow):
                     widget.setParent(None)
 
         self.current_recipe_cards = []
+        self.category_sections = {}
+        self.recipe_filters = None
+        self.recipe_page_after = None
+        self.async_db.cancel('recipes')
 
     def show_no_recipes_message(self):
         """Показывает сообщение об отсутствии рецептов"""
@@ -1605,7 +1655,7 @@ class MainWindow(QMainWindow):
     def view_recipe(self, recipe_data):
         """Открывает диалог просмотра рецепта в виде карточки."""
         try:
-            dialog = RecipeCardDialog(recipe_data, self.db, self.user_id)
+            dialog = RecipeCardDialog(recipe_data, self.db, self.user_id, self.async_db)
             dialog.add_to_cart.connect(self.add_to_cart)
             dialog.recipe_updated.connect(self.load_recipes)
             dialog.recipe_deleted.connect(self.on_recipe_deleted)
@@ -5,15 +5,19 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QColor
 
+from src.async_database import AsyncDataBase
+
 
 class CartItemWidget(QWidget):
     """Виджет для отображения элемента корзины с чекбоксом"""
 
-    def __init__(self, ingredient_name, quantity, unit, parent=None):
+    def __init__(self, ingredient_name, quantity, unit, parent=None, units=None):
         super().__init__(parent)
         self.ingredient_name = ingredient_name
         self.quantity = quantity
         self.unit = unit
+        # Единицы строк корзины в БД, сведенных в эту строку (например, "г" и "кг")
+        self.units = units or [unit]
         self.init_ui()
 
     def init_ui(self):
@@ -173,11 +177,12 @@ class CartWidget(QWidget):
 
     add_to_cart_signal = pyqtSignal(list)
 
-    def __init__(self, db, user_id, main_window):
+    def __init__(self, db, user_id, main_window, async_db=None):
         super().__init__()
         self.db = db
         self.user_id = user_id
         self.main_window = main_window
+        self.async_db = async_db or AsyncDataBase(db, parent=self)
         self.cart = []
 
         self.init_ui()
@@ -245,12 +250,13 @@ class CartWidget(QWidget):
         self.setLayout(layout)
 
     def update_cart(self):
-        """Обновляет корзину из базы данных"""
-        try:
-            self.cart = self.db.get_cart_items(self.user_id)
-            self.update_display()
-        except Exception as e:
-            print(f"Ошибка обновления корзины: {e}")
+        """Запрашивает корзину из базы данных в фоновом потоке"""
+        self.async_db.call('cart', 'get_cart_items', self.user_id, on_result=self.on_cart_loaded)
+
+    def on_cart_loaded(self, cart):
+        """Показывает корзину, полученную из фонового потока"""
+        self.cart = cart
+        self.update_display()
 
     def update_display(self):
         """Обновляет отображение корзины"""
@@ -263,28 +269,9 @@ class CartWidget(QWidget):
             self.cart_list.addItem(empty_item)
             return
 
-        # Группируем ингредиенты
-        ingredient_groups = {}
+        # Корзина уже сведена в БД: по одной строке на ингредиент и величину
         for item in self.cart:
-            name = item['name']
-            quantity = item['quantity']
-            unit = item['unit']
-            key = (name, unit)
-
-            if key in ingredient_groups:
-                try:
-                    existing_qty = float(ingredient_groups[key]) if str(ingredient_groups[key]).replace('.',
-                                                                                                        '').isdigit() else 0
-                    new_qty = float(quantity) if str(quantity).replace('.', '').isdigit() else 0
-                    ingredient_groups[key] = existing_qty + new_qty
-                except:
-                    pass
-            else:
-                ingredient_groups[key] = quantity
-
-        # Создаем виджеты для каждого ингредиента
-        for (name, unit), total_quantity in ingredient_groups.items():
-            item_widget = CartItemWidget(name, total_quantity, unit)
+            item_widget = CartItemWidget(item['name'], item['quantity'], item['unit'], units=item.get('units'))
             list_item = QListWidgetItem()
             list_item.setSizeHint(item_widget.sizeHint())
             list_item.setBackground(QColor(248, 249, 250))
@@ -297,11 +284,6 @@ class CartWidget(QWidget):
         if dialog.exec() == QDialog.DialogCode.Accepted:
             ingredient_data = dialog.get_ingredient_data()
             if ingredient_data:
-                self.cart.append({
-                    'name': ingredient_data['name'],
-                    'quantity': ingredient_data['quantity'],
-                    'unit': ingredient_data['unit']
-                })
                 self.add_to_cart([(
                     ingredient_data['name'],
                     ingredient_data['quantity'],
@@ -311,19 +293,18 @@ class CartWidget(QWidget):
     def add_to_cart(self, ingredients):
         """Добавляет ингредиенты в корзину"""
         try:
-            success_count = 0
-            for name, quantity, unit in ingredients:
-                success = self.db.add_cart_item(
-                    self.user_id, name, quantity, unit
-                )
-                if success:
-                    success_count += 1
-
-            if success_count > 0:
-                self.update_cart()
+            # Все ингредиенты добавляются одной транзакцией, в ответ сразу приходит новая корзина
+            with self.db.track_action('add_to_cart'):
+                cart = self.db.add_cart_items(self.user_id, ingredients)
+
+            if cart is not None and ingredients:
+                # Ответ на ранее отправленный запрос корзины уже устарел
+                self.async_db.cancel('cart')
+                self.cart = cart
+                self.update_display()
                 if self.main_window and hasattr(self.main_window, 'update_profile'):
                     self.main_window.update_profile()
-                QMessageBox.information(self, "Успех", f"Добавлено {success_count} ингредиентов в корзину!")
+                QMessageBox.information(self, "Успех", f"Добавлено {len(ingredients)} ингредиентов в корзину!")
             else:
                 QMessageBox.warning(self, "Ошибка", "Не удалось добавить ингредиенты в корзину")
 
@@ -340,13 +321,17 @@ class CartWidget(QWidget):
                 if widget and widget.is_checked():
                     items_to_remove.append({
                         'name': widget.ingredient_name,
-                        'unit': widget.unit
+                        'unit': widget.unit,
+                        'units': widget.units
                     })
 
             if items_to_remove:
-                success = self.db.remove_cart_items(self.user_id, items_to_remove)
-                if success:
-                    self.update_cart()
+                with self.db.track_action('remove_from_cart'):
+                    cart = self.db.remove_cart_items(self.user_id, items_to_remove)
+                if cart is not None:
+                    self.async_db.cancel('cart')
+                    self.cart = cart
+                    self.update_display()
                     if self.main_window and hasattr(self.main_window, 'update_profile'):
                         self.main_window.update_profile()
                     QMessageBox.information(self, "Успех", f"Удалено {len(items_to_remove)} ингредиентов")
@@ -374,8 +359,10 @@ class CartWidget(QWidget):
             )
 
             if reply == QMessageBox.StandardButton.Yes:
-                success = self.db.clear_cart(self.user_id)
+                with self.db.track_action('clear_cart'):
+                    success = self.db.clear_cart(self.user_id)
                 if success:
+                    self.async_db.cancel('cart')
                     self.cart = []
                     self.update_display()
                     if self.main_window and hasattr(self.main_window, 'update_profile'):
@@ -403,24 +390,8 @@ class CartWidget(QWidget):
                     f.write("Список покупок:\n")
                     f.write("=" * 50 + "\n\n")
 
-                    ingredient_groups = {}
                     for item in self.cart:
-                        name = item['name']
-                        quantity = item['quantity']
-                        unit = item['unit']
-                        key = (name, unit)
-                        if key in ingredient_groups:
-                            try:
-                                ingredient_groups[key] += float(quantity)
-                            except:
-                                ingredient_groups[key] = quantity
-                        else:
-                            try:
-                                ingredient_groups[key] = float(quantity)
-                            except:
-                                ingredient_groups[key] = quantity
-
-                    for (name, unit), total_quantity in ingredient_groups.items():
+                        name, total_quantity, unit = item['name'], item['quantity'], item['unit']
                         if isinstance(total_quantity, float):
                             f.write(f"• {name}: {total_quantity:.1f} {unit}\n")
                         else:
@@ -6,7 +6,7 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
 from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QPixmap, QIcon
 
-from src.database import Recipe
+from src.async_database import AsyncDataBase
 
 
 class ClickableLabel(QLabel):
@@ -408,12 +408,10 @@ class RecipeDialog(QDialog):
                 return
 
             # Получаем рецепт из базы
-            session = self.db.Session()
-            recipe = session.query(Recipe).filter_by(id=recipe_id).first()
+            recipe = self.db.get_recipe_by_id(recipe_id, self.user_id)
 
             if not recipe:
                 QMessageBox.warning(self, 'Ошибка', 'Рецепт не найден')
-                session.close()
                 return
 
             # Загрузка основных данных рецепта
@@ -447,29 +445,19 @@ class RecipeDialog(QDialog):
 
             # Загрузка изображения если есть
             if recipe.image:
-                # get_recipe_image возвращает QPixmap
-                pixmap = self.db.get_recipe_image(recipe.id)
+                pixmap = self.db.get_recipe_thumbnail(recipe.image, 140, 140, placeholder=recipe.name)
                 if pixmap and not pixmap.isNull():
-                    scaled_pixmap = pixmap.scaled(140, 140,
-                                                  Qt.AspectRatioMode.KeepAspectRatio,
-                                                  Qt.TransformationMode.SmoothTransformation)
-                    self.image_label.setPixmap(scaled_pixmap)
+                    self.image_label.setPixmap(pixmap)
                     self.image_label.setText("")
                     # Сохраняем путь к изображению для возможного пересохранения
-                    current_dir = os.path.dirname(os.path.abspath(__file__))
-                    project_root = os.path.dirname(current_dir)
-                    image_path = os.path.join(project_root, 'img', 'recipe_img', recipe.image)
+                    image_path = self.db.image_store.path(recipe.image)
                     if os.path.exists(image_path):
                         self.image_data = image_path
 
             ingredients = self.db.get_recipe_ingredients(recipe.id)
             for ing in ingredients:  # ing - это кортеж (name, quantity, unit)
-                # Находим ID ингредиента по названию
-                ing_id = None
-                for ing_tuple in self.db.get_ingredients():
-                    if ing_tuple[1] == ing[0]:  # ing[0] - название ингредиента
-                        ing_id = ing_tuple[0]
-                        break
+                # Находим ID ингредиента по названию (ing[0] - название ингредиента)
+                ing_id = self.db.get_ingredient_by_name(ing[0])
 
                 if ing_id:
                     quantity = ing[1]
@@ -484,13 +472,10 @@ class RecipeDialog(QDialog):
                     self.ingredients_table.setItem(row, 2, QTableWidgetItem(unit))
 
             # Загрузка данных КБЖУ
-            if recipe.nutrition:
-                self.calories_input.setValue(recipe.nutrition.calories or 0)
-                self.proteins_input.setValue(recipe.nutrition.proteins or 0)
-                self.fats_input.setValue(recipe.nutrition.fats or 0)
-                self.carbs_input.setValue(recipe.nutrition.carbohydrates or 0)
-
-            session.close()
+            self.calories_input.setValue(recipe.calories or 0)
+            self.proteins_input.setValue(recipe.proteins or 0)
+            self.fats_input.setValue(recipe.fats or 0)
+            self.carbs_input.setValue(recipe.carbohydrates or 0)
 
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке данных рецепта: {e}')
@@ -592,71 +577,50 @@ class RecipeDialog(QDialog):
 
             servings = self.servings_input.value()
 
-            if self.recipe_data:
-                # Режим редактирования
-                if isinstance(self.recipe_data, int):
-                    recipe_id = self.recipe_data
-                else:
-                    recipe_id = self.recipe_data[0]
-
-                # Обновляем рецепт
-                success = self.db.update_recipe(
-                    recipe_id=recipe_id,
-                    name=self.name_input.text(),
-                    instruction=instructions,
-                    description=self.description_input.toPlainText(),
-                    dish_type_id=dish_type_id,
-                    cuisine_id=cuisine_id,
-                    cook_time=self.cook_time_input.value(),
-                    ingredients_list=ingredients_list,
-                    nutrition_data=nutrition_data,
-                    image=image_data
-                )
-
-                # Обновляем дополнительные поля
-                if success:
-                    session = self.db.Session()
-                    try:
-                        recipe = session.query(Recipe).filter_by(id=recipe_id).first()
-                        if recipe:
-                            recipe.servings = servings
-                            recipe.external_url = video_url
-                            session.commit()
-                            print("Дополнительные поля обновлены")
-                    except Exception as e:
-                        print(f"Ошибка обновления доп. полей: {e}")
-                    finally:
-                        session.close()
-
-            else:
-                # Режим добавления нового рецепта
-                recipe_id = self.db.add_recipe(
-                    user_id=self.user_id,
-                    name=self.name_input.text(),
-                    instruction=instructions,
-                    description=self.description_input.toPlainText(),
-                    dish_type_id=dish_type_id,
-                    cuisine_id=cuisine_id,
-                    cook_time=self.cook_time_input.value(),
-                    ingredients_list=ingredients_list,
-                    nutrition_data=nutrition_data,
-                    image=image_data
-                )
-                success = recipe_id is not None
+            # Порции и видео-ссылка сохраняются тем же вызовом, что и сам рецепт;
+            # сохранение идет единицей работы и засчитывается действию save_recipe
+            with self.db.transaction('save_recipe') as tx:
+                if self.recipe_data:
+                    # Режим редактирования
+                    if isinstance(self.recipe_data, int):
+                        recipe_id = self.recipe_data
+                    else:
+                        recipe_id = self.recipe_data[0]
+
+                    # Обновляем рецепт
+                    success = self.db.update_recipe(
+                        recipe_id=recipe_id,
+                        name=self.name_input.text(),
+                        instruction=instructions,
+                        description=self.description_input.toPlainText(),
+                        dish_type_id=dish_type_id,
+                        cuisine_id=cuisine_id,
+                        cook_time=self.cook_time_input.value(),
+                        ingredients_list=ingredients_list,
+                        nutrition_data=nutrition_data,
+                        image=image_data,
+                        servings=servings,
+                        external_url=video_url
+                    )
 
-                # Обновляем дополнительные поля
-                if success:
-                    session = self.db.Session()
-                    try:
-                        recipe = session.query(Recipe).filter_by(id=recipe_id).first()
-                        if recipe:
-                            recipe.servings = servings
-                            recipe.external_url = video_url
-                            session.commit()
-                    except Exception as e:
-                        print(f"Ошибка добавления доп. полей: {e}")
-                    finally:
-                        session.close()
+                else:
+                    # Режим добавления нового рецепта
+                    recipe_id = self.db.add_recipe(
+                        user_id=self.user_id,
+                        name=self.name_input.text(),
+                        instruction=instructions,
+                        description=self.description_input.toPlainText(),
+                        dish_type_id=dish_type_id,
+                        cuisine_id=cuisine_id,
+                        cook_time=self.cook_time_input.value(),
+                        ingredients_list=ingredients_list,
+                        nutrition_data=nutrition_data,
+                        image=image_data,
+                        servings=servings,
+                        external_url=video_url
+                    )
+                    success = recipe_id is not None
+            success = success and tx.committed
 
             if success:
                 print("✅ РЕЦЕПТ УСПЕШНО СОХРАНЕН!")
@@ -695,10 +659,14 @@ class RecipeCardDialog(QDialog):
     recipe_deleted = pyqtSignal(int)
     add_to_cart = pyqtSignal(list)
 
-    def __init__(self, recipe_data, db, user_id):
+    def __init__(self, recipe_data, db, user_id, async_db=None):
         super().__init__()
         self.db = db
         self.user_id = user_id
+        self.async_db = async_db or AsyncDataBase(db, parent=self)
+        self.recipe = None
+        self.ingredients = []
+        self.request_channel = f'recipe_card:{id(self)}'
 
         # Получаем объект рецепта по ID
         if isinstance(recipe_data, int):
@@ -710,26 +678,50 @@ class RecipeCardDialog(QDialog):
             self.reject()
             return
 
-        # Используем прямой запрос к сессии
-        session = self.db.Session()
-        try:
-            from sqlalchemy.orm import joinedload
+        # Рецепт загружается в фоновом потоке, пока диалог показывает заглушку
+        self.show_loading()
+        self.async_db.submit(
+            self.request_channel, self._fetch_recipe, self.recipe_id,
+            on_result=self.on_recipe_loaded,
+            on_error=lambda message: self.on_recipe_loaded((None, []))
+        )
 
-            self.recipe = session.query(Recipe).options(
-                joinedload(Recipe.cuisine),
-                joinedload(Recipe.dish_type),
-                joinedload(Recipe.nutrition)
-            ).filter(Recipe.id == self.recipe_id).first()
-        finally:
-            session.close()
+    def _fetch_recipe(self, recipe_id):
+        """Читает рецепт и его ингредиенты (выполняется в рабочем потоке)"""
+        recipe = self.db.get_recipe_by_id(recipe_id, self.user_id)
+        if not recipe:
+            return None, []
+        return recipe, self.db.get_recipe_ingredients(recipe_id)
 
+    def show_loading(self):
+        """Показывает заглушку на время загрузки рецепта"""
+        self.setFixedSize(850, 950)
+        self.setWindowTitle("Загрузка рецепта...")
+        self.setWindowIcon(QIcon("../img/icon.ico"))
+
+        loading_layout = QVBoxLayout(self)
+        loading_label = QLabel("⏳ Загрузка рецепта...")
+        loading_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        loading_label.setStyleSheet("color: #6c757d; font-size: 16px;")
+        loading_layout.addWidget(loading_label)
+
+    def on_recipe_loaded(self, data):
+        """Строит карточку по рецепту, полученному из фонового потока"""
+        self.recipe, self.ingredients = data
         if not self.recipe:
-            QMessageBox.warning(None, 'Ошибка', 'Рецепт не найден')
+            QMessageBox.warning(self, 'Ошибка', 'Рецепт не найден')
             self.reject()
             return
 
+        # Заглушка вместе с ее layout передается временному виджету и удаляется
+        QWidget().setLayout(self.layout())
         self.init_ui()
 
+    def done(self, result):
+        """При закрытии диалога ответ на незавершенный запрос больше не нужен"""
+        self.async_db.cancel(self.request_channel)
+        super().done(result)
+
     def init_ui(self):
         self.setFixedSize(850, 950)
         self.setWindowTitle(self.recipe.name)
@@ -870,11 +862,9 @@ class RecipeCardDialog(QDialog):
             }
         """)
 
-        pixmap = self.db.get_recipe_image(self.recipe.id)
+        pixmap = self.db.get_recipe_thumbnail(self.recipe.image, 210, 170, placeholder=self.recipe.name)
         if pixmap and not pixmap.isNull():
-            scaled_pixmap = pixmap.scaled(210, 170, Qt.AspectRatioMode.KeepAspectRatio,
-                                          Qt.TransformationMode.SmoothTransformation)
-            image_label.setPixmap(scaled_pixmap)
+            image_label.setPixmap(pixmap)
         else:
             image_label.setText("🖼️\nНет\nизображения")
             image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -919,7 +909,7 @@ class RecipeCardDialog(QDialog):
             cuisine_layout = QVBoxLayout(cuisine_box)
             cuisine_label = QLabel("🌍 Кухня")
             cuisine_label.setStyleSheet("font-weight: bold; color: #2e7d32; font-size: 14px; margin-bottom: 5px;")
-            cuisine_value = QLabel(self.recipe.cuisine.name)
+            cuisine_value = QLabel(self.recipe.cuisine)
             cuisine_value.setStyleSheet("color: #2e7d32; font-size: 16px; font-weight: 500;")
             cuisine_value.setWordWrap(True)
             cuisine_layout.addWidget(cuisine_label)
@@ -939,7 +929,7 @@ class RecipeCardDialog(QDialog):
             category_layout = QVBoxLayout(category_box)
             category_label = QLabel("🍽️ Тип блюда")
             category_label.setStyleSheet("font-weight: bold; color: #1565c0; font-size: 14px; margin-bottom: 5px;")
-            category_value = QLabel(self.recipe.dish_type.name)
+            category_value = QLabel(self.recipe.dish_type)
             category_value.setStyleSheet("color: #1565c0; font-size: 16px; font-weight: 500;")
             category_value.setWordWrap(True)
             category_layout.addWidget(category_label)
@@ -1037,9 +1027,8 @@ class RecipeCardDialog(QDialog):
         """)
 
         try:
-            ingredients = self.db.get_recipe_ingredients(self.recipe.id)
             ingredients_list = ""
-            for ing in ingredients:
+            for ing in self.ingredients:
                 # ing - это кортеж (name, quantity, unit)
                 ingredients_list += f"• {ing[0]}: {ing[1]} {ing[2]}\n"
             ingredients_text.setPlainText(ingredients_list)
@@ -1072,11 +1061,11 @@ class RecipeCardDialog(QDialog):
         layout.addWidget(instructions_text)
 
         # === ПЯТЫЙ БЛОК: КБЖУ ===
-        if self.recipe.nutrition and any([
-            self.recipe.nutrition.calories,
-            self.recipe.nutrition.proteins,
-            self.recipe.nutrition.fats,
-            self.recipe.nutrition.carbohydrates
+        if any([
+            self.recipe.calories,
+            self.recipe.proteins,
+            self.recipe.fats,
+            self.recipe.carbohydrates
         ]):
             nutrition_label = QLabel("📊 Пищевая ценность (на порцию)")
             nutrition_label.setProperty("class", "section-header")
@@ -1093,23 +1082,23 @@ class RecipeCardDialog(QDialog):
             """)
             nutrition_layout = QHBoxLayout(nutrition_box)
 
-            if self.recipe.nutrition.calories:
-                calories_label = QLabel(f"🔥 {self.recipe.nutrition.calories} ккал")
+            if self.recipe.calories:
+                calories_label = QLabel(f"🔥 {self.recipe.calories} ккал")
                 calories_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #dc3545;")
                 nutrition_layout.addWidget(calories_label)
 
-            if self.recipe.nutrition.proteins:
-                proteins_label = QLabel(f"🥩 {self.recipe.nutrition.proteins} г белков")
+            if self.recipe.proteins:
+                proteins_label = QLabel(f"🥩 {self.recipe.proteins} г белков")
                 proteins_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #0d6efd;")
                 nutrition_layout.addWidget(proteins_label)
 
-            if self.recipe.nutrition.fats:
-                fats_label = QLabel(f"🥑 {self.recipe.nutrition.fats} г жиров")
+            if self.recipe.fats:
+                fats_label = QLabel(f"🥑 {self.recipe.fats} г жиров")
                 fats_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #ffc107;")
                 nutrition_layout.addWidget(fats_label)
 
-            if self.recipe.nutrition.carbohydrates:
-                carbs_label = QLabel(f"🍚 {self.recipe.nutrition.carbohydrates} г углеводов")
+            if self.recipe.carbohydrates:
+                carbs_label = QLabel(f"🍚 {self.recipe.carbohydrates} г углеводов")
                 carbs_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #198754;")
                 nutrition_layout.addWidget(carbs_label)
 
@@ -1241,8 +1230,7 @@ class RecipeCardDialog(QDialog):
     def on_add_to_cart(self):
         """Добавляет ингредиенты рецепта в корзину"""
         try:
-            ingredients = self.db.get_recipe_ingredients(self.recipe.id)
-            self.add_to_cart.emit(ingredients)  # ingredients - список кортежей
+            self.add_to_cart.emit(list(self.ingredients))  # ingredients - список кортежей
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", "Не удалось добавить ингредиенты в корзину")
 
@@ -1251,12 +1239,9 @@ class RecipeCardDialog(QDialog):
         try:
             is_favorite = self.db.is_recipe_favorite(self.user_id, self.recipe.id)
 
-            if is_favorite:
-                success = self.db.toggle_favorite(self.user_id, self.recipe.id)
-                new_status = False
-            else:
+            with self.db.track_action('toggle_favorite'):
                 success = self.db.toggle_favorite(self.user_id, self.recipe.id)
-                new_status = True
+            new_status = not is_favorite
 
             if success:
                 favorite_icon = "❤️" if new_status else "🤍"
@@ -1276,7 +1261,8 @@ class RecipeCardDialog(QDialog):
         """Переключает статус приготовления рецепта"""
         try:
             is_cooked = self.db.is_recipe_cooked(self.user_id, self.recipe.id)
-            success = self.db.mark_recipe_as_cooked(self.user_id, self.recipe.id, not is_cooked)
+            with self.db.track_action('toggle_cooked'):
+                success = self.db.mark_recipe_as_cooked(self.user_id, self.recipe.id, not is_cooked)
 
             if success:
                 new_status = not is_cooked
@@ -1,7 +1,7 @@
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
                              QCheckBox, QMessageBox, QFormLayout, QGroupBox,
-                             QSpinBox, QTabWidget, QWidget)
+                             QSpinBox, QTabWidget, QWidget, QComboBox, QLabel)
 from PyQt6.QtCore import QSettings, pyqtSignal
 
 
@@ -66,6 +66,23 @@ class SettingsDialog(QDialog):
         font_group.setLayout(font_layout)
         general_layout.addWidget(font_group)
 
+        # ГРУППА НАСТРОЕК БАЗЫ ДАННЫХ
+        db_group = QGroupBox("База данных")
+        db_layout = QFormLayout()
+
+        # Профиль движка SQLite (применяется после перезапуска)
+        self.db_profile = QComboBox()
+        self.db_profile.addItem("Быстрый", "fast")
+        self.db_profile.addItem("Надежный", "safe")
+        db_layout.addRow("Режим работы:", self.db_profile)
+
+        db_hint = QLabel("Изменение режима вступает в силу после перезапуска приложения")
+        db_hint.setStyleSheet("color: #6c757d; font-size: 11px;")
+        db_layout.addRow(db_hint)
+
+        db_group.setLayout(db_layout)
+        general_layout.addWidget(db_group)
+
         general_layout.addStretch()
         general_tab.setLayout(general_layout)
 
@@ -104,6 +121,10 @@ class SettingsDialog(QDialog):
             self.font_size.setValue(self.settings.value("font_size", 14, type=int))
             self.title_font_size.setValue(self.settings.value("title_font_size", 16, type=int))
 
+            # ЗАГРУЗКА ПРОФИЛЯ БАЗЫ ДАННЫХ
+            profile_index = self.db_profile.findData(self.settings.value("db_profile", "fast"))
+            self.db_profile.setCurrentIndex(max(profile_index, 0))
+
         except Exception as e:
             print(f"Ошибка загрузки настроек: {e}")
 
@@ -118,6 +139,9 @@ class SettingsDialog(QDialog):
             self.settings.setValue("title_font_size", self.title_font_size.value())
             # СОХРАНЕНИЕ НАСТРОЕК УВЕДОМЛЕНИЙ
 
+            # СОХРАНЕНИЕ ПРОФИЛЯ БАЗЫ ДАННЫХ
+            self.settings.setValue("db_profile", self.db_profile.currentData())
+
             # СОХРАНЕНИЕ ID ПОЛЬЗОВАТЕЛЯ ДЛЯ АВТОМАТИЧЕСКОГО ВХОДА
             if self.auto_login.isChecked():
                 self.settings.setValue("user_id", self.user_id)
@@ -3,6 +3,8 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                              QFrame)
 from PyQt6.QtCore import Qt
 
+from src.async_database import AsyncDataBase
+
 
 class ProfileRecipeCard(QFrame):
     """Виджет карточки рецепта для отображения в профиле пользователя"""
@@ -13,6 +15,7 @@ class ProfileRecipeCard(QFrame):
         self.db = db
         self.parent_window = parent_window
         self.user_id = None
+        self.image_request = None   # id фоновой загрузки изображения
 
         # Получаем user_id из parent_window разными способами
         if parent_window:
@@ -109,11 +112,21 @@ class ProfileRecipeCard(QFrame):
         """Загружает изображение рецепта"""
         recipe_id = self.recipe_data[0] if len(self.recipe_data) > 0 else None
         if recipe_id:
-            pixmap = self.db.get_recipe_image(recipe_id)
+            image = self.recipe_data[6] if len(self.recipe_data) > 6 else None
+            name = self.recipe_data[2] if len(self.recipe_data) > 2 else "Рецепт"
+            image_loader = getattr(getattr(self.parent_window, 'main_window', self.parent_window),
+                                   'image_loader', None)
+            if image_loader is not None:
+                # Карточка могла обновиться раньше, чем пришло прежнее изображение
+                if self.image_request is not None:
+                    image_loader.cancel(self.image_request)
+                self.image_request = image_loader.show_thumbnail(self.image_label, image, 178, 118,
+                                                                 expand=True, placeholder=name)
+                pixmap = self.image_label.pixmap()
+            else:
+                pixmap = self.db.get_recipe_thumbnail(image, 178, 118, expand=True, placeholder=name)
             if pixmap and not pixmap.isNull():
-                scaled_pixmap = pixmap.scaled(178, 118, Qt.AspectRatioMode.KeepAspectRatioByExpanding,
-                                              Qt.TransformationMode.SmoothTransformation)
-                self.image_label.setPixmap(scaled_pixmap)
+                self.image_label.setPixmap(pixmap)
                 self.image_label.setScaledContents(True)
                 return
 
@@ -168,11 +181,12 @@ class ProfileRecipeCard(QFrame):
 class ProfileWidget(QWidget):
     """Виджет профиля пользователя"""
 
-    def __init__(self, db, user_id, main_window):
+    def __init__(self, db, user_id, main_window, async_db=None):
         super().__init__()
         self.db = db
         self.user_id = user_id
         self.main_window = main_window
+        self.async_db = async_db or AsyncDataBase(db, parent=self)
 
         self.init_ui()
         self.update_profile()
@@ -315,10 +329,21 @@ class ProfileWidget(QWidget):
         self.setLayout(layout)
 
     def update_profile(self):
-        """Обновляет данные профиля пользователя"""
+        """Запрашивает данные профиля в фоновом потоке; показ - в show_profile"""
+        self.async_db.submit('profile', self._fetch_profile, self.user_id, on_result=self.show_profile)
+
+    def _fetch_profile(self, user_id):
+        """Читает профиль, избранные и приготовленные рецепты (выполняется в рабочем потоке)"""
+        return (
+            self.db.get_user_profile(user_id),
+            self.db.get_favorite_recipes(user_id),
+            self.db.get_cooked_recipes(user_id)
+        )
+
+    def show_profile(self, data):
+        """Отображает данные профиля, полученные из фонового потока"""
+        profile_data, favorite_recipes, cooked_recipes = data
         try:
-            # Загружаем данные профиля из базы данных
-            profile_data = self.db.get_user_profile(self.user_id)
             if profile_data:
                 profile_text = f"""
                     <div style="text-align: center; padding: 10px;">
@@ -336,14 +361,14 @@ class ProfileWidget(QWidget):
                     """
                 self.stats_label.setText(stats_text)
 
-            self.load_favorite_recipes()
-            self.load_cooked_recipes()
+            self.load_favorite_recipes(favorite_recipes)
+            self.load_cooked_recipes(cooked_recipes)
 
         except Exception as e:
             print(f"Ошибка при обновлении профиля: {e}")
 
-    def load_favorite_recipes(self):
-        """Загружает избранные рецепты пользователя"""
+    def load_favorite_recipes(self, favorite_recipes):
+        """Показывает карточки избранных рецептов пользователя"""
         # Очищаем предыдущие карточки избранных рецептов
         for i in reversed(range(self.favorites_layout.count())):
             item = self.favorites_layout.itemAt(i)
@@ -351,7 +376,6 @@ class ProfileWidget(QWidget):
                 item.widget().deleteLater()
 
         try:
-            favorite_recipes = self.db.get_favorite_recipes(self.user_id)
             if favorite_recipes:
                 for recipe in favorite_recipes:
                     card = ProfileRecipeCard(recipe, self.db, self)
@@ -364,15 +388,14 @@ class ProfileWidget(QWidget):
         except Exception as e:
             print(f"Ошибка при загрузке избранных рецептов: {e}")
 
-    def load_cooked_recipes(self):
-        """Загружает приготовленные рецепты пользователя"""
+    def load_cooked_recipes(self, cooked_recipes):
+        """Показывает карточки приготовленных рецептов пользователя"""
         # Очищаем предыдущие карточки приготовленных рецептов
         for i in reversed(range(self.cooked_layout.count())):
             item = self.cooked_layout.itemAt(i)
             if item.widget():
                 item.widget().deleteLater()
         try:
-            cooked_recipes = self.db.get_cooked_recipes(self.user_id)
             if cooked_recipes:
                 for recipe in cooked_recipes:
                     card = ProfileRecipeCard(recipe, self.db, self)
@@ -0,0 +1,425 @@
+"""Потоковый массовый импорт рецептов из JSON Lines и CSV.
+
+Запуск из каталога src:
+    python recipe_importer.py recipes.jsonl                              # импорт в ../data/Taste_Pazzle.db
+    python recipe_importer.py recipes.csv --batch-size 5000              # рецептов в одной транзакции
+    python recipe_importer.py recipes.jsonl --user-id 1 --db ../data/other.db
+
+Запись JSON Lines - один рецепт на строку:
+    {"name": "Оливье", "instruction": "...", "description": "...", "dish_type": "Салаты",
+     "cuisine": "Русская кухня", "cook_time": 40, "servings": 4, "external_url": "...",
+     "image": "olivier.jpg", "calories": 250, "proteins": 8, "fats": 15, "carbohydrates": 20,
+     "ingredients": [["Картофель", "3", "шт"], {"name": "Майонез", "quantity": "100", "unit": "г"}]}
+КБЖУ можно передать и вложенным объектом "nutrition". Необязательные поля: "user_id" - автор
+записи, "created_at" - дата в формате ISO, "id" - исходный id рецепта (новые id таких рецептов
+собираются в RecipeImporter.recipe_ids). --user-id задает автора записей без своего user_id;
+без него такие рецепты остаются без автора, как рецепты исходного каталога. Если в БД
+столбец Recipes.user_id объявлен NOT NULL, запись без автора останавливает импорт с номером строки.
+В CSV те же столбцы, а ингредиенты записываются в одну ячейку: "Картофель|3|шт; Майонез|100|г".
+Файлы с расширением .gz читаются как сжатые gzip.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from database import DataBase, Recipe, Ingredient, Dish_types, Cuisines
+
+
+# Рецептов в одной транзакции по умолчанию
+DEFAULT_BATCH_SIZE = 1000
+
+# Разделители ингредиентов в ячейке CSV
+CSV_INGREDIENT_SEPARATOR = ';'
+CSV_INGREDIENT_FIELD_SEPARATOR = '|'
+
+# Строки ингредиентов и КБЖУ передаются драйверу одним executemany кортежами, без
+# построчной подготовки параметров в SQLAlchemy
+INSERT_RECIPE_INGREDIENTS_SQL = (
+    'INSERT INTO "Recipe_ingredients" (recipe_id, ingredient_id, quantity, amount, unit) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+INSERT_NUTRITION_SQL = (
+    'INSERT INTO "Nutrition" (recipe_id, calories, proteins, fats, carbohydrates) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+
+
+# ===== ЧТЕНИЕ ИСХОДНЫХ ФАЙЛОВ =====
+def open_text(path, mode='r'):
+    """Открывает текстовый файл UTF-8; файлы .gz - через gzip с потоковым (де)сжатием"""
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_jsonl(path):
+    """Генератор пар (номер строки, запись) файла JSON Lines; файл читается построчно"""
+    with open_text(path) as source:
+        for number, line in enumerate(source, 1):
+            line = line.strip()
+            if line:
+                yield number, json.loads(line)
+
+
+def read_csv(path):
+    """Генератор пар (номер строки, запись) CSV с заголовком; ингредиенты разбираются из одной ячейки"""
+    with open_text(path) as source:
+        reader = csv.DictReader(source)
+        for row in reader:
+            ingredients = []
+            for item in (row.get('ingredients') or '').split(CSV_INGREDIENT_SEPARATOR):
+                parts = [part.strip() for part in item.split(CSV_INGREDIENT_FIELD_SEPARATOR)]
+                if parts[0]:
+                    ingredients.append((parts + ['', ''])[:3])
+            row['ingredients'] = ingredients
+            yield reader.line_num, row
+
+
+def iter_records(path, file_format=None):
+    """Выбирает читателя по формату ("jsonl" или "csv") или по расширению файла
+
+    Читатель выдает пары (номер строки, запись) для RecipeImporter.run.
+    """
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith(('.csv', '.csv.gz')) else 'jsonl'
+    if file_format == 'csv':
+        return read_csv(path)
+    return read_jsonl(path)
+
+
+def _to_number(value, number_type):
+    """Приводит значение к числу; пустые и некорректные значения дают None"""
+    if value is None or value == '':
+        return None
+    try:
+        return number_type(float(str(value).replace(',', '.')))
+    except ValueError:
+        return None
+
+
+def _datetime(value):
+    """Дата из строки ISO или None"""
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    """Строка без пробелов по краям или None для пустого значения"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def normalize_record(raw):
+    """Приводит исходную запись к словарю полей рецепта; без названия возвращает None"""
+    name = _text(raw.get('name'))
+    if not name:
+        return None
+
+    ingredients = []
+    for item in raw.get('ingredients') or []:
+        if isinstance(item, dict):
+            item = (item.get('name'), item.get('quantity'), item.get('unit'))
+        ingredient_name = _text(item[0]) if item else None
+        if ingredient_name:
+            quantity = item[1] if len(item) > 1 and item[1] not in (None, '') else 'по вкусу'
+            unit = item[2] if len(item) > 2 and item[2] is not None else ''
+            ingredients.append((ingredient_name, str(quantity).strip(), str(unit).strip()))
+
+    nutrition = raw.get('nutrition') or raw
+    return {
+        'source_id': raw.get('id'),
+        'user_id': _to_number(raw.get('user_id'), int),
+        'created_at': _datetime(raw.get('created_at')),
+        'name': name,
+        'instruction': _text(raw.get('instruction')),
+        'description': _text(raw.get('description')),
+        'dish_type': _text(raw.get('dish_type')),
+        'cuisine': _text(raw.get('cuisine')),
+        'cook_time': _to_number(raw.get('cook_time'), int),
+        'servings': _to_number(raw.get('servings'), int),
+        'external_url': _text(raw.get('external_url')),
+        'image': _text(raw.get('image')),
+        'nutrition': (
+            _to_number(nutrition.get('calories'), int),
+            _to_number(nutrition.get('proteins'), float),
+            _to_number(nutrition.get('fats'), float),
+            _to_number(nutrition.get('carbohydrates'), float),
+        ),
+        'ingredients': ingredients,
+    }
+
+
+# ===== ЗАПИСЬ В БАЗУ ДАННЫХ =====
+class RecipeImporter:
+    """Массовая загрузка рецептов пачками
+
+    Названия ингредиентов, типов блюд и кухонь переводятся в id по словарям в памяти;
+    недостающие создаются одной вставкой на пачку. Рецепты пачки вставляются одним
+    многострочным INSERT ... RETURNING, ингредиенты рецептов и КБЖУ - executemany,
+    все в одной транзакции; FTS-индекс заполняется одним запросом на пачку.
+    """
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, user_id=None, verbose=False, restore=False):
+        self.db = db
+        self.batch_size = batch_size
+        # user_id - автор записей без своего автора. При восстановлении (restore) пустые
+        # автор и дата создания сохраняются как есть, а user_id подставляется, только
+        # если БД не допускает рецепт без автора
+        self.user_id = user_id
+        self.verbose = verbose
+        self.restore = restore
+        self.author_required = self._author_required(db)
+        self.unique_ingredients = self._unique_ingredients(db)
+
+        # название -> id; при одинаковых названиях ингредиентов берется первый
+        self.ingredient_ids = {}
+        for ingredient_id, name in reversed(db.get_ingredients()):
+            self.ingredient_ids[name] = ingredient_id
+        self.dish_type_ids = {name: row_id for row_id, name in db.get_dish_types()}
+        self.cuisine_ids = {name: row_id for row_id, name in db.get_cuisines()}
+
+        # (количество, единица) -> (quantity, amount, unit): в каталогах значения часто повторяются
+        self._quantity_values = {}
+
+        self.recipe_ids = {}    # исходный id рецепта из записи -> новый id
+        self._batch = []
+        self._started = None
+
+        self.stats = {
+            'records': 0,
+            'recipes': 0,
+            'ingredient_rows': 0,
+            'new_ingredients': 0,
+            'dropped_ingredients': 0,
+            'skipped': 0,
+            'failed_batches': 0,
+            'seconds': 0.0,
+        }
+
+    @staticmethod
+    def _author_required(db):
+        """Объявлен ли в этой БД столбец Recipes.user_id как NOT NULL"""
+        with db.engine.connect() as connection:
+            for column in connection.exec_driver_sql('PRAGMA table_info("Recipes")'):
+                if column[1] == 'user_id':
+                    return bool(column[3])
+        return False
+
+    @staticmethod
+    def _unique_ingredients(db):
+        """Запрещает ли первичный ключ Recipe_ingredients повтор ингредиента в рецепте
+
+        В исходной БД проекта ключа нет, и рецепт может содержать ингредиент дважды.
+        """
+        with db.engine.connect() as connection:
+            key = {column[1] for column in connection.exec_driver_sql('PRAGMA table_info("Recipe_ingredients")')
+                   if column[5]}
+        return {'recipe_id', 'ingredient_id'} <= key
+
+    def run(self, records):
+        """Импортирует пары (номер строки, запись) из итерируемого источника и возвращает статистику"""
+        try:
+            for line_number, raw in records:
+                self.add(raw, line_number)
+        finally:
+            self.finish()
+        return self.stats
+
+    def add(self, raw, line_number=None):
+        """Добавляет исходную запись в текущую пачку; полная пачка сразу записывается
+
+        Запись без автора, которую нельзя сохранить в этой БД, вызывает ValueError
+        с номером строки: иначе она сорвала бы вставку всей пачки.
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.stats['records'] += 1
+        record = normalize_record(raw)
+        if record is None:
+            self.stats['skipped'] += 1
+            return
+        if record['user_id'] is None and (self.author_required or not self.restore):
+            record['user_id'] = self.user_id
+        if record['user_id'] is None and self.author_required:
+            raise ValueError(
+                f"Строка {line_number or self.stats['records']}: у рецепта {record['name']!r} нет автора, "
+                f"а в этой БД Recipes.user_id объявлен NOT NULL; укажите автора через --user-id"
+            )
+        if record['created_at'] is None and not self.restore:
+            record['created_at'] = datetime.now()
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленную неполную пачку"""
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._import_batch(batch)
+
+    def finish(self):
+        """Записывает остаток, сбрасывает кэши DataBase и подводит итоги импорта"""
+        try:
+            self.flush()
+        finally:
+            # Записи шли в обход методов DataBase
+            self.db.invalidate_caches()
+
+        seconds = time.perf_counter() - self._started if self._started is not None else 0.0
+        rows = self.stats['recipes'] + self.stats['ingredient_rows']
+        self.stats['seconds'] = seconds
+        self.stats['rows_per_second'] = rows / seconds if seconds else 0.0
+        self.stats['recipes_per_second'] = self.stats['recipes'] / seconds if seconds else 0.0
+        return self.stats
+
+    def _import_batch(self, batch):
+        """Записывает пачку одной транзакцией; при ошибке пачка откатывается целиком"""
+        saved_maps = (dict(self.ingredient_ids), dict(self.dish_type_ids), dict(self.cuisine_ids))
+        try:
+            with self.db.engine.begin() as connection:
+                counts = self._write_batch(connection, batch)
+        except Exception as e:
+            # Id, созданные в откатанной транзакции, недействительны
+            self.ingredient_ids, self.dish_type_ids, self.cuisine_ids = saved_maps
+            self.stats['failed_batches'] += 1
+            self.stats['skipped'] += len(batch)
+            print(f"Ошибка импорта пачки из {len(batch)} рецептов: {e}")
+            return
+
+        self.stats['recipes'] += len(batch)
+        self.stats['ingredient_rows'] += counts[0]
+        self.stats['new_ingredients'] += counts[1]
+        self.stats['dropped_ingredients'] += counts[2]
+        if self.verbose:
+            print(f"Импортировано рецептов: {self.stats['recipes']}")
+
+    @staticmethod
+    def _resolve_names(connection, table, ids_by_name, names):
+        """Добавляет в таблицу недостающие названия и дописывает их id в словарь; возвращает число новых"""
+        missing = sorted({name for name in names if name and name not in ids_by_name})
+        if missing:
+            inserted = connection.execute(
+                table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                [{'name': name} for name in missing]
+            ).scalars().all()
+            ids_by_name.update(zip(missing, inserted))
+        return len(missing)
+
+    def _quantity_columns(self, quantity, unit):
+        """Столбцы (quantity, amount, unit) строки ингредиента рецепта с запоминанием"""
+        key = (quantity, unit)
+        columns = self._quantity_values.get(key)
+        if columns is None:
+            values = DataBase._ingredient_quantity_values(quantity, unit)
+            columns = (values['quantity'], values['amount'], values['unit'])
+            self._quantity_values[key] = columns
+        return columns
+
+    def _write_batch(self, connection, batch):
+        """Вставляет пачку рецептов; возвращает (строк ингредиентов, новых ингредиентов, отброшенных повторов)"""
+        fts_suspended = self.db.suspend_search_index(connection)
+
+        self._resolve_names(connection, Dish_types.__table__, self.dish_type_ids,
+                            (record['dish_type'] for record in batch))
+        self._resolve_names(connection, Cuisines.__table__, self.cuisine_ids,
+                            (record['cuisine'] for record in batch))
+        new_ingredients = self._resolve_names(
+            connection, Ingredient.__table__, self.ingredient_ids,
+            (name for record in batch for name, _, _ in record['ingredients'])
+        )
+
+        recipes_table = Recipe.__table__
+        recipe_ids = connection.execute(
+            recipes_table.insert().returning(recipes_table.c.id, sort_by_parameter_order=True),
+            [{
+                'user_id': record['user_id'],
+                'created_at': record['created_at'],
+                'name': record['name'],
+                'instruction': record['instruction'],
+                'description': record['description'],
+                'dish_type_id': self.dish_type_ids.get(record['dish_type']),
+                'cuisine_id': self.cuisine_ids.get(record['cuisine']),
+                'cook_time': record['cook_time'],
+                'servings': record['servings'],
+                'external_url': record['external_url'],
+                'image': record['image'],
+            } for record in batch]
+        ).scalars().all()
+
+        ingredient_rows = []
+        nutrition_rows = []
+        dropped = 0
+        for recipe_id, record in zip(recipe_ids, batch):
+            seen = set()
+            for name, quantity, unit in record['ingredients']:
+                ingredient_id = self.ingredient_ids[name]
+                # Повтор ингредиента в рецепте нарушил бы первичный ключ (recipe_id, ingredient_id)
+                if self.unique_ingredients and ingredient_id in seen:
+                    dropped += 1
+                    continue
+                seen.add(ingredient_id)
+                ingredient_rows.append((recipe_id, ingredient_id) + self._quantity_columns(quantity, unit))
+            if any(record['nutrition']):
+                nutrition_rows.append((recipe_id,) + record['nutrition'])
+
+        if ingredient_rows:
+            connection.exec_driver_sql(INSERT_RECIPE_INGREDIENTS_SQL, ingredient_rows)
+        if nutrition_rows:
+            connection.exec_driver_sql(INSERT_NUTRITION_SQL, nutrition_rows)
+
+        if fts_suspended:
+            self.db.resume_search_index(connection, min(recipe_ids), max(recipe_ids))
+
+        for recipe_id, record in zip(recipe_ids, batch):
+            if record['source_id'] is not None:
+                self.recipe_ids[record['source_id']] = recipe_id
+
+        return len(ingredient_rows), new_ingredients, dropped
+
+
+def import_recipes(db, path, file_format=None, batch_size=DEFAULT_BATCH_SIZE, user_id=None, verbose=False):
+    """Импортирует рецепты из файла и возвращает статистику импорта"""
+    importer = RecipeImporter(db, batch_size=batch_size, user_id=user_id, verbose=verbose)
+    return importer.run(iter_records(path, file_format))
+
+
+def print_report(stats):
+    """Печатает итоги импорта"""
+    print(f"Прочитано записей: {stats['records']}")
+    print(f"Импортировано рецептов: {stats['recipes']}, строк ингредиентов: {stats['ingredient_rows']}, "
+          f"новых ингредиентов: {stats['new_ingredients']}")
+    if stats['dropped_ingredients']:
+        print(f"Повторов ингредиента в рецепте отброшено: {stats['dropped_ingredients']}")
+    if stats['skipped']:
+        print(f"Пропущено записей: {stats['skipped']} (ошибочных пачек: {stats['failed_batches']})")
+    print(f"Время: {stats['seconds']:.2f} с, {stats['rows_per_second']:.0f} строк/с, "
+          f"{stats['recipes_per_second']:.0f} рецептов/с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовый импорт рецептов в БД «Пазл Вкусов»")
+    parser.add_argument('path', help="файл JSON Lines (.jsonl) или CSV (.csv)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="формат файла (по умолчанию - по расширению)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="рецептов в одной транзакции")
+    parser.add_argument('--user-id', type=int,
+                        help="id автора рецептов без своего user_id (без него они остаются без автора)")
+    parser.add_argument('--db', default='../data/Taste_Pazzle.db', help="путь к файлу БД")
+    parser.add_argument('-v', '--verbose', action='store_true', help="печатать ход импорта")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"файл не найден: {args.path}")
+
+    database = DataBase(db_path=args.db)
+    try:
+        print_report(import_recipes(database, args.path, args.format, args.batch_size, args.user_id, args.verbose))
+    except ValueError as e:
+        parser.exit(1, f"Импорт остановлен. {e}\n")
@@ -0,0 +1,68 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# Модули src импортируются так же, как при запуске из каталога src (python main.py)
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from database import DataBase, RECIPE_IMAGES_DIR, STOCK_RECIPE_IMAGES
+
+# Исходная БД проекта: 8 рецептов без автора со стоковыми изображениями
+SHIPPED_DB = os.path.join(os.path.dirname(SRC_DIR), 'data', 'Taste_Pazzle.db')
+
+
+def copy_stock_images(target, extra=()):
+    """Копирует стоковые изображения проекта в target, чтобы миграции не трогали исходники"""
+    os.makedirs(target, exist_ok=True)
+    for image_file in STOCK_RECIPE_IMAGES + tuple(extra):
+        shutil.copy(os.path.join(RECIPE_IMAGES_DIR, image_file), os.path.join(target, image_file))
+    return str(target)
+
+
+def open_database(db_path, legacy_root, migrate=True):
+    """Открывает БД с каталогом изображений проекта legacy_root и (по умолчанию) мигрирует ее"""
+    database = DataBase(db_path=str(db_path), auto_migrate=False, profile='safe')
+    database.image_store.legacy_root = legacy_root
+    if migrate:
+        database.apply_pending_migrations()
+        database.ensure_indexes()
+    return database
+
+
+@pytest.fixture
+def shipped_db_path(tmp_path):
+    """Путь к копии исходной БД проекта"""
+    db_path = tmp_path / 'data' / 'Taste_Pazzle.db'
+    db_path.parent.mkdir()
+    shutil.copy(SHIPPED_DB, db_path)
+    return db_path
+
+
+@pytest.fixture
+def legacy_root(tmp_path):
+    """Копия стоковых изображений проекта"""
+    return copy_stock_images(tmp_path / 'img')
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Новая БД со всеми миграциями во временном каталоге"""
+    database = DataBase(db_path=str(tmp_path / 'test.db'), profile='safe')
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def user_id(db):
+    db.register_user('tester', 'secret')
+    return db.get_users('tester', 'secret')[0][0]
+
+
+@pytest.fixture
+def dish_type_id(db):
+    return db.get_dish_types()[0][0]
@@ -0,0 +1,111 @@
+import shutil
+import sqlite3
+
+import pytest
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+
+from catalog_backup import export_catalog, import_catalog, iter_catalog
+from conftest import SHIPPED_DB, open_database
+from database import Recipe
+
+
+def _canonical(db):
+    """Содержимое каталога без id: пользователи и рецепты сопоставлены по логину и названию"""
+    logins, names = {}, {}
+    catalog = {'user': [], 'recipe': [], 'favorite': [], 'cooked': []}
+    for line in iter_catalog(db):
+        kind = line.pop('type')
+        if kind == 'header':
+            continue
+        if kind == 'user':
+            logins[line['id']] = line['login']
+            catalog['user'].append((line['login'], str(line['password'])))
+        elif kind == 'recipe':
+            names[line.pop('id')] = line['name']
+            line['user_id'] = logins.get(line['user_id'])
+            catalog['recipe'].append(line)
+        else:
+            catalog[kind].append((logins[line['user_id']], names[line['recipe_id']], line.get('cooked_at')))
+    catalog['recipe'].sort(key=lambda recipe: recipe['name'])
+    for kind in ('user', 'favorite', 'cooked'):
+        catalog[kind].sort()
+    return catalog
+
+
+@pytest.fixture
+def shipped_db(shipped_db_path, legacy_root):
+    db = open_database(shipped_db_path, legacy_root)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def emptied_db(tmp_path, legacy_root):
+    """Мигрированная копия исходной БД без пользователей и рецептов: схема та же, что у источника"""
+    db_path = tmp_path / 'target' / 'Taste_Pazzle.db'
+    db_path.parent.mkdir()
+    shutil.copy(SHIPPED_DB, db_path)
+    open_database(db_path, legacy_root).close()
+    with sqlite3.connect(db_path) as connection:
+        for table_name in ('Recipe_ingredients', 'Nutrition', 'Recipe_categories', 'Favorites',
+                           'Cooked_recipes', 'cart_items', 'Cart', 'Recipes', 'Users'):
+            connection.execute(f'DELETE FROM "{table_name}"')
+    db = open_database(db_path, legacy_root)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def backup_path(tmp_path, shipped_db):
+    path = str(tmp_path / 'catalog.jsonl.gz')
+    export_catalog(shipped_db, path)
+    return path
+
+
+def test_round_trip_reproduces_shipped_catalog(shipped_db, backup_path, emptied_db):
+    stats = import_catalog(emptied_db, backup_path)
+
+    assert (stats['recipes'], stats['skipped'], stats['skipped_links']) == (8, 0, 0)
+    assert (stats['favorites'], stats['cooked'], stats['dropped_ingredients']) == (4, 3, 0)
+    source = _canonical(shipped_db)
+    assert all(recipe['user_id'] is None for recipe in source['recipe'])
+    assert _canonical(emptied_db) == source
+
+
+def test_new_schema_drops_repeated_ingredient_and_reports_it(shipped_db, backup_path, db):
+    # В «Картофельном пюре» соль указана дважды, а новая схема запрещает повтор ключом
+    stats = import_catalog(db, backup_path)
+
+    assert (stats['recipes'], stats['skipped_links'], stats['dropped_ingredients']) == (8, 0, 1)
+    source, restored = _canonical(shipped_db), _canonical(db)
+    for kind in ('user', 'favorite', 'cooked'):
+        assert restored[kind] == source[kind]
+    for recipe in source['recipe'] + restored['recipe']:
+        recipe['ingredients'] = sorted({item[0]: item for item in reversed(recipe['ingredients'])}.values())
+    assert restored['recipe'] == source['recipe']
+
+
+def test_user_id_does_not_replace_null_authors(backup_path, db, user_id):
+    import_catalog(db, backup_path, user_id=user_id)
+
+    with sqlite3.connect(db.engine.url.database) as connection:
+        authors = {row[0] for row in connection.execute('SELECT user_id FROM "Recipes"')}
+    assert authors == {None}
+
+
+def test_null_author_needs_user_id_when_schema_requires_one(tmp_path, legacy_root, backup_path):
+    db_path = str(tmp_path / 'strict.db')
+    ddl = str(CreateTable(Recipe.__table__).compile(dialect=sqlite.dialect()))
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(ddl.replace('user_id INTEGER,', 'user_id INTEGER NOT NULL,'))
+    db = open_database(db_path, legacy_root)
+    try:
+        # Строки 1-4 - заголовок и три пользователя, первый рецепт - строка 5
+        with pytest.raises(ValueError, match=r"^Строка 5: "):
+            import_catalog(db, backup_path)
+
+        stats = import_catalog(db, backup_path, user_id=1)
+        assert (stats['recipes'], stats['skipped_links']) == (8, 0)
+    finally:
+        db.close()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import sqlite3
+
+from conftest import copy_stock_images, open_database
+from database import RECIPE_IMAGES_DIR, STOCK_RECIPE_IMAGES
+
+
+def _add_recipe(db, user_id, dish_type_id, name, image=None):
+    return db.add_recipe(user_id, name, "инструкция", "описание", dish_type_id, None, 10,
+                         [], (0, 0, 0, 0), image=image)
+
+
+def _refcount(db, image):
+    with sqlite3.connect(db.engine.url.database) as connection:
+        row = connection.execute("SELECT refcount FROM image_refs WHERE image = ?", (image,)).fetchone()
+    return row[0] if row else None
+
+
+def _all_recipes(db):
+    return [recipe for recipes in db.get_recipes_with_filters(None).values() for recipe in recipes]
+
+
+def _shard_dirs(path):
+    return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+
+def test_store_lives_next_to_database(tmp_path, db, user_id, dish_type_id):
+    shards_before = _shard_dirs(RECIPE_IMAGES_DIR)
+
+    image = db.save_recipe_image(b'image bytes')
+
+    assert db.image_store.root == str(tmp_path / 'recipe_img')
+    assert os.path.isfile(tmp_path / 'recipe_img' / image)
+    assert _shard_dirs(RECIPE_IMAGES_DIR) == shards_before
+
+
+def test_same_content_is_stored_once_and_refcounted(db, user_id, dish_type_id):
+    first = _add_recipe(db, user_id, dish_type_id, "Первый", image=b'same picture')
+    second = _add_recipe(db, user_id, dish_type_id, "Второй", image=b'same picture')
+    image = db.get_recipe_by_id(first).image
+
+    assert db.get_recipe_by_id(second).image == image
+    assert _refcount(db, image) == 2
+
+    assert db.delete_recipe(first)
+    assert os.path.exists(db.image_store.path(image))
+    assert _refcount(db, image) == 1
+
+    assert db.delete_recipe(second)
+    assert not os.path.exists(db.image_store.path(image))
+    assert _refcount(db, image) is None
+
+
+def test_replaced_image_is_released(db, user_id, dish_type_id):
+    recipe_id = _add_recipe(db, user_id, dish_type_id, "Рецепт", image=b'old picture')
+    old_image = db.get_recipe_by_id(recipe_id).image
+
+    assert db.update_recipe(recipe_id, "Рецепт", "инструкция", "описание", dish_type_id, None, 10,
+                            [], (0, 0, 0, 0), image=b'new picture')
+
+    new_image = db.get_recipe_by_id(recipe_id).image
+    assert new_image != old_image
+    assert not os.path.exists(db.image_store.path(old_image))
+    assert _refcount(db, new_image) == 1
+
+
+def test_shipped_catalog_links_stock_images(shipped_db_path, legacy_root):
+    db = open_database(shipped_db_path, legacy_root)
+    try:
+        recipes = _all_recipes(db)
+        assert len(recipes) == 8
+        for recipe in recipes:
+            assert db.image_store.digest_of(recipe.image)
+            assert _refcount(db, recipe.image) == 1
+
+        # Стоковые файлы остаются на месте, а хранилище делит с ними содержимое на диске
+        for image_file in STOCK_RECIPE_IMAGES:
+            original = os.path.join(legacy_root, image_file)
+            stored = db.image_store.put(original)
+            assert os.path.samefile(original, db.image_store.path(stored))
+
+        # Стоковое изображение не удаляется вместе с последним рецептом
+        image = recipes[0].image
+        assert db.delete_recipe(recipes[0].id)
+        assert not os.path.exists(db.image_store.path(image))
+        assert all(os.path.exists(os.path.join(legacy_root, name)) for name in STOCK_RECIPE_IMAGES)
+    finally:
+        db.close()
+
+
+def test_legacy_image_is_moved_into_store(tmp_path, shipped_db_path):
+    legacy_root = copy_stock_images(tmp_path / 'img', extra=('user_2b990986.jpg',))
+    with sqlite3.connect(shipped_db_path) as connection:
+        connection.execute("UPDATE Recipes SET image = 'user_2b990986.jpg' WHERE id = 1")
+
+    db = open_database(shipped_db_path, legacy_root)
+    try:
+        image = db.get_recipe_by_id(1).image
+
+        assert db.image_store.digest_of(image)
+        assert os.path.isfile(db.image_store.path(image))
+        assert not os.path.exists(os.path.join(legacy_root, 'user_2b990986.jpg'))
+    finally:
+        db.close()
+
+
+def test_store_inside_project_images_is_relocated(shipped_db_path, legacy_root):
+    db = open_database(shipped_db_path, legacy_root)
+    try:
+        # Так выглядела БД, мигрированная, пока хранилище лежало среди изображений проекта
+        images = [recipe.image for recipe in _all_recipes(db)]
+        for image in images:
+            old_path = os.path.join(legacy_root, image)
+            os.makedirs(os.path.dirname(old_path), exist_ok=True)
+            shutil.copy(db.image_store.path(image), old_path)
+            os.remove(db.image_store.path(image))
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DELETE FROM schema_version WHERE version >= 11")
+
+        db.apply_pending_migrations()
+
+        assert _shard_dirs(legacy_root) == []
+        for image in images:
+            assert os.path.isfile(db.image_store.path(image))
+        for image_file in STOCK_RECIPE_IMAGES:
+            stored = db.image_store.put(os.path.join(legacy_root, image_file))
+            assert os.path.samefile(os.path.join(legacy_root, image_file), db.image_store.path(stored))
+    finally:
+        db.close()
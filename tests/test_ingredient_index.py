@@ -0,0 +1,63 @@
+import pytest
+
+from database import IngredientIndex
+
+INGREDIENTS = [(1, "Соль"), (2, "Сахар"), (3, "Морская соль"), (4, "Мука")]
+
+
+@pytest.fixture
+def index():
+    # Соль есть почти в каждом рецепте (битовая карта), остальные редки (массивы id)
+    pairs = [(recipe_id, 1) for recipe_id in range(1, 200)]
+    pairs += [(5, 2), (7, 2), (150, 2), (100000, 3), (5, 4), (7, 4), (7, 4)]
+    index = IngredientIndex()
+    index.build(pairs, INGREDIENTS)
+    return index
+
+
+def _ids(bitmap):
+    return IngredientIndex.bitmap_to_ids(bitmap)
+
+
+def test_all_and_any(index):
+    assert _ids(index.recipes_with_all(["сахар", "мука"])) == [5, 7]
+    assert _ids(index.recipes_with_all(["сахар", "соль"])) == [5, 7, 150]
+    assert _ids(index.recipes_with_all(["сахар", "перец"])) == []
+    assert _ids(index.recipes_with_any(["мука", "морская"])) == [5, 7, 100000]
+    # Фрагмент подходит к нескольким ингредиентам: "соль" и "морская соль"
+    assert _ids(index.recipes_with_all(["соль"]))[-2:] == [199, 100000]
+
+
+def test_sparse_ingredient_does_not_grow_with_recipe_id(index):
+    # Один рецепт с большим id хранится массивом, а не битовой картой на 100000 бит
+    assert index.memory_usage() < 1000
+
+
+def test_incremental_updates(index):
+    index.set_recipe(5, [2])
+    assert _ids(index.recipes_with_all(["мука"])) == [7]
+    assert 5 not in _ids(index.recipes_with_all(["соль"]))
+
+    index.set_recipe(300000, [4, 1])
+    assert _ids(index.recipes_with_all(["мука", "соль"])) == [7, 300000]
+
+    index.remove_recipe(7)
+    index.remove_recipe(100000)
+    assert _ids(index.recipes_with_any(["мука", "морская"])) == [300000]
+    assert _ids(index.recipes_with_all(["сахар"])) == [5, 150]
+
+
+@pytest.mark.parametrize('max_sql_in_ids', [900, 0])
+def test_listing_filter_uses_index(db, user_id, dish_type_id, monkeypatch, max_sql_in_ids):
+    # При 0 найденные id не передаются в IN, а проверяются при обходе строк
+    monkeypatch.setattr(db, 'MAX_SQL_IN_IDS', max_sql_in_ids)
+    salt = db.add_ingredient("Соль")
+    sugar = db.add_ingredient("Сахар")
+    both = db.add_recipe(user_id, "Оба", "", "", dish_type_id, None, 10,
+                         [(salt, '1', 'г'), (sugar, '2', 'г')], (0, 0, 0, 0))
+    db.add_recipe(user_id, "Только соль", "", "", dish_type_id, None, 10, [(salt, '1', 'г')], (0, 0, 0, 0))
+
+    recipes, _ = db.get_recipes_page(user_id, ingredient_filter=["соль", "сахар"])
+    assert [recipe.id for recipe in recipes] == [both]
+    assert db.find_recipes_by_ingredients(["сахар", "соль"], match_all=False) == sorted(
+        recipe.id for recipe in db.get_recipes_page(user_id)[0])
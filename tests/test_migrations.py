@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from conftest import open_database
+from database import DataBase
+
+
+def _columns(db_path, table_name):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+
+
+def test_new_database_records_every_migration(db):
+    assert db.get_schema_version() == DataBase.MIGRATIONS[-1][0]
+    assert db.get_pending_migrations() == []
+    assert db.apply_pending_migrations() == []
+
+
+def test_shipped_database_migrates_once_and_quietly(shipped_db_path, legacy_root, capsys):
+    db = open_database(shipped_db_path, legacy_root)
+    db.close()
+    assert "рецептов" not in capsys.readouterr().out
+
+    db = open_database(shipped_db_path, legacy_root, migrate=False)
+    try:
+        assert db.apply_pending_migrations() == []
+        assert capsys.readouterr().out == ""
+    finally:
+        db.close()
+
+
+def test_failed_migration_is_not_recorded_and_retried(shipped_db_path, legacy_root, monkeypatch):
+    with sqlite3.connect(shipped_db_path) as connection:
+        connection.execute("UPDATE Recipes SET image = NULL WHERE id = 1")
+
+    db = open_database(shipped_db_path, legacy_root, migrate=False)
+    try:
+        def broken_put(*args, **kwargs):
+            raise OSError("диск недоступен")
+
+        monkeypatch.setattr(db.image_store, 'put', broken_put)
+        with pytest.raises(OSError):
+            db.apply_pending_migrations()
+        assert db.get_schema_version() == 2
+        assert db.get_recipe_by_id(1).image is None
+
+        monkeypatch.undo()
+        applied = db.apply_pending_migrations()
+        assert applied[0] == (3, 'assign_recipe_images')
+        assert db.get_schema_version() == DataBase.MIGRATIONS[-1][0]
+        assert db.image_store.digest_of(db.get_recipe_by_id(1).image)
+    finally:
+        db.close()
+
+
+def test_nutrition_gets_primary_key(shipped_db_path, legacy_root):
+    assert not any(column[5] for column in _columns(shipped_db_path, 'Nutrition'))
+
+    db = open_database(shipped_db_path, legacy_root)
+    try:
+        assert [column[1] for column in _columns(shipped_db_path, 'Nutrition') if column[5]] == ['recipe_id']
+        assert db.get_recipe_by_id(1).calories is not None
+        assert 'ix_nutrition_recipe' not in db._get_existing_index_names()
+    finally:
+        db.close()
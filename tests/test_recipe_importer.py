@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+
+from conftest import open_database
+from database import Recipe
+from recipe_importer import import_recipes
+
+
+def _write_jsonl(path, records):
+    with open(path, 'w', encoding='utf-8') as target:
+        for record in records:
+            target.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return str(path)
+
+
+def _authors(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return dict(connection.execute('SELECT name, user_id FROM "Recipes"'))
+
+
+def _missing_dates(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM "Recipes" WHERE created_at IS NULL').fetchone()[0]
+
+
+RECORDS = [
+    {"name": "Свой автор", "user_id": None, "ingredients": [["Соль", "1", "г"]]},
+    {"name": "Без автора", "dish_type": "Салаты", "ingredients": [["Сахар", "2 ст.л.", ""]]},
+]
+
+
+def test_recipe_without_author_keeps_null_author(tmp_path, db, user_id):
+    records = [dict(RECORDS[0], user_id=user_id), RECORDS[1]]
+    stats = import_recipes(db, _write_jsonl(tmp_path / 'recipes.jsonl', records))
+
+    assert (stats['recipes'], stats['skipped']) == (2, 0)
+    assert _authors(db.engine.url.database) == {"Свой автор": user_id, "Без автора": None}
+    assert _missing_dates(db.engine.url.database) == 0
+
+
+def test_default_author_fills_only_missing_authors(tmp_path, db, user_id):
+    db.register_user('other', 'secret')
+    other_id = db.get_users('other', 'secret')[0][0]
+    records = [dict(RECORDS[0], user_id=user_id), RECORDS[1]]
+    import_recipes(db, _write_jsonl(tmp_path / 'recipes.jsonl', records), user_id=other_id)
+
+    assert _authors(db.engine.url.database) == {"Свой автор": user_id, "Без автора": other_id}
+
+
+@pytest.fixture
+def strict_db(tmp_path, legacy_root):
+    """БД, в которой Recipes.user_id объявлен NOT NULL, как в созданных прежними версиями"""
+    db_path = str(tmp_path / 'strict.db')
+    ddl = str(CreateTable(Recipe.__table__).compile(dialect=sqlite.dialect()))
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(ddl.replace('user_id INTEGER,', 'user_id INTEGER NOT NULL,'))
+    db = open_database(db_path, legacy_root)
+    yield db
+    db.close()
+
+
+def test_missing_author_fails_with_line_number_when_schema_requires_one(tmp_path, strict_db):
+    # Пустая строка тоже считается: запись без автора стоит в строке 3
+    path = tmp_path / 'recipes.jsonl'
+    path.write_text(json.dumps(dict(RECORDS[0], user_id=1), ensure_ascii=False) + '\n\n'
+                    + json.dumps(RECORDS[1], ensure_ascii=False) + '\n', encoding='utf-8')
+    strict_db.register_user('tester', 'secret')
+
+    with pytest.raises(ValueError, match=r"Строка 3: .*'Без автора'"):
+        import_recipes(strict_db, str(path))
+
+    stats = import_recipes(strict_db, str(path), user_id=1)
+    assert (stats['recipes'], stats['skipped']) == (2, 0)
@@ -0,0 +1,39 @@
+from database import Dish_types, PRIORITY_DISH_TYPES
+
+
+def _dish_type_id(db, name):
+    session = db.Session()
+    try:
+        dish_type = session.query(Dish_types).filter_by(name=name).first()
+        if dish_type is None:
+            dish_type = Dish_types(name=name)
+            session.add(dish_type)
+            session.commit()
+        return dish_type.id
+    finally:
+        session.close()
+
+
+def _add_recipe(db, user_id, dish_type_id, name):
+    return db.add_recipe(user_id, name, "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+
+
+def test_pages_arrive_in_category_display_order(db, user_id):
+    # По алфавиту "Гарниры" и "Выпечка" идут раньше "Салатов", но в окне "Салаты" первые
+    for dish_type, names in [("Выпечка", ["Пирог"]), ("Гарниры", ["Рис", "Гречка"]),
+                             ("Салаты", ["Оливье", "Цезарь"]), ("Аперитивы", ["Спритц"])]:
+        dish_type_id = _dish_type_id(db, dish_type)
+        for name in names:
+            _add_recipe(db, user_id, dish_type_id, name)
+
+    order, after = [], None
+    while True:
+        recipes, after = db.get_recipes_page(user_id, after=after, limit=2)
+        order += [(recipe.dish_type, recipe.name) for recipe in recipes]
+        if after is None:
+            break
+
+    assert order == [("Салаты", "Оливье"), ("Салаты", "Цезарь"),
+                     ("Гарниры", "Гречка"), ("Гарниры", "Рис"),
+                     ("Аперитивы", "Спритц"), ("Выпечка", "Пирог")]
+    assert "Аперитивы" not in PRIORITY_DISH_TYPES and "Выпечка" not in PRIORITY_DISH_TYPES
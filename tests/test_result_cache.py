@@ -0,0 +1,34 @@
+def _add_recipes(db, user_id, dish_type_id, count):
+    return [db.add_recipe(user_id, f"Рецепт {number:03d}", "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+            for number in range(count)]
+
+
+def test_scrolling_pages_does_not_evict_filter_results(db, user_id, dish_type_id):
+    recipe_ids = _add_recipes(db, user_id, dish_type_id, db.RESULT_CACHE_SIZE + 8)
+    db.get_recipes_with_filters(user_id)
+
+    # Прокручиваем весь список по одному рецепту: страниц больше, чем мест в кэше фильтров
+    seen, after = [], None
+    while True:
+        recipes, after = db.get_recipes_page(user_id, after=after, limit=1)
+        seen += [recipe.id for recipe in recipes]
+        if after is None:
+            break
+    assert sorted(seen) == sorted(recipe_ids)
+
+    hits = db.result_cache.hits
+    db.get_recipes_with_filters(user_id)
+    assert db.result_cache.hits == hits + 1
+
+    stats = db.get_result_cache_stats()
+    assert stats['filters']['size'] == 1
+    assert stats['pages']['size'] <= db.PAGE_CACHE_SIZE
+
+
+def test_page_cache_is_dropped_on_change(db, user_id, dish_type_id):
+    _add_recipes(db, user_id, dish_type_id, 2)
+    first_page, _ = db.get_recipes_page(user_id)
+    assert db.get_recipes_page(user_id)[0] == first_page
+
+    _add_recipes(db, user_id, dish_type_id, 1)
+    assert len(db.get_recipes_page(user_id)[0]) == len(first_page) + 1
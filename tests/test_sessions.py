@@ -0,0 +1,64 @@
+import threading
+
+from database import Recipe
+
+
+def _add_recipe(db, user_id, dish_type_id, name, ingredients=()):
+    return db.add_recipe(user_id, name, "", "", dish_type_id, None, 10, list(ingredients), (0, 0, 0, 0))
+
+
+def test_nested_call_gets_its_own_session(db):
+    outer = db.Session()
+    try:
+        inner = db.Session()
+        assert inner is not outer
+        inner.close()
+        assert db.Session() is not outer
+    finally:
+        outer.close()
+
+    # Закрытая внешним вызовом сессия потока снова выдается следующему вызову
+    reused = db.Session()
+    try:
+        assert reused._session is outer._session
+    finally:
+        reused.close()
+
+
+def test_nested_call_does_not_close_caller_session(db, user_id, dish_type_id):
+    salt = db.add_ingredient("Соль")
+    recipe_id = _add_recipe(db, user_id, dish_type_id, "Рецепт", [(salt, '1', 'г')])
+    db.invalidate_caches()
+
+    session = db.Session()
+    try:
+        recipe = session.get(Recipe, recipe_id)
+        recipe.name = "Новое название"
+        # Индекс ингредиентов загружается вложенным вызовом со своей сессией
+        assert db.find_recipes_by_ingredients(["соль"]) == [recipe_id]
+        assert recipe in session.dirty
+        session.commit()
+    finally:
+        session.close()
+
+    assert db.get_recipe_by_id(recipe_id).name == "Новое название"
+    assert db.get_session_stats()['totals']['nested'] >= 1
+
+
+def test_threads_do_not_share_sessions(db):
+    sessions = []
+
+    def open_session():
+        session = db.Session()
+        sessions.append(session._session)
+        session.close()
+        db.release_thread_session()
+
+    main = db.Session()
+    try:
+        worker = threading.Thread(target=open_session)
+        worker.start()
+        worker.join()
+        assert sessions[0] is not main._session
+    finally:
+        main.close()
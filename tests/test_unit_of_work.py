@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+
+def _add_recipe(db, user_id, dish_type_id, name):
+    return db.add_recipe(user_id, name, "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+
+
+def _recipe_names(db, user_id):
+    return sorted(recipe.name for recipe in db.get_recipes_page(user_id, limit=100)[0])
+
+
+def test_all_calls_are_committed_together(db, user_id, dish_type_id):
+    with db.transaction('save') as tx:
+        recipe_id = _add_recipe(db, user_id, dish_type_id, "Рецепт")
+        assert db.add_cart_items(user_id, [("Соль", "1", "г")])
+    assert tx.committed
+    assert db.get_recipe_by_id(recipe_id).name == "Рецепт"
+    assert len(db.get_cart_items(user_id)) == 1
+
+
+def test_failed_step_does_not_break_later_steps(db, user_id, dish_type_id):
+    with pytest.raises(IntegrityError):
+        with db.transaction('save') as tx:
+            first = _add_recipe(db, user_id, dish_type_id, "Первый")
+            # Рецепт без названия нарушает NOT NULL при flush; метод откатывает свой вызов
+            assert _add_recipe(db, user_id, dish_type_id, None) is None
+
+            # Общая сессия продолжает работать: изменения первого шага на месте
+            assert db.get_recipe_by_id(first).name == "Первый"
+            assert [item['name'] for item in db.add_cart_items(user_id, [("Соль", "1", "г")])] == ["Соль"]
+
+    assert not tx.committed
+    assert db.get_recipe_by_id(first) is None
+    assert db.get_cart_items(user_id) == []
+    assert _recipe_names(db, user_id) == []
+
+
+def test_refused_step_rolls_back_without_error(db, user_id, dish_type_id):
+    with db.transaction('save') as tx:
+        _add_recipe(db, user_id, dish_type_id, "Рецепт")
+        # Несуществующий рецепт: отказ без исключения
+        assert not db.update_recipe(100500, "Нет", "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+        assert db.add_cart_items(user_id, [("Соль", "1", "г")])
+
+    assert not tx.committed
+    assert _recipe_names(db, user_id) == []
+    assert db.get_cart_items(user_id) == []
@@ -0,0 +1,68 @@
+import pytest
+
+from database import UNITS, parse_amount
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('200 г', (200.0, 'г')),
+    ('1,5 кг', (1.5, 'кг')),
+    ('2 столовые ложки', (2.0, 'ст.л.')),
+    ('1 ст. л.', (1.0, 'ст.л.')),
+    ('1 стакан', (1.0, 'стакан')),
+    ('½ стакана', (0.5, 'стакан')),
+    ('1/2 ч.л.', (0.5, 'ч.л.')),
+    # Смешанная дробь - целое плюс дробь
+    ('1 1/2 стакана', (1.5, 'стакан')),
+    ('1½ ч.л.', (1.5, 'ч.л.')),
+    ('2 3/4', (2.75, None)),
+    # Диапазон - верхняя граница
+    ('2-3 зубчика', (3.0, 'зубчик')),
+    ('2 - 3 шт', (3.0, 'шт')),
+    ('1,5–2 кг', (2.0, 'кг')),
+    # Неизвестная единица после числа сохраняется как написана
+    ('1 банка', (1.0, 'банка')),
+    # Единица без числа
+    ('щепотка', (None, 'щепотка')),
+    ('по вкусу', (None, 'по вкусу')),
+    # Ошибочное число или запись без числа и единицы остаются текстом
+    ('1/0 г', (None, None)),
+    ('немного', (None, None)),
+    ('', (None, None)),
+])
+def test_parse(text, expected):
+    assert UNITS.parse(text) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1,5', 1.5),
+    (2, 2.0),
+    ('1 1/2', 1.5),
+    ('2-3', 3.0),
+    ('1/0', None),
+    ('2 г', None),
+    ('по вкусу', None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+def test_stored_quantities_are_reparsed(db, user_id, dish_type_id):
+    recipe_id = db.add_recipe(user_id, "Рецепт", "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+    salt = db.add_ingredient("Соль")
+    flour = db.add_ingredient("Мука")
+    garlic = db.add_ingredient("Чеснок")
+    # Так прежний разбор сохранял смешанную дробь, диапазон и ошибочную запись
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            'INSERT INTO "Recipe_ingredients" (recipe_id, ingredient_id, quantity, amount, unit) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(recipe_id, flour, '1 1/2 стакана', 1.0, '1/2 стакана'),
+             (recipe_id, garlic, '2-3 зубчика', 2.0, '-3 зубчика'),
+             (recipe_id, salt, '1/0 г', 1.0, '1/0 г')]
+        )
+        connection.exec_driver_sql("DELETE FROM schema_version WHERE version = 12")
+
+    assert db.apply_pending_migrations() == [(12, 'reparse_ranges_and_fractions')]
+    assert db.get_recipe_ingredients(recipe_id) == [
+        ("Мука", 1.5, 'стакан'), ("Чеснок", 3.0, 'зубчик'), ("Соль", '1/0 г', '')
+    ]
@@ -0,0 +1,85 @@
+import sqlite3
+
+from conftest import open_database
+from database import USER_STATS_SOURCES
+
+
+def _counters(db, user_id):
+    profile = db.get_user_profile(user_id)
+    return {counter: profile[counter] for counter, _ in USER_STATS_SOURCES}
+
+
+def _actual_counts(db_path):
+    """Счетчики, посчитанные COUNT по исходным таблицам для каждого пользователя"""
+    with sqlite3.connect(db_path) as connection:
+        user_ids = [row[0] for row in connection.execute('SELECT id FROM "Users"')]
+        return {
+            user_id: {
+                counter: connection.execute(
+                    f'SELECT COUNT(*) FROM "{table_name}" WHERE user_id = ?', (user_id,)
+                ).fetchone()[0]
+                for counter, table_name in USER_STATS_SOURCES
+            }
+            for user_id in user_ids
+        }
+
+
+def _register(db, login):
+    db.register_user(login, 'secret')
+    return db.get_users(login, 'secret')[0][0]
+
+
+def _add_recipe(db, user_id, dish_type_id, name):
+    return db.add_recipe(user_id, name, "", "", dish_type_id, None, 10, [], (0, 0, 0, 0))
+
+
+def test_triggers_follow_inserts_and_deletes(db, user_id, dish_type_id):
+    assert _counters(db, user_id) == dict.fromkeys(_counters(db, user_id), 0)
+
+    first = _add_recipe(db, user_id, dish_type_id, "Первый")
+    second = _add_recipe(db, user_id, dish_type_id, "Второй")
+    db.toggle_favorite(user_id, first)
+    db.toggle_favorite(user_id, second)
+    db.mark_recipe_as_cooked(user_id, first, True)
+    db.add_cart_items(user_id, [("Соль", "1", "г"), ("Сахар", "2", "г")])
+    assert _counters(db, user_id) == {'recipes_count': 2, 'favorites_count': 2,
+                                      'cart_count': 2, 'cooked_count': 1}
+
+    db.toggle_favorite(user_id, second)
+    db.mark_recipe_as_cooked(user_id, first, False)
+    db.clear_cart(user_id)
+    assert db.delete_recipe(first)
+    assert _counters(db, user_id) == {'recipes_count': 1, 'favorites_count': 0,
+                                      'cart_count': 0, 'cooked_count': 0}
+    assert _actual_counts(db.engine.url.database)[user_id] == _counters(db, user_id)
+
+
+def test_counters_are_kept_per_user(db, user_id, dish_type_id):
+    other_id = _register(db, 'other')
+    recipe_id = _add_recipe(db, user_id, dish_type_id, "Рецепт")
+    db.toggle_favorite(other_id, recipe_id)
+
+    assert _counters(db, user_id)['recipes_count'] == 1
+    assert _counters(db, user_id)['favorites_count'] == 0
+    assert _counters(db, other_id)['favorites_count'] == 1
+
+
+def test_author_change_moves_recipe_count(db, user_id, dish_type_id):
+    other_id = _register(db, 'other')
+    recipe_id = _add_recipe(db, user_id, dish_type_id, "Рецепт")
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('UPDATE "Recipes" SET user_id = ? WHERE id = ?', (other_id, recipe_id))
+    assert _counters(db, user_id)['recipes_count'] == 0
+    assert _counters(db, other_id)['recipes_count'] == 1
+
+
+def test_migration_fills_counters_from_existing_rows(shipped_db_path, legacy_root):
+    db = open_database(shipped_db_path, legacy_root)
+    try:
+        actual = _actual_counts(shipped_db_path)
+        assert any(any(counts.values()) for counts in actual.values())
+        for user_id, counts in actual.items():
+            assert _counters(db, user_id) == counts
+    finally:
+        db.close()